@@ -0,0 +1,121 @@
+"""
+Approximate inverse of a regular target grid. The exact inverse is only evaluated on a coarse lattice and
+interpolated bilinearly in between. Cells whose interpolation error, measured in source tile pixels at the center
+and the edge midpoints of the cell, is above half the threshold are split until they are exact. Cells crossing x=0
+are always split, the projection is not continuous there.
+"""
+from typing import Tuple
+
+import numpy as np
+
+from source.raster_data.tile_math import latlngZoomToXYZoomNP
+from source.zoomable_projection import ZoomableProjection
+
+
+def _lattice(n: int, step: int) -> np.ndarray:
+    return np.unique(np.append(np.arange(0, n, step), n - 1))
+
+
+def _pixelError(exact: np.ndarray, approximated: np.ndarray, zoom: np.ndarray) -> np.ndarray:
+    exact_pixels = latlngZoomToXYZoomNP(np.concatenate([exact, zoom[np.newaxis, :]], axis=0))[0:2] * 256
+    approximated_pixels = latlngZoomToXYZoomNP(np.concatenate([approximated, zoom[np.newaxis, :]], axis=0))[0:2] * 256
+    return np.max(np.abs(exact_pixels - approximated_pixels), axis=0)
+
+
+# index of the lattice cell and the weight of its far corner for every pixel
+def _cellWeights(lattice: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    pixels = np.arange(n)
+    cell = np.clip(np.searchsorted(lattice, pixels, side='right') - 1, 0, lattice.shape[0] - 2)
+    weight = (pixels - lattice[cell]) / (lattice[cell + 1] - lattice[cell])
+    return cell, weight
+
+
+def _bilinear(corners: np.ndarray, row_weight: np.ndarray, column_weight: np.ndarray) -> np.ndarray:
+    # corners are (4, 2, n) in the order top left, top right, bottom left, bottom right
+    top = corners[0] * (1 - column_weight) + corners[1] * column_weight
+    bottom = corners[2] * (1 - column_weight) + corners[3] * column_weight
+    return top * (1 - row_weight) + bottom * row_weight
+
+
+# (2, rows * columns) inverted positions in row major order and the number of exactly inverted positions
+def approximateInvertGrid(projection: ZoomableProjection, x_series: np.ndarray, y_series: np.ndarray,
+                          zoom: np.ndarray, max_error: float, step: int = 16) -> Tuple[np.ndarray, int]:
+    rows, columns = y_series.shape[0], x_series.shape[0]
+    if rows < 3 or columns < 3 or step < 2:
+        return projection.invert_grid(x_series, y_series), rows * columns
+    zoom = zoom.reshape(rows, columns)
+
+    out = np.zeros((2, rows, columns))
+    exact = np.zeros((rows, columns), dtype=bool)
+    done = np.zeros((rows, columns), dtype=bool)
+    evaluations = 0
+
+    def evaluate(pixel_rows: np.ndarray, pixel_columns: np.ndarray):
+        nonlocal evaluations
+        flat = np.unique(pixel_rows * columns + pixel_columns)
+        flat = flat[np.invert(exact.reshape(-1)[flat])]
+        if flat.shape[0] == 0:
+            return
+        new_rows, new_columns = np.divmod(flat, columns)
+        out[:, new_rows, new_columns] = projection.invert(np.stack([x_series[new_columns], y_series[new_rows]],
+                                                                   axis=0))
+        exact[new_rows, new_columns] = True
+        evaluations += flat.shape[0]
+
+    open_cells = None
+    while step >= 2:
+        row_lattice = _lattice(rows, step)
+        column_lattice = _lattice(columns, step)
+        if open_cells is None:
+            open_cells = np.ones((row_lattice.shape[0] - 1, column_lattice.shape[0] - 1), dtype=bool)
+        cell_rows, cell_columns = np.nonzero(open_cells)
+        first_row, last_row = row_lattice[cell_rows], row_lattice[cell_rows + 1]
+        first_column, last_column = column_lattice[cell_columns], column_lattice[cell_columns + 1]
+        center_row, center_column = (first_row + last_row) // 2, (first_column + last_column) // 2
+
+        corner_rows = np.stack([first_row, first_row, last_row, last_row])
+        corner_columns = np.stack([first_column, last_column, first_column, last_column])
+        evaluate(corner_rows.reshape(-1), corner_columns.reshape(-1))
+        corners = out[:, corner_rows, corner_columns].transpose(1, 0, 2)
+
+        # the center and the midpoints of the edges are compared with the exact inverse
+        probe_rows = np.stack([center_row, first_row, last_row, center_row, center_row])
+        probe_columns = np.stack([center_column, center_column, center_column, first_column, last_column])
+        evaluate(probe_rows.reshape(-1), probe_columns.reshape(-1))
+        error = np.zeros(cell_rows.shape[0])
+        for probe_row, probe_column in zip(probe_rows, probe_columns):
+            approximated = _bilinear(corners, (probe_row - first_row) / (last_row - first_row),
+                                     (probe_column - first_column) / (last_column - first_column))
+            error = np.maximum(error, _pixelError(out[:, probe_row, probe_column], approximated,
+                                                  zoom[probe_row, probe_column]))
+        continuous = np.sign(x_series[first_column]) * np.sign(x_series[last_column]) > 0
+        accepted = continuous & (error <= max_error / 2)
+
+        # interpolate the pixels of the accepted cells, the lattice is separable so the whole level is
+        # interpolated along the columns and then along the rows
+        row_cell, row_weight = _cellWeights(row_lattice, rows)
+        column_cell, column_weight = _cellWeights(column_lattice, columns)
+        accepted_cells = np.zeros_like(open_cells)
+        accepted_cells[cell_rows[accepted], cell_columns[accepted]] = True
+        fill = accepted_cells[row_cell[:, np.newaxis], column_cell[np.newaxis, :]]
+        np.logical_and(fill, np.invert(exact), out=fill)
+        if fill.any():
+            lattice_values = out[:, row_lattice][:, :, column_lattice]
+            along_columns = lattice_values[:, :, column_cell] * (1 - column_weight) + \
+                lattice_values[:, :, column_cell + 1] * column_weight
+            row_weight = row_weight[:, np.newaxis]
+            interpolated = along_columns[:, row_cell] * (1 - row_weight) + along_columns[:, row_cell + 1] * row_weight
+            np.copyto(out, interpolated, where=fill)
+            done |= fill
+
+        # rejected cells are split into the cells of the next lattice
+        step //= 2
+        rejected_cells = open_cells & np.invert(accepted_cells)
+        next_row_lattice, next_column_lattice = _lattice(rows, step), _lattice(columns, step)
+        next_row_parent = np.searchsorted(row_lattice, next_row_lattice[:-1], side='right') - 1
+        next_column_parent = np.searchsorted(column_lattice, next_column_lattice[:-1], side='right') - 1
+        open_cells = rejected_cells[next_row_parent[:, np.newaxis], next_column_parent[np.newaxis, :]]
+
+    remaining_rows, remaining_columns = np.nonzero(np.invert(done | exact))
+    evaluate(remaining_rows, remaining_columns)
+    return out.reshape(2, -1), evaluations
@@ -0,0 +1,66 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+
+class ArrayLRUCache:
+    # least recently used cache of tuples of numpy arrays, limited by the number of bytes held
+    # the arrays are stored read only, so they can be handed out without copying
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.storage: Dict[Hashable, Tuple[np.ndarray, ...]] = OrderedDict()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Optional[Tuple[np.ndarray, ...]]:
+        with self._lock:
+            value = self.storage.get(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+            self.storage.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Tuple[np.ndarray, ...]) -> Tuple[np.ndarray, ...]:
+        size = sum(array.nbytes for array in value)
+        # too large to be cached, the arrays stay writable
+        if size > self.max_bytes:
+            return value
+        for array in value:
+            array.setflags(write=False)
+
+        with self._lock:
+            previous = self.storage.pop(key, None)
+            if previous is not None:
+                self.resident_bytes -= sum(array.nbytes for array in previous)
+            self.storage[key] = value
+            self.resident_bytes += size
+            while self.resident_bytes > self.max_bytes:
+                _, evicted = self.storage.popitem(last=False)
+                self.resident_bytes -= sum(array.nbytes for array in evicted)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self.storage.clear()
+            self.resident_bytes = 0
+
+    def __len__(self):
+        return len(self.storage)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "resident_bytes": self.resident_bytes,
+            "entries": len(self.storage)
+        }
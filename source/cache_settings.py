@@ -28,6 +28,13 @@ def make_url_cache_key(*args,**kwaags):
     return k.encode('utf-8')
 
 
+# the same key for a tile no matter which request renders it, metatiles cache their siblings under it
+def make_tile_cache_key(lat1, lng1, lat2, lng2, cutoff, smoothing, source, zoom, x, y, fileformat) -> bytes:
+    k = "tile/{}/{}/{}/{}/{}/{}/{}/{}/{}/{}.{}".format(lat1, lng1, lat2, lng2, cutoff, smoothing, source, zoom, x, y,
+                                                      fileformat)
+    return k.encode('utf-8')
+
+
 def make_cache_key(*args, **kwargs):
     path = request.path
     args = str(hash(frozenset(request.args.items())))
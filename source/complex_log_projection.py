@@ -1,4 +1,4 @@
-from typing import Union, Tuple
+from typing import Union, Tuple, Hashable, Optional
 
 import numpy as np
 import math
@@ -12,6 +12,8 @@ from source.mathutils import \
     euclideanDist, \
     complexLog, \
     complexExp
+from source.array_cache import ArrayLRUCache
+from source.compute_backends import ComputeBackend
 from source.lat_lng import LatLng
 from source.preprojections import LambertAzimuthalEqualArea, AbstractPreprojection
 from source.smoothing_functions import AbstractSmoothingFunction, NoSmoothingFunction
@@ -23,9 +25,25 @@ class ComplexLogProjection(ZoomableProjection):
                  center1: LatLng,
                  center2: LatLng,
                  smoothing_angle_radians: float,
-                 preprojection: AbstractPreprojection = LambertAzimuthalEqualArea(),
-                 smoothing_function_type: AbstractSmoothingFunction.__class__ = NoSmoothingFunction):
+                 preprojection: Optional[AbstractPreprojection] = None,
+                 smoothing_function_type: AbstractSmoothingFunction.__class__ = NoSmoothingFunction,
+                 dtype: np.dtype = np.float64,
+                 unit_grid_cache: Optional[ArrayLRUCache] = None,
+                 smoothing_table_size: Optional[int] = None,
+                 backend: Optional[ComputeBackend] = None):
+        # dtype of the inverse projection up to the preprojection, the forward projection always uses float64
+        self.dtype = np.dtype(dtype)
+        # shared between projections with different centers, see unit_grid
+        self.unit_grid_cache = unit_grid_cache
+        # computes the per pixel part of invert_grid, see compute_backends
+        self.backend = backend
+        self.max_relative_pixel_error = 1 / 32
+        # set_center changes the preprojection, every projection needs its own
+        if preprojection is None:
+            preprojection = LambertAzimuthalEqualArea()
         self.preprojection: AbstractPreprojection = preprojection  # is not centered around the center point
+        self.center1_latlng: LatLng = center1
+        self.center2_latlng: LatLng = center2
         mp = LatLng.midpoint([center1,center2])
         self.preprojection.set_center(mp)
         self.center1: np.ndarray = preprojection(np.array([[center1.lat], [center1.lng]]))
@@ -38,7 +56,34 @@ class ComplexLogProjection(ZoomableProjection):
         self.theta1: float = math.pi - vectorAngles(self.center1 - self.midpoint)[0]
         self.theta2: float = math.pi - vectorAngles(self.center2 - self.midpoint)[0]
 
-        self.smoothing_function: AbstractSmoothingFunction = smoothing_function_type(smoothing_angle_radians)
+        # interpolates the smoothing from a table, see AbstractSmoothingFunction
+        self.smoothing_function: AbstractSmoothingFunction = smoothing_function_type(smoothing_angle_radians,
+                                                                                      table_size=smoothing_table_size)
+
+    # the cache belongs to the process, render workers build their own unit grids
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["unit_grid_cache"] = None
+        return state
+
+    # identifies the geometry, two projections with the same key invert every point the same way
+    def cache_key(self) -> Hashable:
+        return (type(self).__name__,
+                self.center1_latlng.lat, self.center1_latlng.lng,
+                self.center2_latlng.lat, self.center2_latlng.lng,
+                self.smoothing_angle,
+                type(self.smoothing_function).__name__,
+                self.smoothing_function.table_size,
+                type(self.preprojection).__name__,
+                self.dtype.name)
+
+    # identifies the center independent part of the inverse
+    def unit_key(self) -> Hashable:
+        return (type(self).__name__,
+                self.smoothing_angle,
+                type(self.smoothing_function).__name__,
+                self.smoothing_function.table_size,
+                self.dtype.name)
 
     def __call__(self, latlng: np.ndarray,calculate_clipping=False) -> Union[np.ndarray,Tuple[np.ndarray,np.ndarray]] :
         assertMultipleVec2d(latlng)
@@ -70,6 +115,7 @@ class ComplexLogProjection(ZoomableProjection):
 
     def invert(self, xy: np.ndarray):
         assertMultipleVec2d(xy)
+        xy = xy.astype(self.dtype, copy=False)
         selection_c1 = xy[0, :] < 0
         selection_c2 = xy[0, :] >= 0
 
@@ -83,13 +129,111 @@ class ComplexLogProjection(ZoomableProjection):
         unprojected[:, selection_c2] = exp_c2
         return self.preprojection.invert(unprojected)
 
+    # inverse of the grid up to the centers as (2, rows, columns), it only depends on the cutoff, the smoothing and
+    # the grid, so moving the centers reuses it from unit_grid_cache.
+    # exp(x + iy) = e^x * (cos y + i sin y) separates into a factor per column and a vector per row, the smoothing
+    # only depends on the angle, so it is applied to the row vectors
+    def unit_grid(self, x_series: np.ndarray, y_series: np.ndarray) -> np.ndarray:
+        x_series = x_series.astype(np.float64)
+        y_series = y_series.astype(np.float64)
+        dtype = self._grid_dtype(x_series, y_series)
+        key = None
+        if self.unit_grid_cache is not None:
+            key = (self.unit_key(), dtype.name, x_series.tobytes(), y_series.tobytes())
+            cached = self.unit_grid_cache.get(key)
+            if cached is not None:
+                return cached[0]
+
+        selection_c1 = x_series < 0
+        unit = None
+        for selection, direction in [(selection_c1, 1), (np.invert(selection_c1), -1)]:
+            if not selection.any():
+                continue
+            complete = selection.all()
+            columns = x_series if complete else x_series[selection]
+            angles = y_series / direction
+
+            column_factor = np.exp(columns / direction).astype(dtype)
+            row_vectors = np.stack([np.cos(angles), np.sin(angles)], axis=0) * \
+                np.exp(-self.smoothing_function.log_scale(angles))
+            side = row_vectors.astype(dtype)[:, :, np.newaxis] * column_factor[np.newaxis, np.newaxis, :]
+            if complete:
+                # the tile lies on one side of x=0, no masking needed
+                unit = side
+            else:
+                if unit is None:
+                    unit = np.empty((2, y_series.shape[0], x_series.shape[0]), dtype=dtype)
+                unit[:, :, selection] = side
+        if key is not None:
+            return self.unit_grid_cache.put(key, (unit,))[0]
+        return unit
+
+    def invert_grid(self, x_series: np.ndarray, y_series: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        unit = self.unit_grid(x_series, y_series)
+        selection_c1 = x_series < 0
+        sides = [(selection_c1, self.center1, self.theta1),
+                 (np.invert(selection_c1), self.center2, self.theta2)]
+
+        if self.backend is not None:
+            for selection, center, theta in sides:
+                if selection.all():
+                    # one side, the backend fuses the affine step with the preprojection
+                    return self.backend.affine_invert(unit.reshape(2, -1), self._affine_matrix(theta), center,
+                                                      self.preprojection, out=out)
+
+        unprojected = np.empty(unit.shape, dtype=unit.dtype)
+        for selection, center, theta in sides:
+            if not selection.any():
+                continue
+            if selection.all():
+                self._affine_grid(unit, center, theta, out=unprojected)
+            else:
+                unprojected[:, :, selection] = self._affine_grid(unit[:, :, selection], center, theta)
+        if self.backend is not None:
+            return self.backend.affine_invert(unprojected.reshape(2, -1), np.eye(2), np.zeros((2, 1)),
+                                              self.preprojection, out=out)
+        # the preprojection adds its offset in float64
+        return self.preprojection.invert(unprojected.reshape(2, -1), out=out)
+
+    def _affine_matrix(self, theta: float) -> np.ndarray:
+        return createRotationMatrix(-1 * theta) / self.scale
+
+    # scale, rotation and translation of a (2, rows, columns) unit grid, the only steps that depend on the centers
+    def _affine_grid(self, unit: np.ndarray, center: np.ndarray, theta: float,
+                     out: Optional[np.ndarray] = None) -> np.ndarray:
+        matrix = self._affine_matrix(theta).astype(unit.dtype)
+        center = center.astype(unit.dtype)
+        if out is None:
+            out = np.empty_like(unit)
+        for i in range(2):
+            np.multiply(unit[0], matrix[i, 0], out=out[i])
+            out[i] += unit[1] * matrix[i, 1]
+            out[i] += center[i, 0]
+        return out
+
+    # float32 positions are relative to the midpoint, close to the centers the pixels get smaller than the float32
+    # resolution of these positions. such grids are inverted in float64
+    def _grid_dtype(self, x_series: np.ndarray, y_series: np.ndarray) -> np.dtype:
+        if self.dtype == np.float64 or x_series.shape[0] < 2:
+            return self.dtype
+        distance = np.abs(x_series)
+        step = min(np.abs(np.diff(x_series)).min(), np.abs(np.diff(y_series)).min()) if y_series.shape[0] > 1 \
+            else np.abs(np.diff(x_series)).min()
+        max_radius_factor = np.exp(-self.smoothing_function.log_scale(y_series)).max()
+        # in units of the center distance
+        magnitude = 1 + np.exp(-distance.min()) * max_radius_factor
+        pixel_size = np.exp(-distance.max()) * step
+        if np.finfo(self.dtype).eps * magnitude < pixel_size * self.max_relative_pixel_error:
+            return self.dtype
+        return np.dtype(np.float64)
+
     def _single_forward(self, points: np.ndarray, center: np.ndarray, theta: float, direction: int) -> np.ndarray:
         points -= center
         rotMat = createRotationMatrix(theta)
         points = np.matmul(rotMat, points)
 
         points *= self.scale
-        points = complexLog(points)
+        points = complexLog(points, out=points)
         points = self.smoothing_function(points)
 
         points *= direction
@@ -97,18 +241,33 @@ class ComplexLogProjection(ZoomableProjection):
         return points
 
     def _single_backward(self, points: np.ndarray, center: np.ndarray, theta: float, direction: int) -> np.ndarray:
+        return self._affine_backward(self._unit_backward(points, direction), center, theta)
+
+    # smoothing inverse and exp, independent of the centers
+    def _unit_backward(self, points: np.ndarray, direction: int) -> np.ndarray:
         points /= direction
         points = self.smoothing_function.invert(points)
-        points = complexExp(points)
+        return complexExp(points, out=points)
+
+    def _affine_backward(self, points: np.ndarray, center: np.ndarray, theta: float) -> np.ndarray:
         points /= self.scale
 
-        rot_mat = createRotationMatrix(-1 * theta)
+        rot_mat = createRotationMatrix(-1 * theta).astype(points.dtype)
         points = np.matmul(rot_mat, points)
 
         points += center
 
         return points
 
+    # the zoom level only depends on x, so it is computed once per column
+    def getZoomLevelGrid(self, x_series: np.ndarray, y_series: np.ndarray, pixel_per_unit: float,
+                         out: Optional[np.ndarray] = None) -> np.ndarray:
+        zoom = self.getZoomLevel(np.stack([x_series, np.zeros_like(x_series)], axis=0), pixel_per_unit)
+        if out is None:
+            return np.tile(zoom, y_series.shape[0])
+        out.reshape(y_series.shape[0], x_series.shape[0])[...] = zoom[np.newaxis, :]
+        return out
+
     def getZoomLevel(self, pixel_data: np.ndarray, pixel_per_unit: float) -> np.ndarray:
         assertMultipleVec2d(pixel_data)
         pixel_data = pixel_data.copy()
@@ -0,0 +1,143 @@
+"""
+Backends for the per pixel part of the inverse projection: the scale, rotation and translation of the unit grid and
+the inverse of the azimuthal preprojection. numexpr evaluates the chain in blocks on several threads, numba compiles
+it into one loop. Both are optional (see requirements.txt), NumPy is the fallback.
+The smoothing, exp and zoom level are computed per row or column of a grid and stay in NumPy.
+"""
+import abc
+import math
+import os
+from logging import warning
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from source.preprojections import AbstractPreprojection, LambertAzimuthalEqualArea, LambertAzimuthalEqualDistance
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+class ComputeBackend(abc.ABC):
+    name = None
+
+    # preprojection.invert(matrix @ points + center), points are (2, n) and out (2, n) float64
+    @abc.abstractmethod
+    def affine_invert(self, points: np.ndarray, matrix: np.ndarray, center: np.ndarray,
+                      preprojection: AbstractPreprojection, out: Optional[np.ndarray] = None) -> np.ndarray:
+        pass
+
+
+# azimuthal preprojections with a fused kernel and whether their angle is 2 * arcsin(z / 2)
+def _azimuthalEqualArea(preprojection: AbstractPreprojection) -> Optional[bool]:
+    if type(preprojection) is LambertAzimuthalEqualArea:
+        return True
+    if type(preprojection) is LambertAzimuthalEqualDistance:
+        return False
+    return None
+
+
+class NumpyBackend(ComputeBackend):
+    name = "numpy"
+
+    def affine_invert(self, points: np.ndarray, matrix: np.ndarray, center: np.ndarray,
+                      preprojection: AbstractPreprojection, out: Optional[np.ndarray] = None) -> np.ndarray:
+        matrix = matrix.astype(points.dtype)
+        unprojected = np.matmul(matrix, points)
+        unprojected += center.reshape(2, 1).astype(points.dtype)
+        return preprojection.invert(unprojected, out=out)
+
+
+class NumexprBackend(NumpyBackend):
+    name = "numexpr"
+
+    def affine_invert(self, points: np.ndarray, matrix: np.ndarray, center: np.ndarray,
+                      preprojection: AbstractPreprojection, out: Optional[np.ndarray] = None) -> np.ndarray:
+        equal_area = _azimuthalEqualArea(preprojection)
+        if equal_area is None:
+            return super(NumexprBackend, self).affine_invert(points, matrix, center, preprojection, out)
+        if out is None:
+            out = np.empty(points.shape, dtype=np.float64)
+        variables = {
+            "u0": points[0], "u1": points[1],
+            "m00": matrix[0, 0], "m01": matrix[0, 1], "m10": matrix[1, 0], "m11": matrix[1, 1],
+            "c0": center[0, 0], "c1": center[1, 0],
+            "o0": preprojection.offset_x_radians, "o1": preprojection.offset_y_radians,
+            "degrees": 180 / math.pi
+        }
+        variables["x"] = numexpr.evaluate("m00 * u0 + m01 * u1 + c0", variables)
+        variables["y"] = numexpr.evaluate("m10 * u0 + m11 * u1 + c1", variables)
+        variables["z"] = numexpr.evaluate("sqrt(x * x + y * y)", variables)
+        variables["c"] = numexpr.evaluate("2 * arcsin(z / 2)" if equal_area else "z", variables)
+        numexpr.evaluate("(arctan2(x * sin(c), z * cos(c)) - o0) * degrees", variables, out=out[0])
+        numexpr.evaluate("(where(z != 0, arcsin(y * sin(c) / where(z != 0, z, 1)), 0) - o1) * degrees", variables,
+                         out=out[1])
+        return out
+
+
+if numba is not None:
+    # compiled once per process on the first call, an on disk cache would be written next to the sources
+    @numba.njit(parallel=True)
+    def _affineInvertKernel(points, matrix, center, offset, equal_area, out):
+        degrees = 180 / math.pi
+        for i in numba.prange(points.shape[1]):
+            x = matrix[0, 0] * points[0, i] + matrix[0, 1] * points[1, i] + center[0, 0]
+            y = matrix[1, 0] * points[0, i] + matrix[1, 1] * points[1, i] + center[1, 0]
+            z = math.sqrt(x * x + y * y)
+            c = 2 * math.asin(z / 2) if equal_area else z
+            sc = math.sin(c)
+            out[0, i] = (math.atan2(x * sc, z * math.cos(c)) - offset[0]) * degrees
+            out[1, i] = ((math.asin(y * sc / z) if z != 0 else 0.0) - offset[1]) * degrees
+
+
+class NumbaBackend(NumpyBackend):
+    name = "numba"
+
+    def affine_invert(self, points: np.ndarray, matrix: np.ndarray, center: np.ndarray,
+                      preprojection: AbstractPreprojection, out: Optional[np.ndarray] = None) -> np.ndarray:
+        equal_area = _azimuthalEqualArea(preprojection)
+        if equal_area is None:
+            return super(NumbaBackend, self).affine_invert(points, matrix, center, preprojection, out)
+        if out is None:
+            out = np.empty(points.shape, dtype=np.float64)
+        offset = np.array([preprojection.offset_x_radians, preprojection.offset_y_radians], dtype=np.float64)
+        _affineInvertKernel(points, matrix.astype(np.float64), center.reshape(2, 1).astype(np.float64), offset,
+                            equal_area, out)
+        return out
+
+
+_backend_types = {backend.name: backend for backend in [NumpyBackend, NumexprBackend, NumbaBackend]}
+_backends: Dict[str, ComputeBackend] = {}
+
+
+def availableBackends() -> List[str]:
+    available = ["numpy"]
+    if numexpr is not None:
+        available.append("numexpr")
+    if numba is not None:
+        available.append("numba")
+    return available
+
+
+# the backend with this name, unknown or unavailable backends raise a ValueError.
+# without a name the backend is taken from PROJECTION_BACKEND and falls back to numpy if it is not installed
+def getBackend(name: Optional[str] = None) -> ComputeBackend:
+    if name is None:
+        name = os.environ.get("PROJECTION_BACKEND", "numpy")
+        if name in _backend_types and name not in availableBackends():
+            warning("Projection backend " + name + " is not installed, using numpy")
+            name = "numpy"
+    if name not in _backend_types:
+        raise ValueError("Unknown projection backend " + name)
+    if name not in availableBackends():
+        raise ValueError("Projection backend " + name + " is not installed")
+    if name not in _backends:
+        _backends[name] = _backend_types[name]()
+    return _backends[name]
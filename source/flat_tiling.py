@@ -4,8 +4,10 @@ Also has some tricks for leaflet coordinate calculations
 """
 from typing import Tuple
 
+import numpy as np
+
 from source.lat_lng import LatLng
-from source.raster_data.tile_math import latlngToXY, XYToLatLng
+from source.raster_data.tile_math import latlngToXY, XYToLatLng, latlngToXYNP, XYToLatLngNP
 
 
 class FlatTiling():
@@ -46,3 +48,17 @@ class FlatTiling():
         assert 0 <= x <= 1
         assert 0 <= y <= 1
         return XYToLatLng(x,y)
+
+    # array version of from_leaflet_LatLng, (2, n) lat and lng to (2, n) x and y
+    def from_leaflet_NP(self, latlng: np.ndarray) -> np.ndarray:
+        xy = latlngToXYNP(latlng[0, :], latlng[1, :], 0)
+        assert np.all((0 <= xy) & (xy <= 1))
+        xy *= 2 * self.top_level_range
+        xy -= self.top_level_range
+        return xy
+
+    # array version of to_leaflet_LatLng, (2, n) x and y to (2, n) lat and lng
+    def to_leaflet_NP(self, xy: np.ndarray) -> np.ndarray:
+        xy = (xy + self.top_level_range) / (2 * self.top_level_range)
+        assert np.all((0 <= xy) & (xy <= 1))
+        return XYToLatLngNP(xy[0, :], xy[1, :])
@@ -1,35 +1,47 @@
-from typing import Dict
+import os
+from typing import Dict, Optional
 
 from source.raster_data.abstract_raster_data_provider import AbstractRasterDataProvider
+from source.raster_data.embedded_raster_data_provider import EmbeddedRasterDataProvider
 from source.raster_data.remote_raster_data_provider import RemoteRasterDataProvider
 from source.raster_data.tile_resolver import TileURLResolver
 
 
-def get_providers() -> Dict[str, AbstractRasterDataProvider]:
+# mode "remote" samples through the resolver service, "embedded" samples in process and falls back to remote
+def get_providers(mode: Optional[str] = None) -> Dict[str, AbstractRasterDataProvider]:
+    if mode is None:
+        mode = os.environ.get("TILERESOLVER_MODE", "remote")
+    if mode == "remote":
+        provider_type = RemoteRasterDataProvider
+    elif mode == "embedded":
+        provider_type = EmbeddedRasterDataProvider
+    else:
+        raise ValueError("Invalid provider mode " + mode)
+
     _providers: Dict[str, AbstractRasterDataProvider] = {}
 
 
-    _providers['default'] =  RemoteRasterDataProvider(TileURLResolver(
+    _providers['default'] =  provider_type(TileURLResolver(
         url_format="https://a.tile.openstreetmap.de/{2}/{0}/{1}.png"))
     _providers['osm'] = _providers['default']
 
 
-    _providers['satellite'] =  RemoteRasterDataProvider(TileURLResolver(
+    _providers['satellite'] =  provider_type(TileURLResolver(
         url_format="https://atlas34.inf.uni-konstanz.de/mbtiles/data/openmaptiles_satellite_lowres/{2}/{0}/{1}.jpg"))
 
-    _providers['transparent'] = RemoteRasterDataProvider(TileURLResolver(
+    _providers['transparent'] = provider_type(TileURLResolver(
         url_format="https://atlas34.inf.uni-konstanz.de/osmtiles/tile/{2}/{0}/{1}.png"))
 
-    _providers['ch'] = RemoteRasterDataProvider(TileURLResolver(
+    _providers['ch'] = provider_type(TileURLResolver(
         url_format="https://atlas34.inf.uni-konstanz.de/ch/tile/{2}/{0}/{1}.png"))
 
     for i in [1,2,3,4,5,6,7]:
 
-        _providers['route' + str(i)] = RemoteRasterDataProvider(TileURLResolver(
+        _providers['route' + str(i)] = provider_type(TileURLResolver(
             url_format="https://atlas34.inf.uni-konstanz.de/route" +str(i) + "/tile/{2}/{0}/{1}.png"))
 
 
-    _providers['mapbox'] = RemoteRasterDataProvider(TileURLResolver(
+    _providers['mapbox'] = provider_type(TileURLResolver(
         url_format="https://atlas34.inf.uni-konstanz.de/mapbox/{2}/{0}/{1}.jpg90"))
 
     return _providers
@@ -0,0 +1,75 @@
+"""
+Encoding of projected images with per format settings, taken from the environment.
+Images are handed to Pillow without a copy, layers with few colors can be quantized to a palette and opaque layers
+can be sent as JPEG. Requests for the "auto" format are negotiated from the Accept header.
+"""
+import os
+from io import BytesIO
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+FORMAT_MIMETYPES = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}
+_PIL_FORMATS = {"png": "PNG", "webp": "WEBP", "jpeg": "JPEG"}
+_MODES = {1: "L", 2: "LA", 3: "RGB", 4: "RGBA"}
+
+# Pillow has no choice of the PNG filter, the zlib strategy (compress_type, 3 is run length) is the closest knob
+FORMAT_SETTINGS: Dict[str, Dict] = {
+    "png": {"compress_level": int(os.environ.get("PNG_COMPRESS_LEVEL", 1)),
+            "compress_type": int(os.environ.get("PNG_COMPRESS_TYPE", -1))},
+    "webp": {"quality": int(os.environ.get("WEBP_QUALITY", 80)),
+             "method": int(os.environ.get("WEBP_METHOD", 2)),
+             "lossless": os.environ.get("WEBP_LOSSLESS", "0") in ["1", "true"]},
+    "jpeg": {"quality": int(os.environ.get("JPEG_QUALITY", 85))}
+}
+PALETTE_COLORS = int(os.environ.get("PALETTE_COLORS", 256))
+
+# sources with few colors are quantized to a palette, opaque sources may be sent as JPEG
+PALETTE_SOURCES = {"transparent"} | {"route" + str(i) for i in range(1, 8)}
+OPAQUE_SOURCES = {"default", "osm", "satellite", "mapbox"}
+
+
+def isOpaque(image: np.ndarray) -> bool:
+    return image.shape[2] in [1, 3] or bool((image[:, :, -1] == 255).all())
+
+
+# the format for a requested one, "auto" is resolved from the Accept header
+def negotiateFormat(requested: str, accept: str, opaque_source: bool) -> str:
+    if requested != "auto":
+        return "jpeg" if requested == "jpg" else requested
+    accepted = set()
+    for media_range in accept.lower().split(","):
+        parts = [part.strip() for part in media_range.split(";")]
+        if any(part.replace(" ", "") in ["q=0", "q=0.0"] for part in parts[1:]):
+            continue
+        accepted.add(parts[0])
+    if "image/webp" in accepted:
+        return "webp"
+    if opaque_source and accepted & {"image/jpeg", "image/*", "*/*"}:
+        return "jpeg"
+    return "png"
+
+
+# JPEG has no transparency, images with transparent pixels are sent as PNG instead
+def outputFormat(fileformat: str, image: np.ndarray) -> str:
+    if fileformat == "jpeg" and not isOpaque(image):
+        return "png"
+    return fileformat
+
+
+def encodeImage(image: np.ndarray, fileformat: str, quantize: bool = False,
+                settings: Optional[Dict] = None) -> bytes:
+    assert image.dtype == np.uint8 and image.ndim == 3
+    if fileformat == "jpeg" and image.shape[2] in [2, 4]:
+        image = image[:, :, :-1]
+    # frombuffer shares the memory of contiguous arrays
+    image = np.ascontiguousarray(image)
+    mode = _MODES[image.shape[2]]
+    pilim = Image.frombuffer(mode, (image.shape[1], image.shape[0]), image, "raw", mode, 0, 1)
+    if quantize and fileformat == "png" and mode in ["RGB", "RGBA"]:
+        # fast octree, the only method that keeps the alpha channel
+        pilim = pilim.quantize(PALETTE_COLORS, method=2)
+    img_io = BytesIO()
+    pilim.save(img_io, _PIL_FORMATS[fileformat], **(settings if settings is not None else FORMAT_SETTINGS[fileformat]))
+    return img_io.getvalue()
@@ -1,3 +1,5 @@
+from typing import Optional
+
 import numpy as np
 import math
 
@@ -26,12 +28,43 @@ def assertSingleVec2d(vec: np.ndarray) -> np.ndarray:
     return vec
 
 
-# input 2xX area
-def complexLog(vecIn: np.ndarray) -> np.ndarray:
+def _realOut(vecIn: np.ndarray, out: Optional[np.ndarray]) -> np.ndarray:
+    assertMultipleVec2d(vecIn)
+    if out is None:
+        out = np.empty(vecIn.shape, dtype=vecIn.dtype if vecIn.dtype.kind == 'f' else np.float64)
+    assert out.shape == vecIn.shape
+    return out
+
+
+# input 2xX area, log(x + iy) = log|z| + i * arg(z) without complex temporaries
+# out may be vecIn itself
+def complexLog(vecIn: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    out = _realOut(vecIn, out)
+    radius = np.hypot(vecIn[0, :], vecIn[1, :])
+    np.arctan2(vecIn[1, :], vecIn[0, :], out=out[1, :])
+    with np.errstate(divide='ignore'):
+        np.log(radius, out=out[0, :])
+    out[0, radius == 0] = 0  # replace negative infinity with 0 hack
+    return out
+
+
+# exp(x + iy) = e^x * (cos y + i sin y), out may be vecIn itself
+def complexExp(vecIn: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    out = _realOut(vecIn, out)
+    radius = np.exp(vecIn[0, :])
+    np.cos(vecIn[1, :], out=out[0, :])
+    np.sin(vecIn[1, :], out=out[1, :])
+    out *= radius
+    out[0, out[0, :] == -np.inf] = 0
+    return out
+
+
+# versions based on complex numpy ufuncs, kept as reference for the real valued kernels
+def complexLogReference(vecIn: np.ndarray) -> np.ndarray:
     return _vectorsComplexWrapper(vecIn, np.log)
 
 
-def complexExp(vecIn: np.ndarray) -> np.ndarray:
+def complexExpReference(vecIn: np.ndarray) -> np.ndarray:
     return _vectorsComplexWrapper(vecIn, np.exp)
 
 
@@ -0,0 +1,124 @@
+"""
+Renders a single projection on several cores. The target is split into horizontal bands, worker processes
+project the bands and write the colors into a shared memory array, so no pixel data is pickled.
+The data source is set up once per worker with its get_init_params/init_process hooks.
+"""
+import math
+import multiprocessing
+import os
+import sys
+from logging import info
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
+
+import numpy as np
+
+from source.raster_data.abstract_raster_data_provider import AbstractRasterDataProvider
+from source.raster_projector import RasterProjector, TargetSectionDescription, ProjectionWorkspace, splitIntoBands
+from source.zoomable_projection import ZoomableProjection
+
+# per worker process
+_worker_data_source: Optional[AbstractRasterDataProvider] = None
+_worker_workspace: Optional[ProjectionWorkspace] = None
+
+
+def _init_worker(data_source: AbstractRasterDataProvider, init_params):
+    global _worker_data_source, _worker_workspace
+    data_source.init_worker(init_params)
+    _worker_data_source = data_source
+    _worker_workspace = ProjectionWorkspace()
+    info("Render worker " + str(os.getpid()) + " ready")
+
+
+# the parent owns and unlinks the segment, before python 3.13 attaching registers it with the shared resource
+# tracker again, which then races with the unregistering of the parent
+def _attach(name: str) -> shared_memory.SharedMemory:
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _render_band(task) -> int:
+    projection, dtype, band, clip_color, shm_name, shape, first_row = task
+    projector = RasterProjector(projection, _worker_data_source, dtype=dtype, workspace=_worker_workspace)
+    colors = projector.project(band, clip_color, cache_grid=False)
+    shm = _attach(shm_name)
+    try:
+        out = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        out[first_row:first_row + colors.shape[0], :, :colors.shape[2]] = colors
+        del out
+    finally:
+        shm.close()
+    return colors.shape[2]
+
+
+class RenderPool():
+    # process pool bound to one data source, keep it around to pay for the worker setup only once
+
+    def __init__(self, data_source: AbstractRasterDataProvider, processes: Optional[int] = None):
+        self.data_source = data_source
+        self.processes = processes if processes is not None else os.cpu_count()
+        # fork inherits the data source, other start methods pickle it without its process data
+        method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+        context = multiprocessing.get_context(method)
+        init_params = data_source.get_init_params(None)
+        self._pool = context.Pool(self.processes, initializer=_init_worker,
+                                  initargs=(data_source, init_params))
+
+    def map(self, tasks):
+        return self._pool.map(_render_band, tasks, chunksize=1)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ParallelRasterProjector(RasterProjector):
+    # without a pool a temporary one is created for every projection
+
+    def __init__(self, projection: ZoomableProjection, data_source: AbstractRasterDataProvider,
+                 pool: Optional[RenderPool] = None, processes: Optional[int] = None,
+                 band_height: Optional[int] = None, **projector_args):
+        super(ParallelRasterProjector, self).__init__(projection, data_source, **projector_args)
+        assert pool is None or pool.data_source is data_source
+        self.pool = pool
+        self.processes = pool.processes if pool is not None else (processes or os.cpu_count())
+        self.band_height = band_height
+
+    def project(self, trange: TargetSectionDescription, clip_color=[0, 0, 0, 0],
+                out: Optional[np.ndarray] = None, cache_grid=True) -> np.ndarray:
+        # the channels are only known after sampling, the shared array has room for 4
+        shape = (trange.ysteps, trange.xsteps, 4)
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        try:
+            # a few bands per process to balance the load
+            band_height = self.band_height or max(16, int(math.ceil(trange.ysteps / (self.processes * 4))))
+            tasks = [(self.projection, self.dtype, band, clip_color, shm.name, shape, first_row)
+                     for first_row, band in splitIntoBands(trange, band_height)]
+            if self.pool is not None:
+                channels = self.pool.map(tasks)
+            else:
+                with RenderPool(self.data_source, self.processes) as pool:
+                    channels = pool.map(tasks)
+            assert len(set(channels)) == 1
+            shared = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+            if out is None:
+                out = np.empty((trange.ysteps, trange.xsteps, channels[0]), dtype=np.uint8)
+            assert out.shape == (trange.ysteps, trange.xsteps, channels[0]) and out.dtype == np.uint8
+            out[...] = shared[:, :, :channels[0]]
+            del shared
+        finally:
+            shm.close()
+            shm.unlink()
+        return out
@@ -0,0 +1,61 @@
+"""
+Incremental PNG encoder, rows are compressed as they arrive so an image never has to exist in memory at once.
+"""
+import struct
+import zlib
+from typing import Iterable, Iterator
+
+import numpy as np
+
+_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+
+def _chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + \
+        struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff)
+
+
+class PNGStreamWriter():
+    # 8 bit gray, gray alpha, RGB or RGBA rows, every call returns the bytes that are ready to be sent
+
+    def __init__(self, width: int, height: int, channels: int, compression_level: int = 6):
+        assert channels in _COLOR_TYPES
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compression_level)
+
+    def header(self) -> bytes:
+        ihdr = struct.pack(">IIBBBBB", self.width, self.height, 8, _COLOR_TYPES[self.channels], 0, 0, 0)
+        return _SIGNATURE + _chunk(b"IHDR", ihdr)
+
+    def write_rows(self, rows: np.ndarray) -> bytes:
+        assert rows.shape[1:] == (self.width, self.channels) and rows.dtype == np.uint8
+        self.rows_written += rows.shape[0]
+        assert self.rows_written <= self.height
+        # every row starts with filter type 0
+        filtered = np.zeros((rows.shape[0], self.width * self.channels + 1), dtype=np.uint8)
+        filtered[:, 1:] = rows.reshape(rows.shape[0], -1)
+        compressed = self._compressor.compress(filtered.tobytes())
+        return _chunk(b"IDAT", compressed) if compressed else b""
+
+    def finish(self) -> bytes:
+        assert self.rows_written == self.height
+        return _chunk(b"IDAT", self._compressor.flush()) + _chunk(b"IEND", b"")
+
+
+# encodes (rows, width, channels) bands from top to bottom, the channels are taken from the first band
+def encodePNGStream(width: int, height: int, bands: Iterable[np.ndarray],
+                    compression_level: int = 6) -> Iterator[bytes]:
+    writer = None
+    for band in bands:
+        if writer is None:
+            writer = PNGStreamWriter(width, height, band.shape[2], compression_level)
+            yield writer.header()
+        data = writer.write_rows(band)
+        if data:
+            yield data
+    assert writer is not None
+    yield writer.finish()
@@ -1,4 +1,5 @@
 import abc
+from typing import Optional
 
 import math
 import numpy as np
@@ -24,11 +25,15 @@ class AbstractPreprojection(abc.ABC):
         mathutils.assertMultipleVec2d(latlng)
         return mathutils.assertMultipleVec2d(self._forward(np.deg2rad(latlng)+self.offset))
 
-    def invert(self, xy: np.ndarray) -> np.ndarray:
+    # the offset is subtracted in float64 or the dtype of out
+    def invert(self, xy: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
         mathutils.assertMultipleVec2d(xy)
-        return mathutils.assertMultipleVec2d(
-            np.rad2deg(self._backward(xy)-self.offset)
-        )
+        if out is None:
+            return mathutils.assertMultipleVec2d(
+                np.rad2deg(self._backward(xy)-self.offset)
+            )
+        np.subtract(self._backward(xy), self.offset, out=out)
+        return mathutils.assertMultipleVec2d(np.rad2deg(out, out=out))
 
     @abc.abstractmethod
     def _forward(self, latlng_radians: np.ndarray) -> np.ndarray:
@@ -16,6 +16,16 @@ class AbstractRasterDataProvider(abc.ABC):
     def get_init_params(self, manager: Optional[object]):
         return []
 
+    # called in a worker process with the parameters get_init_params returned in the parent
+    def init_worker(self, init_params):
+        self._init_data = self.init_process(*init_params)
+
+    # the process data is not pickled, workers recreate it with init_worker
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_init_data', None)
+        return state
+
     def getData(self, positions_with_zoom: np.ndarray) -> np.ndarray:
         assert len(positions_with_zoom.shape) == 2 and positions_with_zoom.shape[0] == 3
 
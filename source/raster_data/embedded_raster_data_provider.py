@@ -0,0 +1,72 @@
+import hashlib
+import os
+from logging import warning
+from typing import Optional, Callable
+
+import numpy as np
+import requests
+
+from source.array_cache import ArrayLRUCache
+from source.raster_data.remote_raster_data_provider import RemoteRasterDataProvider, quantizePositions, \
+    sample as remote_sample
+from source.raster_data.raw_tile_cache import RawTileCache
+from source.raster_data.resolver_server import QuantizedTileSampler
+from source.raster_data.tile_cache import ArrayMemoryTileCache, FileTileCache, TileFilenameResolver
+from source.raster_data.tile_resolver import AbstractTileImageResolver, HTTPTileFileResolver, TileURLResolver
+
+
+# decoded tiles of all embedded providers of a process share one budget of EMBEDDED_TILE_CACHE_BYTES,
+# every uwsgi process holds its own
+embedded_tiles = ArrayLRUCache(int(os.environ.get("EMBEDDED_TILE_CACHE_BYTES", 64 * 1024 * 1024)))
+
+
+# EMBEDDED_RAW_TILES=0 disables the disk tier of decoded tiles, 256 KB per tile next to the PNG files
+def localResolverFactory(url_template: str) -> AbstractTileImageResolver:
+    prefix = "embedded_" + hashlib.md5(url_template.encode('utf-8')).hexdigest()[:12]
+    r = HTTPTileFileResolver(TileURLResolver.from_normalized(url_template))
+    r = FileTileCache(r, TileFilenameResolver(prefix))
+    if os.environ.get("EMBEDDED_RAW_TILES", "1") in ["1", "true"]:
+        r = RawTileCache(r, name=prefix)
+    r = ArrayMemoryTileCache(r, lock=True, shared=embedded_tiles)
+    return r
+
+
+# same provider as RemoteRasterDataProvider, but samples the tiles in process with the local cache stack
+# and only uses the remote resolver service if that fails
+class EmbeddedRasterDataProvider(RemoteRasterDataProvider):
+
+    def __init__(self, urlresovler: TileURLResolver,
+                 resolver_factory: Callable[[str], AbstractTileImageResolver] = localResolverFactory,
+                 fallback_to_remote: bool = True, **remote_args):
+        self.resolver_factory = resolver_factory
+        self.fallback_to_remote = fallback_to_remote
+        super(EmbeddedRasterDataProvider, self).__init__(urlresovler, **remote_args)
+
+    def getSampleFN(self):
+        return sample
+
+    def get_init_params(self, manager: Optional[object]):
+        return super(EmbeddedRasterDataProvider, self).get_init_params(manager) + (
+            self.resolver_factory, self.fallback_to_remote)
+
+    def init_process(self, resolver, chunk_size, timeout, max_parallel, server, protocol, resolver_factory=None,
+                     fallback_to_remote=True):
+        init_data = super(EmbeddedRasterDataProvider, self).init_process(resolver, chunk_size, timeout, max_parallel,
+                                                                         server, protocol)
+        init_data["url_template"] = resolver.normalized()
+        init_data["sampler"] = QuantizedTileSampler(resolver_factory or localResolverFactory)
+        init_data["fallback_to_remote"] = fallback_to_remote
+        return init_data
+
+
+def sample(latlng: np.ndarray, init_data):
+    if latlng.shape[1] == 0:
+        return np.zeros((4, 0), dtype=np.uint8)
+
+    try:
+        return init_data["sampler"](init_data["url_template"], quantizePositions(latlng)).transpose()
+    except (EnvironmentError, requests.exceptions.RequestException) as e:
+        if not init_data["fallback_to_remote"]:
+            raise
+        warning("Embedded sampling failed, using remote resolver: " + str(e))
+    return remote_sample(latlng, init_data)
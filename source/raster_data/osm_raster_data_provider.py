@@ -1,25 +1,35 @@
 import logging
 from logging import info, error
 from multiprocessing.dummy import Manager
+from typing import Optional
 
 import numpy as np
 
 from source.lat_lng import LatLng
 from source.raster_data.abstract_raster_data_provider import AbstractRasterDataProvider
 
-from source.raster_data.tile_math import latlngToTile, latlngToTilePixel, tileExists, OSMTile
-from source.raster_data.tile_resolver import AbstractTileImageResolver
+from source.raster_data.tile_availability import TileAvailabilityIndex
+from source.raster_data.tile_math import latlngToTile, latlngToTilePixel, tileExists, OSMTile, latlngToXYNP
+from source.raster_data.tile_prefetch import TilePrefetcher, planTiles, PREFETCH_WORKERS, canPrefetch
+from source.raster_data.tile_resolver import AbstractTileImageResolver, tileImageToArray
 
 
 class OSMRasterDataProvider(AbstractRasterDataProvider):
     resolver: AbstractTileImageResolver
 
     def __init__(self, resolver, zoom_offset: int = 0,
-                 max_zoom_level: int = 19, ):
+                 max_zoom_level: int = 19, vectorized: bool = True,
+                 availability: Optional[TileAvailabilityIndex] = None, prefetch_workers: Optional[int] = None):
         info("Starting Raster data provider")
         self.zoom_offset = zoom_offset
         self.max_zoom_level = max_zoom_level
         self.resolver = resolver
+        self.vectorized = vectorized
+        self.availability = availability
+        # prefetching needs a resolver that is a MemoryTileCache with lock=True, off by default for other resolvers
+        if prefetch_workers is None:
+            prefetch_workers = PREFETCH_WORKERS if canPrefetch(resolver) else 0
+        self.prefetch_workers = prefetch_workers
 
         super(OSMRasterDataProvider, self).__init__()
 
@@ -27,7 +37,10 @@ class OSMRasterDataProvider(AbstractRasterDataProvider):
         logging.basicConfig(level=logging.INFO)
         info("Started process")
 
-        process_data = (self.resolver, zoom_offset, max_zoom_level)
+        prefetcher = None
+        if self.prefetch_workers > 0:
+            prefetcher = TilePrefetcher(self.resolver, max_workers=self.prefetch_workers, max_zoom=max_zoom_level)
+        process_data = (self.resolver, zoom_offset, max_zoom_level, self.availability, prefetcher)
         return process_data
 
     def get_init_params(self, manager: Manager):
@@ -38,6 +51,8 @@ class OSMRasterDataProvider(AbstractRasterDataProvider):
         return None, self.zoom_offset, self.max_zoom_level, d
 
     def getSampleFN(self):
+        if self.vectorized:
+            return _sample_vectorized
         return _sample
 
 
@@ -88,3 +103,102 @@ def _sample(positions_with_zoom: np.ndarray, init_data) -> np.ndarray:
         out[:, i] = colors
 
     return out
+
+
+# same result as _sample, but resolves every distinct tile only once and gathers its pixels with one index operation
+def _sample_vectorized(positions_with_zoom: np.ndarray, init_data) -> np.ndarray:
+    data_source: AbstractTileImageResolver = init_data[0]
+    zoom_offset = init_data[1]
+    max_zoom = init_data[2]
+    availability: Optional[TileAvailabilityIndex] = init_data[3] if len(init_data) > 3 else None
+    prefetcher: Optional[TilePrefetcher] = init_data[4] if len(init_data) > 4 else None
+
+    lat_array = positions_with_zoom[0, :]
+    lng_array = positions_with_zoom[1, :]
+    zoom_array = np.minimum(positions_with_zoom[2, :] + zoom_offset, max_zoom).astype(int)
+
+    out = np.zeros_like(positions_with_zoom, dtype=np.uint8)
+    pending = np.flatnonzero(zoom_array >= 0)
+    if pending.size < zoom_array.size:
+        logging.warning(str(zoom_array.size - pending.size) + " positions with negative zoom level")
+
+    if availability is not None and pending.size > 0:
+        # jump straight to the deepest tile that is not known to be missing
+        zoom_array[pending] = existingZoom(availability, lat_array[pending], lng_array[pending], zoom_array[pending])
+        pending = pending[zoom_array[pending] >= 0]
+
+    if prefetcher is not None and pending.size > 0:
+        prefetcher(planTiles(lat_array[pending], lng_array[pending], zoom_array[pending]))
+
+    while pending.size > 0:
+        missing = sampleTiles(data_source, lat_array[pending], lng_array[pending], zoom_array[pending],
+                              out, pending, max_zoom, availability=availability)
+        pending = pending[missing]
+        zoom_array[pending] -= 1
+        exhausted = zoom_array[pending] < 0
+        if np.any(exhausted):
+            logging.warning(str(np.count_nonzero(exhausted)) + " positions without any existing tile")
+        pending = pending[np.invert(exhausted)]
+
+    return out
+
+
+# writes the colors of all resolvable positions to out[:, targets], returns a mask of positions whose tile is missing
+def sampleTiles(data_source: AbstractTileImageResolver, lat: np.ndarray, lng: np.ndarray, zoom: np.ndarray,
+                out: np.ndarray, targets: np.ndarray, max_zoom: int, tile_size: int = 256,
+                availability: Optional[TileAvailabilityIndex] = None) -> np.ndarray:
+    xy = latlngToXYNP(lat, lng, zoom)
+    tile_x = xy[0, :].astype(int)
+    tile_y = xy[1, :].astype(int)
+    pixel_x = np.minimum(((xy[0, :] - tile_x) * tile_size).astype(int), tile_size - 1)
+    pixel_y = np.minimum(((xy[1, :] - tile_y) * tile_size).astype(int), tile_size - 1)
+    del xy
+    return gatherTilePixels(data_source, zoom, tile_x, tile_y, pixel_x, pixel_y, out, targets, max_zoom,
+                            availability=availability)
+
+
+# groups positions by tile, resolves every tile once and copies the addressed pixels to out[:, targets]
+def gatherTilePixels(data_source: AbstractTileImageResolver, zoom: np.ndarray, tile_x: np.ndarray,
+                     tile_y: np.ndarray, pixel_x: np.ndarray, pixel_y: np.ndarray, out: np.ndarray,
+                     targets: np.ndarray, max_zoom: int,
+                     availability: Optional[TileAvailabilityIndex] = None) -> np.ndarray:
+    missing = np.zeros(targets.shape, dtype=bool)
+    channels = out.shape[0]
+
+    order = np.lexsort((tile_y, tile_x, zoom))
+    sorted_zoom = zoom[order]
+    sorted_x = tile_x[order]
+    sorted_y = tile_y[order]
+    changes = np.flatnonzero((np.diff(sorted_zoom) != 0) | (np.diff(sorted_x) != 0) | (np.diff(sorted_y) != 0)) + 1
+    starts = np.concatenate([[0], changes])
+    ends = np.concatenate([changes, [order.size]])
+
+    tile = OSMTile(0, 0, 0)
+    for start, end in zip(starts, ends):
+        group = order[start:end]
+        tile.assign(int(sorted_x[start]), int(sorted_y[start]), int(sorted_zoom[start]))
+        if not tileExists(tile, max_zoom=max_zoom):
+            error("Querying invalid tile " + tile.__str__())
+        try:
+            tile_image = data_source(tile)
+        except FileNotFoundError:
+            info("Could not find " + tile.__str__())
+            if availability is not None:
+                availability.mark_missing(tile)
+            missing[group] = True
+            continue
+
+        tile_array = tileImageToArray(tile_image)
+        colors = tile_array[pixel_y[group], pixel_x[group], :channels]
+        out[:, targets[group]] = colors.transpose()
+
+    return missing
+
+
+def existingZoom(availability: TileAvailabilityIndex, lat: np.ndarray, lng: np.ndarray,
+                 zoom: np.ndarray) -> np.ndarray:
+    xy = latlngToXYNP(lat, lng, zoom)
+    tiles = np.stack([zoom, xy[0, :].astype(int), xy[1, :].astype(int)], axis=0)
+    unique_tiles, inverse = np.unique(tiles, axis=1, return_inverse=True)
+    existing = availability.existing_zoom(unique_tiles[0, :], unique_tiles[1, :], unique_tiles[2, :])
+    return existing[inverse.reshape(-1)]
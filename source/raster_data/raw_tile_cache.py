@@ -0,0 +1,162 @@
+"""
+Disk tier that keeps already decoded RGBA tiles in a fixed stride memory mapped file.
+A warm read is a read only np.ndarray view into the mapping instead of a PNG decode.
+Slots are assigned through a small SQLite index so several processes can share the files. A slot is marked ready
+after its tile is written, slots that were left unready by a process that no longer exists are reclaimed on open.
+"""
+import os
+import sqlite3
+import tempfile
+from logging import info
+from threading import Lock
+from typing import Optional, Dict, Tuple
+
+import numpy as np
+
+from source.raster_data.tile_math import OSMTile
+from source.raster_data.tile_resolver import AbstractTileImageResolver, tileImageToArray
+
+MISSING_SLOT = -1
+
+
+def _processAlive(pid: Optional[int]) -> bool:
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RawTileCache(AbstractTileImageResolver):
+
+    def __init__(self, fallback: AbstractTileImageResolver, name: str = "osm", basedir: Optional[str] = None,
+                 tile_size: int = 256, timeout: float = 30.0):
+        if basedir is None:
+            basedir = os.path.join(tempfile.gettempdir(), "tilecache")
+        os.makedirs(basedir, exist_ok=True)
+
+        self.fallback = fallback
+        self.tile_shape = (tile_size, tile_size, 4)
+        self.stride = int(np.prod(self.tile_shape))
+        self.data_path = os.path.join(basedir, name + ".raw")
+        self.index_path = os.path.join(basedir, name + ".rawindex")
+        self.timeout = timeout
+
+        self._lock = Lock()
+        self._reset_process_state()
+
+        with open(self.data_path, 'ab'):
+            pass
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("CREATE TABLE IF NOT EXISTS slots (zoom INTEGER, x INTEGER, y INTEGER, "
+                                   "slot INTEGER, ready INTEGER, owner INTEGER, PRIMARY KEY (zoom, x, y))")
+                self._reclaim_stale(connection)
+
+    # unready slots of crashed writers would never be written again, their tiles are fetched again instead
+    def _reclaim_stale(self, connection: sqlite3.Connection):
+        stale = [row[:3] for row in connection.execute("SELECT zoom, x, y, owner FROM slots WHERE ready=0")
+                 if not _processAlive(row[3])]
+        if len(stale) > 0:
+            info("Reclaiming " + str(len(stale)) + " unfinished slots of " + self.index_path)
+            connection.executemany("DELETE FROM slots WHERE zoom=? AND x=? AND y=? AND ready=0", stale)
+
+    def _reset_process_state(self):
+        self._connection = None
+        self._pid = None
+        self._map = None
+        self._slots: Dict[Tuple[int, int, int], int] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None or self._pid != os.getpid():
+            self._reset_process_state()
+            connection = sqlite3.connect(self.index_path, timeout=self.timeout, check_same_thread=False,
+                                         isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def _view(self, slot: int) -> np.ndarray:
+        if self._map is None or slot >= self._map.shape[0]:
+            num_slots = os.path.getsize(self.data_path) // self.stride
+            self._map = np.memmap(self.data_path, dtype=np.uint8, mode='r', shape=(num_slots,) + self.tile_shape)
+        return self._map[slot]
+
+    def _lookup(self, key: Tuple[int, int, int]) -> Optional[int]:
+        slot = self._slots.get(key, None)
+        if slot is not None:
+            return slot
+        row = self._connect().execute("SELECT slot FROM slots WHERE zoom=? AND x=? AND y=? AND ready=1",
+                                      key).fetchone()
+        if row is None:
+            return None
+        self._slots[key] = row[0]
+        return row[0]
+
+    def __call__(self, tile: OSMTile) -> np.ndarray:
+        key = (tile.zoom, tile.x, tile.y)
+        with self._lock:
+            slot = self._lookup(key)
+            if slot == MISSING_SLOT:
+                raise FileNotFoundError("Tile does not exist")
+            if slot is not None:
+                return self._view(slot)
+
+        try:
+            im = self.fallback(tile)
+        except FileNotFoundError:
+            info("Writing " + tile.__str__() + " to missing tiles of " + self.index_path)
+            with self._lock:
+                self._connect().execute("INSERT OR IGNORE INTO slots (zoom, x, y, slot, ready) VALUES (?, ?, ?, ?, 1)",
+                                        key + (MISSING_SLOT,))
+            raise FileNotFoundError()
+
+        data = np.ascontiguousarray(tileImageToArray(im))
+        if data.shape != self.tile_shape:
+            info("Not persisting " + tile.__str__() + " with shape " + str(data.shape))
+            return data
+
+        with self._lock:
+            slot = self._allocate(key)
+            if slot is None:
+                # another process is writing the same tile right now
+                return data
+            with open(self.data_path, 'r+b') as f:
+                f.seek(slot * self.stride)
+                f.write(data.tobytes())
+            self._connect().execute("UPDATE slots SET ready=1 WHERE zoom=? AND x=? AND y=?", key)
+            self._slots[key] = slot
+            return self._view(slot)
+
+    def _allocate(self, key: Tuple[int, int, int]) -> Optional[int]:
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if connection.execute("SELECT slot FROM slots WHERE zoom=? AND x=? AND y=?", key).fetchone() is not None:
+                connection.execute("COMMIT")
+                return None
+            slot = connection.execute("SELECT COALESCE(MAX(slot), -1) + 1 FROM slots").fetchone()[0]
+            connection.execute("INSERT INTO slots (zoom, x, y, slot, ready, owner) VALUES (?, ?, ?, ?, 0, ?)",
+                               key + (slot, os.getpid()))
+            connection.execute("COMMIT")
+            return slot
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ['_connection', '_pid', '_map', '_slots', '_lock']:
+            del state[k]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+        self._reset_process_state()
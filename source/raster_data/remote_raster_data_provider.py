@@ -1,5 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor
 from logging import info,warning
-from typing import Optional
+from typing import Optional, Tuple
 
 import urllib3
 
@@ -10,59 +11,139 @@ import base64
 import numpy as np
 import requests
 import os
+from requests.adapters import HTTPAdapter
 
+from source.raster_data.resolver_protocol import PROTOCOL_HEADER, uniquePositions, encodeRequestV2, \
+    decodeResponseV2, decodeResponseV1
 from source.raster_data.tile_resolver import TileURLResolver
 
 
 class RemoteRasterDataProvider(AbstractRasterDataProvider):
 
-    def __init__(self, urlresovler: TileURLResolver):
+    def __init__(self, urlresovler: TileURLResolver, chunk_size: Optional[int] = None,
+                 timeout: Optional[float] = None, max_parallel: Optional[int] = None, server: Optional[str] = None,
+                 protocol: Optional[int] = None):
         self.resolver = urlresovler
+        self.chunk_size = chunk_size if chunk_size is not None else int(
+            os.environ.get("TILERESOLVER_CHUNK_SIZE", 256 * 256))
+        self.timeout = timeout if timeout is not None else float(os.environ.get("TILERESOLVER_TIMEOUT", 60))
+        self.max_parallel = max_parallel if max_parallel is not None else int(
+            os.environ.get("TILERESOLVER_PARALLEL", 4))
+        self.server = server
+        # version 2 has to be supported by the resolver service, see resolver_protocol
+        self.protocol = protocol if protocol is not None else int(os.environ.get("TILERESOLVER_PROTOCOL", 1))
         super(RemoteRasterDataProvider, self).__init__()
 
     def getSampleFN(self):
         return sample
 
     def get_init_params(self, manager: Optional[object]):
-        return self.resolver,
+        return self.resolver, self.chunk_size, self.timeout, self.max_parallel, self.server, self.protocol
 
-    def init_process(self, resolver):
+    def init_process(self, resolver, chunk_size, timeout, max_parallel, server, protocol):
         b64_suburl = base64.b64encode(resolver.normalized().encode('utf-8')).decode('utf-8')
-        server = os.environ.get("TILERESOLVER","127.0.0.1:8000")
+        if server is None:
+            server = os.environ.get("TILERESOLVER","127.0.0.1:8000")
         return {
             "resolver_url": "http://"+server+"/resolve/"+b64_suburl + "/resolution/256",
-
+            "chunk_size": chunk_size,
+            "timeout": timeout,
+            "max_parallel": max_parallel,
+            "protocol": protocol,
         }
 
 
-def sample(latlng: np.ndarray, init_data):
-    if latlng.shape[1] == 0:
-        return np.zeros((4,0),dtype=np.uint8)
-
-    num_elements = latlng.shape[1]
-    xyzoom = latlngZoomToXYZoomNP(latlng)
-    xy = (xyzoom[0:2,:] * 256).astype(np.uint32)
-    zoom = (xyzoom[2:,:]*256).astype(np.uint32)
-    xyzoom_clipped = np.concatenate([xy,zoom],axis=0)
-    assert xyzoom_clipped.shape == xyzoom.shape
-    xyzoom_clipped =xyzoom_clipped.transpose()
-
-    binary = xyzoom_clipped.tobytes()
-    resp = None
+class _WorkerConnectionPool:
+    # one keep-alive session and one thread pool per worker process, shared by all remote providers
+    def __init__(self):
+        self.pid = None
+        self.session = None
+        self.executor = None
+        self.size = 0
+
+    def get(self, size: int) -> Tuple[requests.Session, ThreadPoolExecutor]:
+        if self.pid != os.getpid() or size > self.size:
+            info("Creating connection pool of size " + str(size))
+            if self.pid == os.getpid():
+                self.executor.shutdown(wait=False)
+                self.session.close()
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self.session = session
+            self.executor = ThreadPoolExecutor(max_workers=size)
+            self.size = size
+            self.pid = os.getpid()
+        return self.session, self.executor
+
+
+_connection_pool = _WorkerConnectionPool()
+
+
+def _post(session: requests.Session, url: str, binary: bytes, timeout: float, protocol: int = 1) -> bytes:
+    headers = {'Content-Type': 'application/octet-stream'}
+    if protocol != 1:
+        headers[PROTOCOL_HEADER] = str(protocol)
     try:
-        resp = requests.post(init_data['resolver_url'], data=binary, headers={'Content-Type': 'application/octet-stream'})
+        resp = session.post(url, data=binary, headers=headers, timeout=timeout)
     except requests.exceptions.RequestException as e:
 
-        raise ConnectionError("Could not connect to remote " + init_data['resolver_url'] + ":" + str(e))
+        raise ConnectionError("Could not connect to remote " + url + ":" + str(e))
 
+    if(resp.status_code != 200):
+        raise  ConnectionError("Remote " + url + " returned status code " + str(resp.status_code))
 
+    return resp.content
 
-    if(resp.status_code != 200):
-        raise  ConnectionError()
+
+# (N, 3) uint32 array of (x * 256, y * 256, zoom * 256) as expected by the resolver service
+def quantizePositions(latlng: np.ndarray) -> np.ndarray:
+    xyzoom = latlngZoomToXYZoomNP(latlng)
+    xy = (xyzoom[0:2,:] * 256).astype(np.uint32)
+    zoom = (xyzoom[2:,:]*256).astype(np.uint32)
+    xyzoom_clipped = np.concatenate([xy,zoom],axis=0)
+    assert xyzoom_clipped.shape == xyzoom.shape
+    return xyzoom_clipped.transpose()
 
 
+def sample(latlng: np.ndarray, init_data):
+    if latlng.shape[1] == 0:
+        return np.zeros((4,0),dtype=np.uint8)
 
-    res_con = resp.content
-    parsed_resp = np.frombuffer(res_con,np.uint8).reshape(num_elements,4).transpose()
-    assert parsed_resp.shape == (4,xyzoom.shape[1])
-    return parsed_resp
\ No newline at end of file
+    num_elements = latlng.shape[1]
+    xyzoom_clipped = quantizePositions(latlng)
+
+    url = init_data['resolver_url']
+    timeout = init_data.get('timeout', None)
+    chunk_size = init_data.get('chunk_size', num_elements)
+    session, executor = _connection_pool.get(init_data.get('max_parallel', 1))
+    protocol = init_data.get('protocol', 1)
+
+    inverse = None
+    if protocol == 2:
+        # only distinct quantized positions go over the wire
+        xyzoom_clipped, inverse = uniquePositions(xyzoom_clipped)
+
+    def resolve_chunk(chunk: np.ndarray) -> np.ndarray:
+        try:
+            if protocol == 2:
+                return decodeResponseV2(_post(session, url, encodeRequestV2(chunk), timeout, protocol), chunk.shape[0])
+            return decodeResponseV1(_post(session, url, chunk.tobytes(), timeout), chunk.shape[0])
+        except ValueError as e:
+            raise ConnectionError("Invalid reply from remote " + url + ": " + str(e))
+
+    # chunks are posted concurrently and reassembled in order
+    num_sent = xyzoom_clipped.shape[0]
+    chunks = [xyzoom_clipped[start:start + chunk_size] for start in range(0, num_sent, chunk_size)]
+    if len(chunks) == 1:
+        colors = resolve_chunk(chunks[0])
+    else:
+        colors = np.concatenate(list(executor.map(resolve_chunk, chunks)), axis=0)
+
+    if inverse is not None:
+        colors = colors[inverse]
+
+    parsed_resp = colors.transpose()
+    assert parsed_resp.shape == (4,num_elements)
+    return parsed_resp
@@ -0,0 +1,93 @@
+"""
+Wire formats between RemoteRasterDataProvider and the tile resolver service.
+
+Version 1 sends every position as three uint32 values (x * 256, y * 256, zoom * 256) and receives 4 RGBA bytes
+per position.
+Version 2 only sends the distinct quantized positions. They are sorted, x is delta encoded, zoom is narrowed to
+uint16 and the payload is zlib compressed. The reply holds the zlib compressed colors of the distinct positions,
+which the client expands back to the full grid with the inverse index of np.unique.
+"""
+import struct
+import zlib
+from typing import Tuple
+
+import numpy as np
+
+PROTOCOL_HEADER = "X-Resolver-Protocol"
+
+_MAGIC_REQUEST = b"CLQ2"
+_MAGIC_RESPONSE = b"CLR2"
+_HEADER = struct.Struct("<4sI")
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def _split_header(body: bytes, magic: bytes) -> Tuple[int, bytes]:
+    if len(body) < _HEADER.size:
+        raise ProtocolError("Message too short")
+    found_magic, num = _HEADER.unpack_from(body)
+    if found_magic != magic:
+        raise ProtocolError("Invalid magic " + str(found_magic))
+    try:
+        return num, zlib.decompress(body[_HEADER.size:])
+    except zlib.error as e:
+        raise ProtocolError("Invalid payload: " + str(e))
+
+
+def encodeRequestV1(xyzoom: np.ndarray) -> bytes:
+    return np.ascontiguousarray(xyzoom, dtype=np.uint32).tobytes()
+
+
+def decodeRequestV1(body: bytes) -> np.ndarray:
+    return np.frombuffer(body, dtype=np.uint32).reshape(-1, 3)
+
+
+def encodeResponseV1(colors: np.ndarray) -> bytes:
+    return np.ascontiguousarray(colors, dtype=np.uint8).tobytes()
+
+
+def decodeResponseV1(body: bytes, num: int) -> np.ndarray:
+    if len(body) != num * 4:
+        raise ProtocolError("Expected " + str(num * 4) + " bytes, got " + str(len(body)))
+    return np.frombuffer(body, dtype=np.uint8).reshape(num, 4)
+
+
+# returns the distinct (n, 3) positions and the index that expands them back to the input order
+def uniquePositions(xyzoom: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    unique, inverse = np.unique(xyzoom, axis=0, return_inverse=True)
+    return unique, inverse.reshape(-1)
+
+
+def encodeRequestV2(unique_xyzoom: np.ndarray, level: int = 1) -> bytes:
+    num = unique_xyzoom.shape[0]
+    if num > 0 and unique_xyzoom[:, 2].max() > np.iinfo(np.uint16).max:
+        raise ProtocolError("Zoom does not fit into uint16")
+    x_delta = np.diff(unique_xyzoom[:, 0].astype(np.int64), prepend=0).astype(np.uint32)
+    payload = x_delta.tobytes() + \
+        unique_xyzoom[:, 1].astype(np.uint32).tobytes() + \
+        unique_xyzoom[:, 2].astype(np.uint16).tobytes()
+    return _HEADER.pack(_MAGIC_REQUEST, num) + zlib.compress(payload, level)
+
+
+def decodeRequestV2(body: bytes) -> np.ndarray:
+    num, payload = _split_header(body, _MAGIC_REQUEST)
+    if len(payload) != num * 10:
+        raise ProtocolError("Invalid payload size")
+    x = np.cumsum(np.frombuffer(payload, dtype=np.uint32, count=num), dtype=np.uint64).astype(np.uint32)
+    y = np.frombuffer(payload, dtype=np.uint32, count=num, offset=num * 4)
+    zoom = np.frombuffer(payload, dtype=np.uint16, count=num, offset=num * 8)
+    return np.stack([x, y, zoom.astype(np.uint32)], axis=1)
+
+
+def encodeResponseV2(colors: np.ndarray, level: int = 1) -> bytes:
+    return _HEADER.pack(_MAGIC_RESPONSE, colors.shape[0]) + \
+        zlib.compress(np.ascontiguousarray(colors, dtype=np.uint8).tobytes(), level)
+
+
+def decodeResponseV2(body: bytes, num: int) -> np.ndarray:
+    found_num, payload = _split_header(body, _MAGIC_RESPONSE)
+    if found_num != num or len(payload) != num * 4:
+        raise ProtocolError("Expected colors for " + str(num) + " positions")
+    return np.frombuffer(payload, dtype=np.uint8).reshape(num, 4)
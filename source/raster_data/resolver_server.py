@@ -0,0 +1,139 @@
+"""
+Local reference implementation of the tile resolver service used by RemoteRasterDataProvider.
+Speaks protocol version 1 and 2 on /resolve/<base64 url template>/resolution/256 and samples the
+quantized positions from tiles resolved in process, so the protocol can be tested offline.
+
+Run with: python -m source.raster_data.resolver_server [port]
+"""
+import base64
+import logging
+import sys
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from logging import info, warning
+from threading import Lock
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from source.raster_data.osm_raster_data_provider import gatherTilePixels
+from source.raster_data.resolver_protocol import PROTOCOL_HEADER, ProtocolError, decodeRequestV1, \
+    encodeResponseV1, decodeRequestV2, encodeResponseV2
+from source.raster_data.tile_cache import ArrayMemoryTileCache
+from source.raster_data.tile_prefetch import TilePrefetcher, PREFETCH_WORKERS, canPrefetch
+from source.raster_data.tile_resolver import AbstractTileImageResolver, HTTPTileFileResolver, TileURLResolver
+
+
+def defaultResolverFactory(url_template: str) -> AbstractTileImageResolver:
+    return ArrayMemoryTileCache(HTTPTileFileResolver(TileURLResolver.from_normalized(url_template)), lock=True)
+
+
+class QuantizedTileSampler:
+    # samples (x * 256, y * 256, zoom * 256) positions, missing tiles fall back to their parent tile.
+    # the tiles are prefetched concurrently if the resolver is a locked memory cache
+
+    def __init__(self, resolver_factory: Callable[[str], AbstractTileImageResolver] = defaultResolverFactory,
+                 max_zoom: int = 19, prefetch_workers: int = PREFETCH_WORKERS):
+        self.resolver_factory = resolver_factory
+        self.max_zoom = max_zoom
+        self.prefetch_workers = prefetch_workers
+        self.resolvers: Dict[str, AbstractTileImageResolver] = {}
+        self.prefetchers: Dict[str, TilePrefetcher] = {}
+        self._lock = Lock()
+
+    def resolver(self, url_template: str) -> AbstractTileImageResolver:
+        with self._lock:
+            if url_template not in self.resolvers:
+                resolver = self.resolver_factory(url_template)
+                self.resolvers[url_template] = resolver
+                if self.prefetch_workers > 0 and canPrefetch(resolver):
+                    self.prefetchers[url_template] = TilePrefetcher(resolver, max_workers=self.prefetch_workers,
+                                                                    max_zoom=self.max_zoom)
+            return self.resolvers[url_template]
+
+    def __call__(self, url_template: str, xyzoom: np.ndarray) -> np.ndarray:
+        resolver = self.resolver(url_template)
+        x = xyzoom[:, 0].astype(np.int64)
+        y = xyzoom[:, 1].astype(np.int64)
+        zoom = xyzoom[:, 2].astype(np.int64) >> 8
+
+        above = np.maximum(zoom - self.max_zoom, 0)
+        x >>= above
+        y >>= above
+        zoom -= above
+
+        prefetcher = self.prefetchers.get(url_template, None)
+        if prefetcher is not None and xyzoom.shape[0] > 0:
+            prefetcher(np.unique(np.stack([zoom, x >> 8, y >> 8], axis=0), axis=1))
+
+        out = np.zeros((4, xyzoom.shape[0]), dtype=np.uint8)
+        pending = np.arange(xyzoom.shape[0])
+        while pending.size > 0:
+            missing = gatherTilePixels(resolver, zoom[pending], x[pending] >> 8, y[pending] >> 8,
+                                       x[pending] & 255, y[pending] & 255, out, pending, self.max_zoom)
+            pending = pending[missing]
+            zoom[pending] -= 1
+            x[pending] >>= 1
+            y[pending] >>= 1
+            pending = pending[zoom[pending] >= 0]
+        return out.transpose()
+
+
+class ResolverRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    sampler: QuantizedTileSampler = None
+
+    def do_POST(self):
+        prefix = "/resolve/"
+        if not self.path.startswith(prefix) or "/resolution/" not in self.path:
+            self._reply(404, b"")
+            return
+        encoded_template, resolution = self.path[len(prefix):].rsplit("/resolution/", 1)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if resolution != "256":
+            self._reply(400, b"Only a resolution of 256 is supported")
+            return
+
+        version = self.headers.get(PROTOCOL_HEADER, "1")
+        try:
+            url_template = base64.b64decode(encoded_template).decode('utf-8')
+            if version == "2":
+                data = encodeResponseV2(self.sampler(url_template, decodeRequestV2(body)))
+            else:
+                data = encodeResponseV1(self.sampler(url_template, decodeRequestV1(body)))
+        except (ProtocolError, ValueError) as e:
+            warning("Invalid resolver request: " + str(e))
+            self._reply(400, str(e).encode('utf-8'))
+            return
+        self._reply(200, data, version)
+
+    def _reply(self, status: int, data: bytes, version: Optional[str] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        if version is not None:
+            self.send_header(PROTOCOL_HEADER, version)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+# http.server.ThreadingHTTPServer needs Python 3.7
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def makeResolverServer(sampler: Optional[QuantizedTileSampler] = None, host: str = "127.0.0.1",
+                       port: int = 8000) -> ThreadedHTTPServer:
+    handler = type("BoundResolverRequestHandler", (ResolverRequestHandler,),
+                   {"sampler": sampler if sampler is not None else QuantizedTileSampler()})
+    return ThreadedHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    server = makeResolverServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8000)
+    info("Serving tile resolver on " + str(server.server_address))
+    server.serve_forever()
@@ -0,0 +1,147 @@
+"""
+Single file tile storage in an MBTiles style SQLite database.
+Replaces one PNG (and one .missing marker) per tile in a flat directory with one indexed archive,
+which can be read and written by several processes at once.
+"""
+import os
+import sqlite3
+import tempfile
+from contextlib import suppress
+from io import BytesIO
+from logging import info, debug
+from threading import Lock
+from typing import Optional
+
+from PIL import Image
+
+from source.raster_data.tile_math import OSMTile
+from source.raster_data.tile_resolver import AbstractTileImageResolver
+
+
+class TileArchive:
+    def __init__(self, name: str = "osm", path: Optional[str] = None, timeout: float = 30.0):
+        if path is None:
+            basedir = os.path.join(tempfile.gettempdir(), "tilecache")
+            if not os.path.isdir(basedir):
+                os.makedirs(basedir, exist_ok=True)
+            path = os.path.join(basedir, name + ".mbtiles")
+        self.name = name
+        self.path = path
+        self.timeout = timeout
+
+        self._connection = None
+        self._pid = None
+        self._lock = Lock()
+
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+                connection.execute("CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, "
+                                   "tile_row INTEGER, tile_data BLOB, "
+                                   "PRIMARY KEY (zoom_level, tile_column, tile_row))")
+                connection.execute("CREATE TABLE IF NOT EXISTS missing_tiles (zoom_level INTEGER, "
+                                   "tile_column INTEGER, tile_row INTEGER, "
+                                   "PRIMARY KEY (zoom_level, tile_column, tile_row))")
+                connection.execute("INSERT OR IGNORE INTO metadata (name, value) VALUES ('name', ?), ('format', 'png')",
+                                   (name,))
+
+    def _connect(self) -> sqlite3.Connection:
+        # connections must not be shared with forked worker processes
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    @staticmethod
+    def _key(tile: OSMTile):
+        # MBTiles uses the TMS row numbering
+        return tile.zoom, tile.x, (2 ** tile.zoom) - 1 - tile.y
+
+    def get(self, tile: OSMTile) -> Optional[bytes]:
+        key = self._key(tile)
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT tile_data, 0 FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=? "
+                "UNION ALL "
+                "SELECT NULL, 1 FROM missing_tiles WHERE zoom_level=? AND tile_column=? AND tile_row=? LIMIT 1",
+                key + key).fetchone()
+        if row is None:
+            return None
+        if row[1] == 1:
+            raise FileNotFoundError("Tile does not exist")
+        return row[0]
+
+    def put(self, tile: OSMTile, data: bytes):
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR IGNORE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                    self._key(tile) + (sqlite3.Binary(data),))
+
+    def mark_missing(self, tile: OSMTile):
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR IGNORE INTO missing_tiles (zoom_level, tile_column, tile_row) VALUES (?, ?, ?)",
+                    self._key(tile))
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        state['_pid'] = None
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+
+class ArchiveTileCache(AbstractTileImageResolver):
+
+    def __init__(self, fallback: AbstractTileImageResolver, archive: Optional[TileArchive] = None,
+                 locks=[suppress()]):
+        self.fallback = fallback
+        self.archive = archive if archive is not None else TileArchive()
+        self.locks = locks
+
+    def __call__(self, tile: OSMTile) -> Image:
+        mylock = self.locks[0]
+        with mylock:
+            im = self.getCache(tile)
+            if im is not None:
+                return im
+            try:
+                im = self.fallback(tile)
+            except FileNotFoundError:
+                info("Writing " + tile.__str__() + " to missing tiles of " + self.archive.path)
+                self.archive.mark_missing(tile)
+            if im is None:
+                raise FileNotFoundError()
+
+            self.putCache(tile, im)
+            return im
+
+    def getCache(self, tile: OSMTile) -> Optional[Image.Image]:
+        data = self.archive.get(tile)
+        if data is None:
+            return None
+        debug("reading " + tile.__str__() + " from " + self.archive.path)
+        im: Image.Image = Image.open(BytesIO(data))
+        im.load()
+        return im
+
+    def putCache(self, tile: OSMTile, image: Image.Image):
+        buffer = BytesIO()
+        image.save(buffer, "PNG")
+        self.archive.put(tile, buffer.getvalue())
@@ -0,0 +1,136 @@
+"""
+Index of tiles known to be missing, shared by all processes through an append only file.
+Children of a missing tile are treated as missing as well, so the deepest existing ancestor of a tile
+is found by walking its ancestors from zoom 0 downwards, without any exception handling.
+"""
+import os
+import tempfile
+from threading import Lock
+from typing import Optional, Set
+
+import numpy as np
+
+from source.raster_data.tile_math import OSMTile
+
+MAX_INDEX_ZOOM = 29
+
+
+def tileKey(zoom, x, y):
+    return (zoom << 58) | (x << 29) | y
+
+
+def tileKeysNP(zoom: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    return (zoom.astype(np.uint64) << np.uint64(58)) | (x.astype(np.uint64) << np.uint64(29)) | y.astype(np.uint64)
+
+
+class TileAvailabilityIndex:
+
+    def __init__(self, name: str = "osm", path: Optional[str] = None):
+        if path is None:
+            basedir = os.path.join(tempfile.gettempdir(), "tilecache")
+            os.makedirs(basedir, exist_ok=True)
+            path = os.path.join(basedir, name + ".availability")
+        self.path = path
+        with open(self.path, 'ab'):
+            pass
+
+        self._missing: Set[int] = set()
+        self._sorted_keys = np.zeros(0, dtype=np.uint64)
+        self._sorted_dirty = False
+        self._offset = 0
+        self._lock = Lock()
+
+    def _refresh(self):
+        size = os.path.getsize(self.path)
+        if size - self._offset < 8:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read((size - self._offset) // 8 * 8)
+        self._offset += len(data)
+        self._missing.update(np.frombuffer(data, dtype='<u8').tolist())
+        self._sorted_dirty = True
+
+    def _sorted(self) -> np.ndarray:
+        if self._sorted_dirty:
+            self._sorted_keys = np.array(sorted(self._missing), dtype=np.uint64)
+            self._sorted_dirty = False
+        return self._sorted_keys
+
+    @staticmethod
+    def _indexable(tile: OSMTile) -> bool:
+        r = 2 ** tile.zoom
+        return 0 <= tile.zoom <= MAX_INDEX_ZOOM and 0 <= tile.x < r and 0 <= tile.y < r
+
+    def mark_missing(self, tile: OSMTile):
+        if not self._indexable(tile):
+            return
+        key = tileKey(tile.zoom, tile.x, tile.y)
+        with self._lock:
+            self._refresh()
+            if key in self._missing:
+                return
+            # single small appends are atomic, so concurrent writers do not interleave records
+            with open(self.path, 'ab') as f:
+                f.write(np.array([key], dtype='<u8').tobytes())
+            self._missing.add(key)
+            self._sorted_dirty = True
+
+    def deepest_existing_zoom(self, tile: OSMTile) -> int:
+        if not self._indexable(tile):
+            return tile.zoom
+        with self._lock:
+            self._refresh()
+            if len(self._missing) == 0:
+                return tile.zoom
+            for level in range(tile.zoom + 1):
+                shift = tile.zoom - level
+                if tileKey(level, tile.x >> shift, tile.y >> shift) in self._missing:
+                    return level - 1
+        return tile.zoom
+
+    def deepest_existing_ancestor(self, tile: OSMTile) -> Optional[OSMTile]:
+        zoom = self.deepest_existing_zoom(tile)
+        if zoom < 0:
+            return None
+        shift = tile.zoom - zoom
+        return OSMTile(tile.x >> shift, tile.y >> shift, zoom)
+
+    def is_missing(self, tile: OSMTile) -> bool:
+        return self.deepest_existing_zoom(tile) < tile.zoom
+
+    # array version of deepest_existing_zoom, returns -1 where not even the zoom 0 tile exists
+    def existing_zoom(self, zoom: np.ndarray, tile_x: np.ndarray, tile_y: np.ndarray) -> np.ndarray:
+        result = zoom.copy()
+        with self._lock:
+            self._refresh()
+            keys = self._sorted()
+        if keys.size == 0 or zoom.size == 0:
+            return result
+
+        size = np.left_shift(1, np.clip(zoom, 0, MAX_INDEX_ZOOM))
+        valid = (zoom >= 0) & (zoom <= MAX_INDEX_ZOOM) & (tile_x >= 0) & (tile_y >= 0) & \
+                (tile_x < size) & (tile_y < size)
+        for level in range(int(zoom[valid].max(initial=-1)) + 1):
+            active = np.flatnonzero(valid & (result >= level))
+            if active.size == 0:
+                break
+            shift = zoom[active] - level
+            ancestors = tileKeysNP(np.full(active.size, level), tile_x[active] >> shift, tile_y[active] >> shift)
+            position = np.minimum(np.searchsorted(keys, ancestors), keys.size - 1)
+            result[active[keys[position] == ancestors]] = level - 1
+        return result
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._missing)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
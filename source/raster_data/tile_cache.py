@@ -6,11 +6,14 @@ from collections import OrderedDict
 from threading import RLock, current_thread
 from typing import Optional, List, Dict
 
+import numpy as np
 from PIL import Image
 from contextlib import suppress
 
+from source.array_cache import ArrayLRUCache
+from source.raster_data.tile_availability import TileAvailabilityIndex
 from source.raster_data.tile_math import OSMTile
-from source.raster_data.tile_resolver import AbstractTileImageResolver
+from source.raster_data.tile_resolver import AbstractTileImageResolver, tileImageToArray
 
 from logging import debug, info
 
@@ -112,12 +115,14 @@ class FileTileCache(AbstractTileImageResolver):
 class MemoryTileCache(AbstractTileImageResolver):
     storage: Dict[OSMTile, Image.Image]
 
-    def __init__(self, fallback: AbstractTileImageResolver, mem_size=500000, lock=False):
+    def __init__(self, fallback: AbstractTileImageResolver, mem_size=500000, lock=False,
+                 availability: Optional[TileAvailabilityIndex] = None):
 
         self.fallback = fallback
         self.storage = OrderedDict()
         self.mem_size = mem_size
         self.existant_storage = {}
+        self.availability = availability
 
         self.locks = []
         for i in range(1):
@@ -126,6 +131,10 @@ class MemoryTileCache(AbstractTileImageResolver):
             else:
                 self.locks.append(suppress())
 
+    @property
+    def locked(self) -> bool:
+        return not isinstance(self.locks[0], suppress)
+
     def __call__(self, tile: OSMTile) -> Image:
 
         mylock = self.locks[0]
@@ -135,19 +144,105 @@ class MemoryTileCache(AbstractTileImageResolver):
             im = self.storage.get(tile, None)
             if im is not None:
                 return im
-            else:
-                may_exist = self.existant_storage.get(tile, True)
-                if may_exist:
-                    try:
-                        im = self.fallback(tile)
-                    except FileNotFoundError:
-                        self.existant_storage[tile.copy()] = False
-                        raise FileNotFoundError()
-
-                    assert im is not None
-                    self.storage[tile.copy()] = im
-                    while len(self.storage) > self.mem_size:
-                        self.storage.popitem(last=False)
-                    return im
-                else:
-                    raise FileNotFoundError()
+            if not self._may_exist(tile):
+                raise FileNotFoundError()
+            tile = tile.copy()
+
+        # the fallback is resolved outside of the lock so concurrent misses do not serialize
+        try:
+            im = self.fallback(tile)
+        except FileNotFoundError:
+            self._set_missing(tile)
+            raise FileNotFoundError()
+
+        assert im is not None
+        with mylock:
+            self.storage[tile] = im
+            while len(self.storage) > self.mem_size:
+                self.storage.popitem(last=False)
+        return im
+
+    def _may_exist(self, tile: OSMTile) -> bool:
+        if not self.existant_storage.get(tile, True):
+            return False
+        return self.availability is None or not self.availability.is_missing(tile)
+
+    def _set_missing(self, tile: OSMTile):
+        self.existant_storage[tile.copy()] = False
+        if self.availability is not None:
+            self.availability.mark_missing(tile)
+
+
+# keeps tiles as decoded RGBA uint8 arrays and evicts the least recently used ones once max_bytes is exceeded.
+# with a shared ArrayLRUCache the tiles are kept there instead and all caches using it share its byte budget
+class ArrayMemoryTileCache(MemoryTileCache):
+    storage: Dict[OSMTile, np.ndarray]
+
+    def __init__(self, fallback: AbstractTileImageResolver, max_bytes: int = 512 * 1024 * 1024, lock=False,
+                 availability: Optional[TileAvailabilityIndex] = None, shared: Optional[ArrayLRUCache] = None):
+        super(ArrayMemoryTileCache, self).__init__(fallback, lock=lock, availability=availability)
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get(self, tile: OSMTile) -> Optional[np.ndarray]:
+        if self.shared is not None:
+            value = self.shared.get((self, tile))
+            return None if value is None else value[0]
+        data = self.storage.get(tile, None)
+        if data is not None:
+            self.storage.move_to_end(tile)
+        return data
+
+    def _put(self, tile: OSMTile, data: np.ndarray):
+        if self.shared is not None:
+            self.shared.put((self, tile), (data,))
+            return
+        previous = self.storage.pop(tile, None)
+        if previous is not None:
+            self.resident_bytes -= previous.nbytes
+        self.storage[tile] = data
+        self.resident_bytes += data.nbytes
+        while self.resident_bytes > self.max_bytes and len(self.storage) > 1:
+            _, evicted = self.storage.popitem(last=False)
+            self.resident_bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def __call__(self, tile: OSMTile) -> np.ndarray:
+        mylock = self.locks[0]
+
+        with mylock:
+            data = self._get(tile)
+            if data is not None:
+                self.hits += 1
+                return data
+            self.misses += 1
+            if not self._may_exist(tile):
+                raise FileNotFoundError()
+            tile = tile.copy()
+
+        # the fallback is resolved outside of the lock so concurrent misses do not serialize
+        try:
+            im = self.fallback(tile)
+        except FileNotFoundError:
+            self._set_missing(tile)
+            raise FileNotFoundError()
+
+        assert im is not None
+        data = np.ascontiguousarray(tileImageToArray(im))
+
+        with mylock:
+            self._put(tile, data)
+        return data
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "resident_bytes": self.resident_bytes,
+            "tiles": len(self.storage)
+        }
@@ -48,6 +48,14 @@ def XYToLatLng(x:float,y:float,zoom = 0)->LatLng:
     lat_deg = lat_rad * 180.0 / math.pi
     return LatLng(lat_deg,lng_deg)
 
+# array version of XYToLatLng, (2, n) lat and lng
+def XYToLatLngNP(x: np.ndarray, y: np.ndarray, zoom=0) -> np.ndarray:
+    n = np.power(2.0, zoom)
+    lng_deg = x / n * 360.0 - 180
+    lat_rad = np.arctan(np.sinh(math.pi * (1 - 2 * y / n)))
+    lat_deg = lat_rad * 180.0 / math.pi
+    return np.stack([lat_deg, lng_deg], axis=0)
+
 def latlngToXY(latlng: LatLng, zoom: int, ref: List[float]) -> List[float]:
     lat_deg = latlng.lat
     lon_deg = latlng.lng
@@ -72,6 +80,15 @@ def latlngZoomToXYZoomNP(data: np.ndarray) -> np.ndarray:
     return np.stack([x, y, data[2,:]], axis=0)
 
 
+# array version of latlngToXY, keeps the same operation order to produce identical values
+def latlngToXYNP(lat_deg: np.ndarray, lng_deg: np.ndarray, zoom: np.ndarray) -> np.ndarray:
+    lat_rad = lat_deg * math.pi / 180
+    n = np.power(2.0, zoom)
+    x = (lng_deg + 180.0) / 360.0 * n
+    y = (1.0 - np.arcsinh(np.tan(lat_rad)) / math.pi) / 2.0 * n
+    return np.stack([x, y], axis=0)
+
+
 def latlngToTilePixel(latlng: LatLng, zoom: int, tile_size: int = 256, ref: Optional[List[float]] = None) \
         -> List[
             float]:
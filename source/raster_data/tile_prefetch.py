@@ -0,0 +1,84 @@
+"""
+Derives the distinct tiles a render needs before sampling starts and fetches them concurrently,
+so a cold render waits roughly for the slowest tile instead of the sum of all tiles.
+The fetched tiles are kept in a MemoryTileCache for the sampling pass. The prefetch threads write to it concurrently,
+so it has to be created with lock=True.
+TILE_PREFETCH_WORKERS sets the number of threads of the samplers of the embedded mode and the resolver server.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from logging import info, warning
+
+import numpy as np
+
+from source.raster_data.tile_cache import MemoryTileCache
+from source.raster_data.tile_math import OSMTile, latlngToXYNP, tileExists
+from source.raster_data.tile_resolver import AbstractTileImageResolver
+
+PREFETCH_WORKERS = int(os.environ.get("TILE_PREFETCH_WORKERS", 16))
+
+
+# (3, T) array of the distinct (zoom, x, y) tiles containing the given positions
+def planTiles(lat: np.ndarray, lng: np.ndarray, zoom: np.ndarray) -> np.ndarray:
+    xy = latlngToXYNP(lat, lng, zoom)
+    tiles = np.stack([zoom, xy[0, :].astype(int), xy[1, :].astype(int)], axis=0)
+    return np.unique(tiles, axis=1)
+
+
+# only a locked memory cache keeps the prefetched tiles and can be written by several threads
+def canPrefetch(resolver: AbstractTileImageResolver) -> bool:
+    return isinstance(resolver, MemoryTileCache) and resolver.locked
+
+
+class TilePrefetcher:
+
+    def __init__(self, resolver: AbstractTileImageResolver, max_workers: int = 16, max_zoom: int = 19):
+        if not canPrefetch(resolver):
+            raise ValueError("Prefetching needs a MemoryTileCache with lock=True, got " + type(resolver).__name__)
+        self.resolver = resolver
+        self.max_workers = max_workers
+        self.max_zoom = max_zoom
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            self._pid = os.getpid()
+        return self._executor
+
+    def _fetch(self, zoom: int, x: int, y: int) -> bool:
+        try:
+            self.resolver(OSMTile(x, y, zoom))
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            # leave the error to the sampling pass, it raises it in the request context
+            warning("Prefetching " + str(x) + "-" + str(y) + "-" + str(zoom) + " failed: " + str(e))
+        return True
+
+    # fetches all tiles, missing ones are replaced by their parent in the next round like the sampler does
+    def __call__(self, tiles: np.ndarray) -> int:
+        executor = self._get_executor()
+        fetched = 0
+        current = tiles
+        while current.shape[1] > 0:
+            exists = np.array([
+                tileExists(OSMTile(int(x), int(y), int(z)), max_zoom=self.max_zoom) for z, x, y in current.transpose()
+            ], dtype=bool)
+            current = current[:, exists]
+            found = np.array(list(executor.map(self._fetch, current[0, :].tolist(), current[1, :].tolist(),
+                                               current[2, :].tolist())), dtype=bool)
+            fetched += current.shape[1]
+
+            missing = current[:, np.invert(found)]
+            parents = np.stack([missing[0, :] - 1, missing[1, :] >> 1, missing[2, :] >> 1], axis=0)
+            current = np.unique(parents[:, parents[0, :] >= 0], axis=1)
+        info("Prefetched " + str(fetched) + " tiles")
+        return fetched
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        state['_pid'] = None
+        return state
@@ -1,8 +1,10 @@
 import abc
 from io import BytesIO
-from typing import Tuple
+from typing import Tuple, Union, Optional
+import numpy as np
 import requests
 from PIL import Image
+from source.raster_data.tile_availability import TileAvailabilityIndex
 from source.raster_data.tile_math import OSMTile
 
 
@@ -16,6 +18,19 @@ class TileURLResolver():
     def normalized(self) -> str:
         return self.url_format.format("{x}", "{y}", "{z}")
 
+    @staticmethod
+    def from_normalized(normalized: str) -> 'TileURLResolver':
+        return TileURLResolver(normalized.replace("{x}", "{0}").replace("{y}", "{1}").replace("{z}", "{2}"))
+
+
+# decoded (height, width, 4) RGBA uint8 view of a tile, palette tiles are expanded
+def tileImageToArray(tile_image: Union[Image.Image, np.ndarray]) -> np.ndarray:
+    if isinstance(tile_image, np.ndarray):
+        return tile_image
+    if tile_image.mode != 'RGBA':
+        tile_image = tile_image.convert('RGBA')
+    return np.asarray(tile_image)
+
 
 class AbstractTileImageResolver(abc.ABC):
 
@@ -34,14 +49,18 @@ class UniformColorResolver(AbstractTileImageResolver):
 
 
 class HTTPTileFileResolver(AbstractTileImageResolver):
-    def __init__(self, url_resolver: TileURLResolver = TileURLResolver()):
+    def __init__(self, url_resolver: TileURLResolver = TileURLResolver(),
+                 availability: Optional[TileAvailabilityIndex] = None):
         self.url_resolver = url_resolver
+        self.availability = availability
 
         self.non_existing_tiles = {}
 
     def __call__(self, tile) -> Image.Image:
         if tile.__str__() in self.non_existing_tiles:
             raise FileNotFoundError(tile.__str__())
+        if self.availability is not None and self.availability.is_missing(tile):
+            raise FileNotFoundError(tile.__str__())
 
         url = self.url_resolver(tile)
 
@@ -51,6 +70,8 @@ class HTTPTileFileResolver(AbstractTileImageResolver):
             return im
         elif data.status_code == 404:
             self.non_existing_tiles[tile.__str__()] = True
+            if self.availability is not None:
+                self.availability.mark_missing(tile)
             raise FileNotFoundError(tile.__str__())
         else:
             raise EnvironmentError("Status code " + str(data.status_code))
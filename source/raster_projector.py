@@ -1,3 +1,9 @@
+import threading
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple
+
+from source.approximate_inverse import approximateInvertGrid
+from source.array_cache import ArrayLRUCache
 from source.raster_data.abstract_raster_data_provider import AbstractRasterDataProvider
 
 import numpy as np
@@ -14,27 +20,148 @@ class TargetSectionDescription():
         self.ymax = ymax
         self.ysteps = ysteps
 
+    def key(self) -> tuple:
+        return self.xmin, self.xmax, self.xsteps, self.ymin, self.ymax, self.ysteps
+
+    # the x and y positions of the pixel columns and rows, the bounds are included
+    def series(self, dtype: np.dtype = np.float64) -> Tuple[np.ndarray, np.ndarray]:
+        x_series = np.linspace(self.xmin, self.xmax, num=self.xsteps, dtype=dtype)
+        y_series = np.linspace(self.ymin, self.ymax, num=self.ysteps, dtype=dtype)
+        return x_series, y_series
+
+    # the zoom level of the pixels is derived from it
+    def pixel_per_unit(self) -> float:
+        return self.xsteps / (self.xmax - self.xmin)
+
+
+class TiledSectionDescription(TargetSectionDescription):
+    # a block of tiles rendered at once, every tile has the same pixel positions as if it was rendered on its own
+    # the bounds are (min, max) per tile column and row, the columns and rows do not need to be adjacent
+
+    def __init__(self, x_bounds: List[Tuple[float, float]], y_bounds: List[Tuple[float, float]], tile_size: int = 256):
+        super(TiledSectionDescription, self).__init__(x_bounds[0][0], x_bounds[-1][1], len(x_bounds) * tile_size,
+                                                      y_bounds[0][0], y_bounds[-1][1], len(y_bounds) * tile_size)
+        self.x_bounds = list(x_bounds)
+        self.y_bounds = list(y_bounds)
+        self.tile_size = tile_size
+
+    def key(self) -> tuple:
+        return "tiled", tuple(self.x_bounds), tuple(self.y_bounds), self.tile_size
+
+    def series(self, dtype: np.dtype = np.float64) -> Tuple[np.ndarray, np.ndarray]:
+        x_series = np.concatenate([np.linspace(low, high, num=self.tile_size, dtype=dtype)
+                                   for low, high in self.x_bounds])
+        y_series = np.concatenate([np.linspace(low, high, num=self.tile_size, dtype=dtype)
+                                   for low, high in self.y_bounds])
+        return x_series, y_series
+
+    def pixel_per_unit(self) -> float:
+        low, high = self.x_bounds[0]
+        return self.tile_size / (high - low)
+
+
+class ProjectionWorkspace():
+    # scratch buffers reused between calls, one set per thread so concurrent requests do not share memory
+    # a buffer is only valid until the next request of the same name with the same workspace on the same thread
+
+    def __init__(self, max_buffers: int = 16):
+        self.max_buffers = max_buffers
+        self._local = threading.local()
+
+    def get(self, name: str, shape: Tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = OrderedDict()
+        key = (name, shape, np.dtype(dtype).str)
+        buffer = buffers.get(key, None)
+        if buffer is None:
+            buffer = np.empty(shape, dtype=dtype)
+            buffers[key] = buffer
+            while len(buffers) > self.max_buffers:
+                buffers.popitem(last=False)
+        else:
+            buffers.move_to_end(key)
+        return buffer
+
 
 class RasterProjector():
-    def __init__(self, projection: ZoomableProjection, data_source: AbstractRasterDataProvider):
+    # grid_cache is shared between projectors, the inverted grid only depends on the geometry and not on the source
+    # dtype of the target grid, float32 is enough for a tile if the projection is created with the same dtype
+    # with a workspace the returned arrays are scratch buffers that are overwritten by the next projection
+    # with max_error the inverse is interpolated from a lattice with lattice_step pixels, see approximate_inverse
+    def __init__(self, projection: ZoomableProjection, data_source: AbstractRasterDataProvider,
+                 grid_cache: Optional[ArrayLRUCache] = None, dtype: np.dtype = np.float64,
+                 workspace: Optional[ProjectionWorkspace] = None, max_error: Optional[float] = None,
+                 lattice_step: int = 16):
         self.projection = projection
         self.data_source = data_source
+        self.grid_cache = grid_cache
+        self.dtype = np.dtype(dtype)
+        self.workspace = workspace
+        self.max_error = max_error
+        self.lattice_step = lattice_step
+
+    def _buffer(self, name: str, shape: Tuple[int, ...], dtype: np.dtype, scratch: bool = True) -> np.ndarray:
+        if scratch and self.workspace is not None:
+            return self.workspace.get(name, shape, dtype)
+        return np.empty(shape, dtype=dtype)
+
+    def _series(self, trange: TargetSectionDescription) -> Tuple[np.ndarray, np.ndarray]:
+        return trange.series(self.dtype)
+
+    # clipping only depends on y, so whole rows are clipped. the rows are compared in float64, pi rounds up in float32
+    def _row_map(self, trange: TargetSectionDescription, use_clipping: bool) -> np.ndarray:
+        _, y_series = trange.series(np.float64)
+        return np.invert(np.logical_and(use_clipping, np.logical_or(y_series > math.pi, y_series < -math.pi)))
 
     def build_grid(self, trange: TargetSectionDescription) -> np.ndarray:
-        x_series = np.expand_dims(np.linspace(trange.xmin, trange.xmax, num=trange.xsteps), axis=0)
-        y_series = np.expand_dims(np.linspace(trange.ymin, trange.ymax, num=trange.ysteps), axis=1)
-        y_extended = (y_series * np.ones_like(x_series)).flatten()
-        x_extended = (x_series * np.ones_like(y_series)).flatten()
-        stacked = np.stack([x_extended, y_extended], axis=0)
-        return stacked
+        x_series, y_series = self._series(trange)
+        grid = self._buffer("grid", (2, trange.ysteps, trange.xsteps), self.dtype)
+        grid[0] = x_series[np.newaxis, :]
+        grid[1] = y_series[:, np.newaxis]
+        return grid.reshape(2, -1)
 
     def reshape_grid(self, data: np.ndarray, trange: TargetSectionDescription, channels):
         assert data.shape == (channels, trange.xsteps * trange.ysteps)
         data_reshaped = np.reshape(np.transpose(data), (trange.ysteps, trange.xsteps, channels))
         return data_reshaped
 
-    # (y,x,3) array with corresping (lat,lng,zoom) information
-    def project(self, trange: TargetSectionDescription,clip_color =[0,0,0,0]) -> np.ndarray:
+    # (3,n) array of (lat,lng,zoom) for all pixels not clipped and the (n_pixels,) mask of these pixels
+    def project_positions(self, trange: TargetSectionDescription, use_clipping=True,
+                          cache_grid=True) -> Tuple[np.ndarray, np.ndarray]:
+        projection_key = self.projection.cache_key()
+        key = None
+        if cache_grid and self.grid_cache is not None and projection_key is not None:
+            key = (projection_key, trange.key(), use_clipping, self.dtype.name, self.max_error, self.lattice_step)
+            cached = self.grid_cache.get(key)
+            if cached is not None:
+                return cached
+
+        x_series, y_series = self._series(trange)
+        row_map = self._row_map(trange, use_clipping)
+        y_series = y_series[row_map]
+        # cached grids must not live in the workspace
+        scratch = key is None
+        project_map = self._buffer("project_map", (trange.ysteps, trange.xsteps), bool, scratch)
+        project_map[...] = row_map[:, np.newaxis]
+        project_map = project_map.reshape(-1)
+
+        position_and_zoom = self._buffer("position_and_zoom", (3, y_series.shape[0] * trange.xsteps), np.float64,
+                                         scratch)
+        pixel_per_unit = trange.pixel_per_unit()
+        self.projection.getZoomLevelGrid(x_series, y_series, pixel_per_unit, out=position_and_zoom[2])
+        if self.max_error is None:
+            self.projection.invert_grid(x_series, y_series, out=position_and_zoom[0:2])
+        else:
+            position_and_zoom[0:2], _ = approximateInvertGrid(self.projection, x_series, y_series,
+                                                              position_and_zoom[2], self.max_error, self.lattice_step)
+        if key is not None:
+            return self.grid_cache.put(key, (position_and_zoom, project_map))
+        return position_and_zoom, project_map
+
+    # (y,x,channels) array of the sampled colors, out can be a preallocated (y,x,channels) uint8 array
+    def project(self, trange: TargetSectionDescription, clip_color=[0, 0, 0, 0],
+                out: Optional[np.ndarray] = None, cache_grid=True) -> np.ndarray:
 
         use_clipping = True
         if clip_color is not None:
@@ -45,17 +172,36 @@ class RasterProjector():
             use_clipping = False
             clip_color = np.array([0,0,0,0],dtype=np.uint8)
 
-        grid = self.build_grid(trange)
-        clip_map = np.logical_and(use_clipping,  np.logical_or(grid[1,:] > math.pi,grid[1,:] < -math.pi))
-        project_map = np.invert(clip_map)
-        to_project_grid = grid[:,project_map]
-        inverted = self.projection.invert(to_project_grid)
-        pixel_per_unit = trange.xsteps / (trange.xmax - trange.xmin)
-        zoom = np.expand_dims(self.projection.getZoomLevel(to_project_grid, pixel_per_unit), axis=0)
-        position_and_zoom = np.concatenate([inverted, zoom], axis=0)
+        position_and_zoom, _ = self.project_positions(trange, use_clipping, cache_grid)
         data = self.data_source.getData(position_and_zoom)
-        flat = np.repeat(np.expand_dims(clip_color,1),grid.shape[1],1)
-        flat[:,project_map] = data
+        channels = data.shape[0]
+        if out is None:
+            out = self._buffer("out", (trange.ysteps, trange.xsteps, channels), np.uint8)
+        assert out.shape == (trange.ysteps, trange.xsteps, channels) and out.dtype == np.uint8
 
-        data_reshaped = self.reshape_grid(flat, trange, data.shape[0])
-        return data_reshaped
+        # the projected rows are one contiguous block, the rows above and below are clipped
+        rows = np.flatnonzero(self._row_map(trange, use_clipping))
+        first_row, last_row = (rows[0], rows[-1] + 1) if rows.shape[0] > 0 else (0, 0)
+        assert last_row - first_row == rows.shape[0]
+        out[:first_row] = clip_color[:channels]
+        out[last_row:] = clip_color[:channels]
+        out[first_row:last_row] = data.transpose().reshape(last_row - first_row, trange.xsteps, channels)
+        return out
+
+    # yields (first row, (rows,x,channels) array) from top to bottom, so only one band of a large view is in memory
+    # the bands are not put into the grid cache
+    def project_bands(self, trange: TargetSectionDescription, band_height: int = 256,
+                      clip_color=[0, 0, 0, 0]) -> Iterator[Tuple[int, np.ndarray]]:
+        for first_row, band in splitIntoBands(trange, band_height):
+            yield first_row, self.project(band, clip_color, cache_grid=False)
+
+
+# (first row, section) of horizontal bands with band_height rows, the rows are the same as in the complete section
+def splitIntoBands(trange: TargetSectionDescription, band_height: int) -> List[Tuple[int, TargetSectionDescription]]:
+    y_series = np.linspace(trange.ymin, trange.ymax, num=trange.ysteps)
+    bands = []
+    for first_row in range(0, trange.ysteps, band_height):
+        last_row = min(first_row + band_height, trange.ysteps)
+        bands.append((first_row, TargetSectionDescription(trange.xmin, trange.xmax, trange.xsteps, y_series[first_row],
+                                                          y_series[last_row - 1], last_row - first_row)))
+    return bands
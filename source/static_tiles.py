@@ -0,0 +1,42 @@
+"""
+Tiles without any projected content. The tiling spans [-3 pi, 3 pi] in y but only [-pi, pi] is projected, tiles
+outside are answered with one pre-encoded blob per format. Rendered tiles of a single color are stored as the color
+and encoded from the same shared blobs.
+"""
+import math
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+
+from source.flat_tiling import FlatTiling
+from source.image_encoding import encodeImage
+
+CLIP_COLOR = (0, 0, 0, 0)
+# clipped tiles are the same for every view and never change
+STATIC_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+# the projector clips the rows with |y| > pi, the rows include the bounds of the tile
+def isClipped(tiling: FlatTiling, x: int, y: int, zoom: int) -> bool:
+    _, ymin, _, ymax = tiling(x, y, zoom)
+    return ymin > math.pi or ymax < -math.pi
+
+
+# the color of a (height, width, channels) image if all pixels have it
+def uniformColor(image: np.ndarray) -> Optional[Tuple[int, ...]]:
+    first = image[0, 0]
+    if not (image == first).all():
+        return None
+    return tuple(int(value) for value in first)
+
+
+@lru_cache(maxsize=256)
+def encodeUniformTile(color: Tuple[int, ...], fileformat: str, width: int = 256, height: int = 256) -> bytes:
+    image = np.empty((height, width, len(color)), dtype=np.uint8)
+    image[...] = color
+    return encodeImage(image, fileformat)
+
+
+def clippedTile(fileformat: str, width: int = 256, height: int = 256) -> bytes:
+    return encodeUniformTile(CLIP_COLOR, fileformat, width, height)
@@ -1,26 +1,38 @@
 import json
 import os
-from io import BytesIO
-from typing import Dict, Type
+import struct
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Type, TYPE_CHECKING
 
 import math
-from flask import Flask, send_file, request, abort, Response, jsonify
+from flask import Flask, request, abort, Response, jsonify, stream_with_context
 from flask_caching import  Cache
 import logging
 
 from flask_cors import CORS, cross_origin
 
+from source.array_cache import ArrayLRUCache
 from source.complex_log_projection import ComplexLogProjection
+from source.compute_backends import getBackend
 from source.lat_lng import LatLng
 from source.raster_data.abstract_raster_data_provider import AbstractRasterDataProvider
-from source.cache_settings import build_cache_config, make_url_cache_key
+from source.cache_settings import build_cache_config, make_url_cache_key, make_tile_cache_key
 from source.raster_data.remote_raster_data_provider import RemoteRasterDataProvider
-from source.raster_projector import RasterProjector, TargetSectionDescription
+from source.raster_projector import RasterProjector, TargetSectionDescription, ProjectionWorkspace, \
+    TiledSectionDescription
 from source.smoothing_functions import CosCutoffSmoothingFunction, AbstractSmoothingFunction, DualCosSmoothingFunction
 from source.raster_data.tile_resolver import  TileURLResolver
-from PIL import Image
 from source.flat_tiling import FlatTiling
+from source.image_encoding import encodeImage, negotiateFormat, outputFormat, FORMAT_MIMETYPES, PALETTE_SOURCES, \
+    OPAQUE_SOURCES
+from source.png_stream import encodePNGStream
+from source.static_tiles import isClipped, clippedTile, encodeUniformTile, uniformColor, STATIC_CACHE_CONTROL, \
+    CLIP_COLOR
 from server_timing import Timing
+
+if TYPE_CHECKING:
+    from source.parallel_raster_projector import RenderPool
 import numpy as np
 
 app = Flask(__name__)
@@ -34,34 +46,103 @@ from source.hard_coded_providers import get_providers
 
 providers = get_providers()
 
-
-def do_projection(lat1, lng1, lat2, lng2, data_source: AbstractRasterDataProvider, pixel_width=256, pixel_height=256,
-                  xmin=-1, xmax=1, ymin=-1,
-                  ymax=1,
-                  cutoff=math.pi / 6,
-                  smoothing=CosCutoffSmoothingFunction,
-                  fileformat='png'
-                  ):
+# inverted grids are shared between all sources and file formats of the same view
+grid_cache = ArrayLRUCache(int(os.environ.get("GRID_CACHE_BYTES", 128 * 1024 * 1024)))
+# the smoothing is interpolated from a table of this size if set, below 1e-6 relative error for 4097 entries
+smoothing_table_size = int(os.environ.get("SMOOTHING_TABLE_SIZE", 0)) or None
+# PROJECTION_BACKEND numpy, numexpr or numba for the per pixel part of the inverse projection
+compute_backend = getBackend()
+# center independent part of the inverted grids, dragging a center only redoes the affine step and the preprojection
+unit_grid_cache = ArrayLRUCache(int(os.environ.get("UNIT_GRID_CACHE_BYTES", 64 * 1024 * 1024)))
+# float32 halves the memory traffic of the inverse projection, tile pixels stay within a fraction of a pixel
+projection_dtype = np.dtype(os.environ.get("PROJECTION_DTYPE", "float64"))
+# scratch buffers of the projector, the projected image is encoded before the next request reuses them
+workspace = ProjectionWorkspace()
+# /projection renders on this many processes if larger than 1, one pool per source is created on first use
+projection_processes = int(os.environ.get("PROJECTION_PROCESSES", 1))
+# the parallel projector uses multiprocessing.shared_memory of Python 3.8 and is only imported if it is used
+render_pools: Dict[str, "RenderPool"] = {}
+
+
+def get_render_pool(data_source: AbstractRasterDataProvider) -> "RenderPool":
+    from source.parallel_raster_projector import RenderPool
+    names = [name for name, provider in providers.items() if provider is data_source]
+    if len(names) == 0:
+        raise ValueError("Render pools are only created for the registered providers")
+    name = names[0]
+    if name not in render_pools:
+        render_pools[name] = RenderPool(data_source, projection_processes)
+    return render_pools[name]
+
+
+# projections are not changed after construction, all tiles of a view share one
+@lru_cache(maxsize=64)
+def get_projection(lat1, lng1, lat2, lng2, cutoff, smoothing) -> ComplexLogProjection:
+    return ComplexLogProjection(LatLng(lat1, lng1), LatLng(lat2, lng2), cutoff,
+                                smoothing_function_type=smoothing, dtype=projection_dtype,
+                                unit_grid_cache=unit_grid_cache, smoothing_table_size=smoothing_table_size,
+                                backend=compute_backend)
+
+
+def render_projection(lat1, lng1, lat2, lng2, data_source: AbstractRasterDataProvider, pixel_width=256,
+                      pixel_height=256, xmin=-1, xmax=1, ymin=-1, ymax=1,
+                      cutoff=math.pi / 6,
+                      smoothing=CosCutoffSmoothingFunction,
+                      parallel=False,
+                      trange: Optional[TargetSectionDescription] = None
+                      ) -> np.ndarray:
     with t.time("setup"):
-        trange = TargetSectionDescription(xmin, xmax, pixel_width, ymin, ymax, pixel_height)
-        c1 = LatLng(lat1, lng1)
-        c2 = LatLng(lat2, lng2)
-        proj = ComplexLogProjection(c1, c2, cutoff,
-                                    smoothing_function_type=smoothing)
-        projector = RasterProjector(proj, data_source)
+        if trange is None:
+            trange = TargetSectionDescription(xmin, xmax, pixel_width, ymin, ymax, pixel_height)
+        proj = get_projection(lat1, lng1, lat2, lng2, cutoff, smoothing)
+        if parallel and projection_processes > 1:
+            from source.parallel_raster_projector import ParallelRasterProjector
+            projector = ParallelRasterProjector(proj, data_source, pool=get_render_pool(data_source),
+                                                dtype=projection_dtype)
+        else:
+            projector = RasterProjector(proj, data_source, grid_cache=grid_cache, dtype=projection_dtype,
+                                        workspace=workspace)
 
     with t.time("projection"):
-        d = projector.project(trange)
-    with t.time("parse_result"):
-        pilim = Image.fromarray(d)
+        return projector.project(trange)
+
+
+def encode_image(d: np.ndarray, fileformat: str) -> bytes:
     with t.time("convert_to_format"):
-        img_io = BytesIO()
-        pilim.save(img_io,fileformat)
-        img_io.seek(0)
-    return send_file(img_io, mimetype='image/'+fileformat)
+        return encodeImage(d, fileformat, quantize=parse_source_name(request.args) in PALETTE_SOURCES)
+
+
+# encoded images are not compressed again by the gzip route of uwsgi, see uwsgi.ini
+def image_response(data, fileformat: str, cache_control: str = "no-transform", vary_accept: bool = False) -> Response:
+    response = Response(data, mimetype=FORMAT_MIMETYPES[fileformat])
+    response.headers['Cache-Control'] = cache_control
+    if vary_accept:
+        response.headers['Vary'] = 'Accept'
+    return response
+
+
+def do_projection(lat1, lng1, lat2, lng2, data_source: AbstractRasterDataProvider, fileformat='png',
+                  **projection_args):
+    d = render_projection(lat1, lng1, lat2, lng2, data_source, **projection_args)
+    fileformat = outputFormat(fileformat, d)
+    return image_response(encode_image(d, fileformat), fileformat)
+
+
+# renders the view in horizontal bands and sends every band as soon as it is encoded, memory is bounded by the band
+def do_streamed_projection(lat1, lng1, lat2, lng2, data_source: AbstractRasterDataProvider, pixel_width=256,
+                           pixel_height=256, xmin=-1, xmax=1, ymin=-1, ymax=1,
+                           cutoff=math.pi / 6,
+                           smoothing=CosCutoffSmoothingFunction,
+                           band_height=256):
+    trange = TargetSectionDescription(xmin, xmax, pixel_width, ymin, ymax, pixel_height)
+    proj = get_projection(lat1, lng1, lat2, lng2, cutoff, smoothing)
+    projector = RasterProjector(proj, data_source, dtype=projection_dtype, workspace=workspace)
+    bands = (band for _, band in projector.project_bands(trange, band_height))
+    return image_response(stream_with_context(encodePNGStream(pixel_width, pixel_height, bands)), 'png')
 
 
 # sample http://127.0.0.1:5000/projection/lat1/10.0/lng1/10.0/lat2/0.0/lng2/0.0.png
+# with ?stream=1 the image is rendered and sent in bands
 @app.route(
     "/projection/lat1/<float(signed=True):lat1>/lng1/<float(signed=True):lng1>/" +
     "lat2/<float(signed=True):lat2>/lng2/<float(signed=True):lng2>.png")
@@ -70,34 +151,229 @@ def projection(lat1, lng1, lat2, lng2):
     additional_dict = parse_request_args(request.args)
     additional_dict.update(parse_angle(request.args))
     data_source = parse_source(request.args)
-    return do_projection(lat1, lng1, lat2, lng2, data_source, **additional_dict)
+    if request.args.get('stream', '0') in ['1', 'true']:
+        if 'band_height' in request.args:
+            # the image is already being sent when the first band fails
+            try:
+                additional_dict['band_height'] = int(request.args['band_height'])
+            except ValueError:
+                additional_dict['band_height'] = 0
+            if additional_dict['band_height'] < 1:
+                return "band_height needs to be an integer of at least 1", 400
+        return do_streamed_projection(lat1, lng1, lat2, lng2, data_source, **additional_dict)
+    return do_projection(lat1, lng1, lat2, lng2, data_source, parallel=True, **additional_dict)
 
 
 tiling = FlatTiling(3 * math.pi)
+tile_size = 256
+tile_formats = ["png", "webp", "jpeg", "jpg", "auto"]
+tile_cache_timeout = 60*60*24*7
+# a tile request renders the block of METATILE_SIZE x METATILE_SIZE tiles it lies in with one projection,
+# rounded down to a power of two so the blocks are aligned with the pyramid
+metatile_size = 2 ** int(math.log2(max(1, int(os.environ.get("METATILE_SIZE", 1)))))
+metatile_lock_timeout = 30
 
 
 @app.route(
     "/tile/lat1/<float(signed=True):lat1>/lng1/<float(signed=True):lng1>/" +
     "lat2/<float(signed=True):lat2>/lng2/<float(signed=True):lng2>/cutoff/<float:cutoff>/smoothing/<smoothing>/<int:zoom>/<int(signed=True):x>/<int(signed=True):y>.<string:fileformat>")
-@cache.cached(timeout=60*60*24*7,key_prefix=make_url_cache_key)
 def tile(lat1, lng1, lat2, lng2, cutoff, smoothing, zoom, x, y,fileformat):
-    allowed_formats =  ["png","webp"]
-    if fileformat not in allowed_formats:
-        return "file format needs to by of type " + str(allowed_formats), 400
-    xmin, ymin, xmax, ymax = tiling(x, y, zoom)
-    ad = {}
-    logging.info("Rendering tile with ({0},{1}) to ({2},{3})".format(xmin, ymin, xmax, ymax))
+    if fileformat not in tile_formats:
+        return "file format needs to by of type " + str(tile_formats), 400
+    negotiated = fileformat == "auto"
+    fileformat = negotiateFormat(fileformat, request.headers.get("Accept", ""),
+                                 parse_source_name(request.args) in OPAQUE_SOURCES)
+    # outside of the projected range, nothing to render or cache
+    if isClipped(tiling, x, y, zoom):
+        fileformat = "png" if fileformat == "jpeg" else fileformat
+        return image_response(clippedTile(fileformat), fileformat, STATIC_CACHE_CONTROL + ", no-transform", negotiated)
+
+    key = make_tile_cache_key(lat1, lng1, lat2, lng2, cutoff, smoothing, parse_source_name(request.args), zoom, x, y,
+                              fileformat)
+    cached = cache.get(key)
+    if cached is None:
+        rendered = render_metatile(lat1, lng1, lat2, lng2, cutoff, smoothing, zoom, x, y, fileformat, key)
+        if rendered is None:
+            return "" ,500
+        cached = rendered[(x, y)]
+    fileformat, data = cached
+    if isinstance(data, tuple):
+        data = encodeUniformTile(data, fileformat)
+    return image_response(data, fileformat, vary_accept=negotiated)
+
+
+# renders the aligned block of metatile_size x metatile_size tiles around the tile and caches all of them.
+# other requests for the block wait for the rendering request instead of rendering it again
+# returns the cached values of the tiles by (x, y), at least of the tile, None if the source could not be resolved
+def render_metatile(lat1, lng1, lat2, lng2, cutoff, smoothing, zoom, x, y, fileformat, key):
+    source_name = parse_source_name(request.args)
+    size = min(metatile_size, 2 ** zoom)
+    block_x, block_y = x - x % size, y - y % size
+
+    lock = make_tile_cache_key(lat1, lng1, lat2, lng2, cutoff, smoothing, source_name, zoom, block_x, block_y,
+                               fileformat + ".lock" + str(size))
+    acquired = cache.add(lock, True, timeout=metatile_lock_timeout)
+    deadline = time.time() + metatile_lock_timeout
+    while not acquired and time.time() < deadline:
+        time.sleep(0.05)
+        cached = cache.get(key)
+        if cached is not None:
+            return {(x, y): cached}
+        # the rendering request failed, take over its lock
+        if cache.get(lock) is None:
+            acquired = cache.add(lock, True, timeout=metatile_lock_timeout)
+    # after the timeout the block is rendered anyway, the lock stays with the request holding it
+
+    try:
+        tiles = render_tiles(lat1, lng1, lat2, lng2, cutoff, smoothing, zoom, range(block_x, block_x + size),
+                             range(block_y, block_y + size), fileformat)
+        if tiles is None:
+            return None
+        store_tiles(lat1, lng1, lat2, lng2, cutoff, smoothing, source_name, zoom, tiles, fileformat)
+    finally:
+        if acquired:
+            cache.delete(lock)
+    return tiles
+
+
+def store_tiles(lat1, lng1, lat2, lng2, cutoff, smoothing, source_name, zoom, tiles, fileformat):
+    cache.set_many({make_tile_cache_key(lat1, lng1, lat2, lng2, cutoff, smoothing, source_name, zoom, tile_x, tile_y,
+                                        fileformat): value
+                    for (tile_x, tile_y), value in tiles.items() if not isClipped(tiling, tile_x, tile_y, zoom)},
+                   timeout=tile_cache_timeout)
+
+
+# the format and the encoded tile or the color of a tile with a single color for every tile of the columns and rows,
+# rendered with one projection. None if the source could not be resolved
+def render_tiles(lat1, lng1, lat2, lng2, cutoff, smoothing, zoom, columns, rows, fileformat):
+    columns, rows = list(columns), list(rows)
+    x_bounds = [tiling(tile_x, rows[0], zoom)[0::2] for tile_x in columns]
+    y_bounds = [tiling(columns[0], tile_y, zoom)[1::2] for tile_y in rows]
+    trange = TiledSectionDescription(x_bounds, y_bounds, tile_size)
+    logging.info("Rendering {}x{} tiles with ({},{}) to ({},{})".format(len(columns), len(rows), trange.xmin,
+                                                                        trange.ymin, trange.xmax, trange.ymax))
     source = parse_source(request.args)
 
     for i in range(5):
         try:
-            projected = do_projection(lat1, lng1, lat2, lng2, source, xmin=xmin, ymin=ymin, xmax=xmax, ymax=ymax,cutoff= math.radians(cutoff),smoothing=parse_smoothing(smoothing),fileformat=fileformat)
-            return projected
+            d = render_projection(lat1, lng1, lat2, lng2, source, cutoff=math.radians(cutoff),
+                                  smoothing=parse_smoothing(smoothing), trange=trange)
+            break
         except ConnectionError as e:
             logging.warning(e)
-
-    logging.warning(request.url +" "+ str(request.args) +  "could not be resolved!")
-    return "" ,500
+    else:
+        logging.warning(request.url +" "+ str(request.args) +  "could not be resolved!")
+        return None
+
+    tiles = {}
+    for j, tile_y in enumerate(rows):
+        for i, tile_x in enumerate(columns):
+            image = d[j * tile_size:(j + 1) * tile_size, i * tile_size:(i + 1) * tile_size]
+            tile_format = outputFormat(fileformat, image)
+            color = uniformColor(image)
+            tiles[(tile_x, tile_y)] = (tile_format, color if color is not None else encode_image(image, tile_format))
+    return tiles
+
+
+# splits the tiles of one zoom level into blocks of columns and rows that are rendered with one projection each.
+# a block holds all combinations of its columns and rows, at most max_tiles. scattered tiles are grouped per row
+# instead of rendering the whole bounding grid
+def plan_blocks(tiles, max_tiles: int):
+    columns = sorted({tile_x for tile_x, _ in tiles})
+    rows = sorted({tile_y for _, tile_y in tiles})
+    if len(columns) * len(rows) <= 2 * len(tiles):
+        groups = [(columns, rows)]
+    else:
+        by_row = {}
+        for tile_x, tile_y in tiles:
+            by_row.setdefault(tile_y, []).append(tile_x)
+        groups = [(sorted(row), [tile_y]) for tile_y, row in sorted(by_row.items())]
+
+    blocks = []
+    for group_columns, group_rows in groups:
+        for i in range(0, len(group_columns), max_tiles):
+            block_columns = group_columns[i:i + max_tiles]
+            num_rows = max(1, max_tiles // len(block_columns))
+            for j in range(0, len(group_rows), num_rows):
+                blocks.append((block_columns, group_rows[j:j + num_rows]))
+    return blocks
+
+
+max_batch_tiles = 256
+# the misses of a batch are rendered in blocks of at most this many tiles, 64 tiles are 4M pixels
+max_block_tiles = 64
+_batch_format_codes = {"png": 0, "webp": 1, "jpeg": 2}
+
+
+# POST {"tiles": [[zoom, x, y], ...]} of one view. cache hits are fetched with one multi get and the misses of
+# every zoom level are rendered together in blocks, without waiting for the metatile locks of /tile.
+# the response is the number of tiles as uint32 followed by zoom (uint8), x and y (int32),
+# format (uint8, 0 png, 1 webp, 2 jpeg), length (uint32) and the image for every requested tile,
+# all big endian. tiles that could not be rendered have length 0
+@app.route(
+    "/tiles/lat1/<float(signed=True):lat1>/lng1/<float(signed=True):lng1>/" +
+    "lat2/<float(signed=True):lat2>/lng2/<float(signed=True):lng2>/cutoff/<float:cutoff>/smoothing/<smoothing>" +
+    ".<string:fileformat>", methods=['POST'])
+def tiles(lat1, lng1, lat2, lng2, cutoff, smoothing, fileformat):
+    if fileformat not in tile_formats:
+        return "file format needs to by of type " + str(tile_formats), 400
+    json_i = request.get_json(force=True, silent=True)
+    if json_i is None or "tiles" not in json_i:
+        return "Could not parse JSON", 400
+    try:
+        requested = [(int(zoom), int(x), int(y)) for zoom, x, y in json_i["tiles"]]
+    except (TypeError, ValueError):
+        return "tiles need to be [zoom, x, y] lists", 400
+    # x and y are sent back as int32
+    if any(zoom < 0 or zoom > 31 for zoom, _, _ in requested):
+        return "zoom needs to be between 0 and 31", 400
+    if any(not (0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom) for zoom, x, y in requested):
+        return "x and y need to be between 0 and 2^zoom - 1", 400
+    if len(requested) > max_batch_tiles:
+        return "at most " + str(max_batch_tiles) + " tiles per request", 400
+
+    source_name = parse_source_name(request.args)
+    negotiated = fileformat == "auto"
+    fileformat = negotiateFormat(fileformat, request.headers.get("Accept", ""), source_name in OPAQUE_SOURCES)
+
+    values = {}
+    keys = {}
+    for zoom, x, y in requested:
+        if isClipped(tiling, x, y, zoom):
+            values[(zoom, x, y)] = ("png" if fileformat == "jpeg" else fileformat, CLIP_COLOR)
+        else:
+            keys[(zoom, x, y)] = make_tile_cache_key(lat1, lng1, lat2, lng2, cutoff, smoothing, source_name, zoom, x,
+                                                     y, fileformat)
+    if len(keys) > 0:
+        for requested_tile, value in zip(keys.keys(), cache.get_many(*keys.values())):
+            if value is not None:
+                values[requested_tile] = value
+    # the misses of every zoom level are rendered together, one projection per block
+    misses = {}
+    for zoom, x, y in requested:
+        if (zoom, x, y) not in values:
+            misses.setdefault(zoom, set()).add((x, y))
+    for zoom, tiles_of_zoom in misses.items():
+        for columns, rows in plan_blocks(tiles_of_zoom, max_block_tiles):
+            rendered = render_tiles(lat1, lng1, lat2, lng2, cutoff, smoothing, zoom, columns, rows, fileformat)
+            if rendered is None:
+                continue
+            store_tiles(lat1, lng1, lat2, lng2, cutoff, smoothing, source_name, zoom, rendered, fileformat)
+            for (tile_x, tile_y), value in rendered.items():
+                values.setdefault((zoom, tile_x, tile_y), value)
+
+    body = [struct.pack(">I", len(requested))]
+    for zoom, x, y in requested:
+        tile_format, data = values.get((zoom, x, y), (fileformat, b""))
+        if isinstance(data, tuple):
+            data = encodeUniformTile(data, tile_format)
+        body.append(struct.pack(">BiiBI", zoom, x, y, _batch_format_codes[tile_format], len(data)))
+        body.append(data)
+    response = Response(b"".join(body), mimetype="application/octet-stream")
+    response.headers['Cache-Control'] = "no-transform"
+    if negotiated:
+        response.headers['Vary'] = 'Accept'
+    return response
 
 
 @app.route(
@@ -108,9 +384,7 @@ def resolve(lat1, lng1, lat2, lng2, cutoff, smoothing, clickLat, clickLng):
     proj = ComplexLogProjection(LatLng(lat1, lng1), LatLng(lat2, lng2), math.radians(cutoff),
                                 smoothing_function_type=parse_smoothing(smoothing))
 
-    x, y = tiling.from_leaflet_LatLng(LatLng(clickLat, clickLng))
-
-    xy = np.array([[x], [y]])
+    xy = tiling.from_leaflet_NP(np.array([[clickLat], [clickLng]], dtype=float))
     latlng_data = proj.invert(xy)
 
 
@@ -146,14 +420,11 @@ def from_leaflet(lat1, lng1, lat2, lng2, cutoff, smoothing):
                                 smoothing_function_type=parse_smoothing(smoothing))
 
     elements =  json_i['data']
-    ret_v = []
-    for e in elements:
-        x, y = tiling.from_leaflet_LatLng(LatLng(e['lat'], e['lng']))
-        xy = np.array([[x], [y]])
-        latlng_data = proj.invert(xy)
-        assert latlng_data.shape == (2, 1)
-        ret_element = {"lat": latlng_data[0, 0], "lng": latlng_data[1, 0]}
-        ret_v.append(ret_element)
+    # all points in one pass
+    latlng = np.array([[e['lat'] for e in elements], [e['lng'] for e in elements]], dtype=float).reshape(2, -1)
+    latlng_data = proj.invert(tiling.from_leaflet_NP(latlng))
+    assert latlng_data.shape == latlng.shape
+    ret_v = [{"lat": lat, "lng": lng} for lat, lng in zip(latlng_data[0].tolist(), latlng_data[1].tolist())]
     response = app.response_class(
         response=json.dumps({"data":ret_v}),
         status=200,
@@ -186,21 +457,16 @@ def to_leaflet(lat1, lng1, lat2, lng2, cutoff, smoothing):
     center_distance = c1latlng.distanceTo(c2latlng)
     pixel_per_m =  256.0/(156412.0)
     elements =  json_i['data']
-    ret_v = []
-    for e in elements:
-        xy = np.array([[e[0]], [e[0]]])
-        xy,clipping = proj(xy,calculate_clipping=True)
-        z = proj.getZoomLevel(xy,pixel_per_m)
-        latlng = tiling.to_leaflet_LatLng(xy[0,0],xy[1,0])
+    # [lat, lng] pairs, all points in one pass
+    latlng = np.array([[e[0] for e in elements], [e[1] for e in elements]], dtype=float).reshape(2, -1)
+    xy,clipping = proj(latlng,calculate_clipping=True)
+    z = np.round(proj.getZoomLevel(xy,pixel_per_m), precision)
+    latlng = np.round(tiling.to_leaflet_NP(xy), precision)
 
-        clipping = bool(clipping[0])
+    ret_v = [list(e) for e in zip(latlng[0].tolist(), latlng[1].tolist(), z.tolist(), clipping.tolist())]
 
-        ret_element = [ round(latlng.lat,precision), round(latlng.lng,precision),round(z[0],precision),clipping]
-        ret_v.append(ret_element)
-
-    z_values = list(map(lambda x:x[2],ret_v))
-    min_z = min(*z_values)
-    max_z = max(*z_values)
+    min_z = float(z.min()) if z.size > 0 else None
+    max_z = float(z.max()) if z.size > 0 else None
     response = app.response_class(
         response=json.dumps({"data":ret_v,"min_z":min_z,"max_z":max_z},check_circular=False,indent=None),
         status=200,
@@ -280,26 +546,18 @@ def cities_projected(lat1, lng1, lat2, lng2, cutoff, smoothing):
     with t.time("zoomlevel"):
         z = proj.getZoomLevel(xy, pixel_per_m)
     with t.time("tiling"):
-        latlngs = [None] * num_cities
-        for i in range(num_cities):
-
-            latlng = tiling.to_leaflet_LatLng(xy[0,i],xy[1,i])
-            latlngs[i]=latlng
+        latlngs = tiling.to_leaflet_NP(xy)
     with t.time("packaging"):
-        ret_v = [None] * num_cities
         p_x_int = 10**precision
         p_x_float = 10.**precision
-        my_round = lambda x:int(x*(p_x_int))/(p_x_float)
-        for i in range(num_cities):
-            clipping_v = bool(clipping[i])
-            latlng = latlngs[i]
-            ret_element = [ my_round(latlng.lat), my_round(latlng.lng),my_round(z[i]),clipping_v]
-            ret_v[i] =ret_element
+        # truncated to the precision
+        my_round = lambda x:np.trunc(x*(p_x_int))/(p_x_float)
+        ret_v = [list(e) for e in zip(my_round(latlngs[0]).tolist(), my_round(latlngs[1]).tolist(),
+                                      my_round(z).tolist(), clipping.tolist())]
 
     with t.time("assembly"):
-        z_values = list(map(lambda x:x[2],ret_v))
-        min_z = min(*z_values)
-        max_z = max(*z_values)
+        min_z = float(my_round(z).min()) if num_cities > 0 else None
+        max_z = float(my_round(z).max()) if num_cities > 0 else None
         response = app.response_class(
             response=json.dumps({"data":ret_v,"min_z":min_z,"max_z":max_z},check_circular=False,indent=None),
             status=200,
@@ -339,6 +597,7 @@ def parse_request_args(args: request) -> Dict:
         additional_dict['ymin'] = -v
         additional_dict['ymax'] = v
 
+    return additional_dict
 
 
 def parse_angle(args) -> Dict:
@@ -350,6 +609,10 @@ def parse_angle(args) -> Dict:
 
     return additional_dict
 
+def parse_source_name(args) -> str:
+    return args.get('source', 'default')
+
+
 def parse_source(args) -> AbstractRasterDataProvider:
     data_source = providers.get("default", None)
     if 'source' in args:
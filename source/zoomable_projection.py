@@ -1,4 +1,6 @@
 import abc
+from typing import Hashable, Optional
+
 import numpy as np
 
 
@@ -16,6 +18,31 @@ class ZoomableProjection(abc.ABC):
     def getZoomLevel(self, data: np.ndarray, pixel_per_unit: float) -> np.ndarray:
         pass
 
+    # inverse of the regular grid spanned by x_series and y_series, flattened in row major order like
+    # RasterProjector.build_grid, written into out if given
+    def invert_grid(self, x_series: np.ndarray, y_series: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        return _assign(self.invert(_flat_grid(x_series, y_series)), out)
+
+    def getZoomLevelGrid(self, x_series: np.ndarray, y_series: np.ndarray, pixel_per_unit: float,
+                         out: Optional[np.ndarray] = None) -> np.ndarray:
+        return _assign(self.getZoomLevel(_flat_grid(x_series, y_series), pixel_per_unit), out)
+
+    # key of the inverse projection for caching grids, None if the projection can not be cached
+    def cache_key(self) -> Optional[Hashable]:
+        return None
+
+
+def _flat_grid(x_series: np.ndarray, y_series: np.ndarray) -> np.ndarray:
+    x, y = np.meshgrid(x_series, y_series)
+    return np.stack([x.flatten(), y.flatten()], axis=0)
+
+
+def _assign(result: np.ndarray, out: Optional[np.ndarray]) -> np.ndarray:
+    if out is None:
+        return result
+    out[...] = result
+    return out
+
 
 class IdentityProjection(ZoomableProjection):
     def __call__(self, data: np.ndarray) -> np.ndarray:
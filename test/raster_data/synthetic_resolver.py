@@ -0,0 +1,23 @@
+import numpy as np
+from PIL import Image
+
+from source.raster_data.tile_math import OSMTile
+from source.raster_data.tile_resolver import AbstractTileImageResolver
+
+
+class GradientResolver(AbstractTileImageResolver):
+    # every pixel encodes its position and tile, tiles deeper than max_existing_zoom in the western half are missing
+    def __init__(self, max_existing_zoom: int = 6):
+        self.max_existing_zoom = max_existing_zoom
+        self.calls = 0
+
+    def __call__(self, tile: OSMTile) -> Image:
+        self.calls += 1
+        if tile.zoom > self.max_existing_zoom and tile.x < 2 ** (tile.zoom - 1):
+            raise FileNotFoundError(tile.__str__())
+        ramp = np.arange(256, dtype=np.uint8)
+        data = np.zeros((256, 256, 3), dtype=np.uint8)
+        data[:, :, 0] = ramp[np.newaxis, :]
+        data[:, :, 1] = ramp[:, np.newaxis]
+        data[:, :, 2] = (tile.x * 7 + tile.y * 13 + tile.zoom * 31) % 256
+        return Image.fromarray(data)
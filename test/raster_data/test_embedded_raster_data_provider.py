@@ -0,0 +1,58 @@
+import threading
+import unittest
+
+import numpy as np
+
+from source.hard_coded_providers import get_providers
+from source.raster_data.embedded_raster_data_provider import EmbeddedRasterDataProvider
+from source.raster_data.remote_raster_data_provider import RemoteRasterDataProvider
+from source.raster_data.resolver_server import makeResolverServer, QuantizedTileSampler
+from source.raster_data.tile_resolver import TileURLResolver
+from test.raster_data.synthetic_resolver import GradientResolver
+from test.raster_data.test_resolver_protocol import grid_positions
+
+
+class FailingResolver(GradientResolver):
+    def __call__(self, tile):
+        raise ConnectionError("Tile server unreachable")
+
+
+class TestEmbeddedRasterDataProvider(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.resolver = GradientResolver(max_existing_zoom=10)
+        cls.server = makeResolverServer(QuantizedTileSampler(lambda template: cls.resolver), port=0)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.address = '127.0.0.1:' + str(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_same_as_remote(self):
+        positions = grid_positions()
+        remote = RemoteRasterDataProvider(TileURLResolver(), server=self.address, protocol=2).getData(positions)
+        embedded = EmbeddedRasterDataProvider(TileURLResolver(), resolver_factory=lambda template: self.resolver,
+                                              server=self.address).getData(positions)
+        assert embedded.shape == (4, positions.shape[1]) and embedded.dtype == np.uint8
+        np.testing.assert_array_equal(embedded, remote)
+
+    def test_fallback_to_remote(self):
+        positions = grid_positions(30, 20)
+        remote = RemoteRasterDataProvider(TileURLResolver(), server=self.address).getData(positions)
+        provider = EmbeddedRasterDataProvider(TileURLResolver(), resolver_factory=lambda template: FailingResolver(),
+                                              server=self.address)
+        np.testing.assert_array_equal(provider.getData(positions), remote)
+
+        provider = EmbeddedRasterDataProvider(TileURLResolver(), resolver_factory=lambda template: FailingResolver(),
+                                              server=self.address, fallback_to_remote=False)
+        with self.assertRaises(ConnectionError):
+            provider.getData(positions)
+
+    def test_get_providers(self):
+        assert type(get_providers("remote")['osm']) == RemoteRasterDataProvider
+        assert type(get_providers("embedded")['osm']) == EmbeddedRasterDataProvider
+        with self.assertRaises(ValueError):
+            get_providers("nonsense")
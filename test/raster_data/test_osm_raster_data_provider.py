@@ -0,0 +1,41 @@
+import unittest
+
+import numpy as np
+
+from source.raster_data.osm_raster_data_provider import _sample, _sample_vectorized, OSMRasterDataProvider
+from source.raster_data.tile_resolver import UniformColorResolver
+from test.raster_data.synthetic_resolver import GradientResolver
+
+
+def random_positions(num: int, max_zoom: float = 12) -> np.ndarray:
+    rnd = np.random.RandomState(42)
+    return np.stack([
+        rnd.uniform(-80, 80, num),
+        rnd.uniform(-180, 179.9, num),
+        rnd.uniform(-1, max_zoom, num)
+    ], axis=0)
+
+
+class TestOSMRasterDataProvider(unittest.TestCase):
+
+    def test_vectorized_equals_reference(self):
+        positions = random_positions(5000)
+        init_data = (GradientResolver(), 0, 19)
+        np.testing.assert_array_equal(_sample_vectorized(positions, init_data), _sample(positions, init_data))
+
+    def test_vectorized_equals_reference_palette(self):
+        positions = random_positions(500)
+        init_data = (UniformColorResolver((10, 20, 30)), 1, 8)
+        np.testing.assert_array_equal(_sample_vectorized(positions, init_data), _sample(positions, init_data))
+
+    def test_resolves_each_tile_once(self):
+        positions = np.stack([
+            np.linspace(47.60, 47.61, 1000),
+            np.linspace(9.10, 9.11, 1000),
+            np.full(1000, 5.5)
+        ], axis=0)
+        resolver = GradientResolver()
+        provider = OSMRasterDataProvider(resolver)
+        res = provider.getData(positions)
+        assert res.shape == (3, 1000)
+        assert resolver.calls == 1
@@ -0,0 +1,126 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import uuid
+
+import numpy as np
+
+from source.raster_data.raw_tile_cache import RawTileCache
+from source.raster_data.tile_cache import FileTileCache, TileFilenameResolver, ArrayMemoryTileCache
+from source.raster_data.tile_math import OSMTile
+from source.raster_data.tile_resolver import tileImageToArray
+from test.raster_data.synthetic_resolver import GradientResolver
+
+
+class TestRawTileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_roundtrip(self):
+        resolver = GradientResolver()
+        cache = RawTileCache(resolver, basedir=self.tempdir.name)
+        tiles = [OSMTile(x, y, 2) for x in range(4) for y in range(2)]
+        expected = [tileImageToArray(resolver(t)) for t in tiles]
+        for t in tiles:
+            cache(t)
+
+        reopened = RawTileCache(resolver, basedir=self.tempdir.name)
+        calls = resolver.calls
+        for t, e in zip(tiles, expected):
+            view = reopened(t)
+            assert isinstance(view, np.memmap)
+            assert not view.flags.writeable
+            np.testing.assert_array_equal(view, e)
+        assert resolver.calls == calls
+
+    def test_missing(self):
+        resolver = GradientResolver(max_existing_zoom=0)
+        cache = RawTileCache(resolver, basedir=self.tempdir.name)
+        with self.assertRaises(FileNotFoundError):
+            cache(OSMTile(0, 0, 1))
+        with self.assertRaises(FileNotFoundError):
+            RawTileCache(resolver, basedir=self.tempdir.name)(OSMTile(0, 0, 1))
+        assert resolver.calls == 1
+
+    def test_below_memory_cache(self):
+        cache = ArrayMemoryTileCache(RawTileCache(GradientResolver(), basedir=self.tempdir.name))
+        data = cache(OSMTile(1, 1, 1))
+        assert data.shape == (256, 256, 4)
+
+    def test_stale_slot_reclaimed(self):
+        resolver = GradientResolver()
+        cache = RawTileCache(resolver, basedir=self.tempdir.name)
+        crashed = subprocess.Popen([sys.executable, "-c", "pass"])
+        crashed.wait()
+        connection = cache._connect()
+        connection.execute("INSERT INTO slots (zoom, x, y, slot, ready, owner) VALUES (1, 0, 0, 0, 0, ?)",
+                           (crashed.pid,))
+        connection.execute("INSERT INTO slots (zoom, x, y, slot, ready, owner) VALUES (1, 1, 0, 1, 0, ?)",
+                           (os.getpid(),))
+
+        reopened = RawTileCache(resolver, basedir=self.tempdir.name)
+        rows = reopened._connect().execute("SELECT zoom, x, y FROM slots ORDER BY x").fetchall()
+        assert rows == [(1, 1, 0)]
+        np.testing.assert_array_equal(reopened(OSMTile(0, 0, 1)), tileImageToArray(resolver(OSMTile(0, 0, 1))))
+
+    def test_warm_read_matches_png(self):
+        tiles = [OSMTile(x, y, 4) for x in range(8) for y in range(8)]
+        png_cache = FileTileCache(GradientResolver(), TileFilenameResolver("bench_" + uuid.uuid4().hex))
+        raw_resolver = GradientResolver()
+        raw_cache = RawTileCache(raw_resolver, basedir=self.tempdir.name)
+        for t in tiles:
+            png_cache(t)
+            raw_cache(t)
+
+        # warm reads are views into the mapping, nothing is resolved or decoded again
+        reopened = RawTileCache(raw_resolver, basedir=self.tempdir.name)
+        calls = raw_resolver.calls
+        for t in tiles:
+            view = reopened(t)
+            assert isinstance(view, np.memmap)
+            np.testing.assert_array_equal(view, tileImageToArray(png_cache(t)))
+        assert raw_resolver.calls == calls
+
+        for t in tiles:
+            os.remove(png_cache.filename_resolver(t))
+
+
+# python -m test.raster_data.test_raw_tile_cache prints the time of warm reads from the PNG files and the raw tier
+def benchmark(num_tiles: int = 256, repeat: int = 5):
+    tiles = [OSMTile(x, y, 4) for x in range(16) for y in range(num_tiles // 16)]
+    png_cache = FileTileCache(GradientResolver(), TileFilenameResolver("bench_" + uuid.uuid4().hex))
+    with tempfile.TemporaryDirectory() as basedir:
+        raw_cache = RawTileCache(GradientResolver(), basedir=basedir)
+        for t in tiles:
+            png_cache(t)
+            raw_cache(t)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for t in tiles:
+                tileImageToArray(png_cache(t))
+        png_time = (time.perf_counter() - start) / repeat
+
+        reopened = RawTileCache(GradientResolver(), basedir=basedir)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for t in tiles:
+                np.asarray(reopened(t)).sum(dtype=np.uint64)
+        raw_time = (time.perf_counter() - start) / repeat
+        del reopened, raw_cache
+
+    for t in tiles:
+        os.remove(png_cache.filename_resolver(t))
+    print("png  %.2f ms per %d tiles" % (png_time * 1000, len(tiles)))
+    print("raw  %.2f ms per %d tiles" % (raw_time * 1000, len(tiles)))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,79 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import numpy as np
+
+from source.raster_data.remote_raster_data_provider import RemoteRasterDataProvider
+from source.raster_data.tile_resolver import TileURLResolver
+
+
+# http.server.ThreadingHTTPServer needs Python 3.7
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class EchoResolverHandler(BaseHTTPRequestHandler):
+    # answers every quantized position with its own low bytes as color
+    protocol_version = 'HTTP/1.1'
+    clients = set()
+    requests = 0
+
+    def do_POST(self):
+        EchoResolverHandler.clients.add(self.client_address)
+        EchoResolverHandler.requests += 1
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        xyzoom = np.frombuffer(body, dtype=np.uint32).reshape(-1, 3)
+        colors = np.stack([xyzoom[:, 0] % 256, xyzoom[:, 1] % 256, xyzoom[:, 2] % 256,
+                           np.full(xyzoom.shape[0], 255)], axis=1).astype(np.uint8)
+        data = colors.tobytes()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRemoteRasterDataProvider(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadedHTTPServer(('127.0.0.1', 0), EchoResolverHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.address = '127.0.0.1:' + str(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def positions(self, num: int) -> np.ndarray:
+        rnd = np.random.RandomState(3)
+        return np.stack([rnd.uniform(-80, 80, num), rnd.uniform(-180, 180, num), rnd.uniform(0, 18, num)], axis=0)
+
+    def test_chunked_equals_single(self):
+        positions = self.positions(10000)
+        single = RemoteRasterDataProvider(TileURLResolver(), chunk_size=10 ** 6, server=self.address)
+        chunked = RemoteRasterDataProvider(TileURLResolver(), chunk_size=777, max_parallel=4, server=self.address)
+        expected = single.getData(positions)
+        assert expected.shape == (4, 10000)
+        np.testing.assert_array_equal(chunked.getData(positions), expected)
+
+    def test_connections_are_reused(self):
+        EchoResolverHandler.clients.clear()
+        EchoResolverHandler.requests = 0
+        provider = RemoteRasterDataProvider(TileURLResolver(), chunk_size=100, max_parallel=4, server=self.address)
+        for i in range(5):
+            provider.getData(self.positions(1000))
+        assert EchoResolverHandler.requests == 50
+        assert len(EchoResolverHandler.clients) <= 4
+
+    def test_unreachable(self):
+        provider = RemoteRasterDataProvider(TileURLResolver(), timeout=1, server='127.0.0.1:1')
+        with self.assertRaises(ConnectionError):
+            provider.getData(self.positions(10))
@@ -0,0 +1,88 @@
+import threading
+import unittest
+
+import numpy as np
+
+from source.raster_data.remote_raster_data_provider import RemoteRasterDataProvider
+from source.raster_data.resolver_protocol import ProtocolError, uniquePositions, encodeRequestV2, decodeRequestV2, \
+    encodeResponseV2, decodeResponseV2, encodeRequestV1
+from source.raster_data.resolver_server import makeResolverServer, QuantizedTileSampler
+from source.raster_data.tile_math import latlngZoomToXYZoomNP
+from source.raster_data.tile_resolver import TileURLResolver
+from test.raster_data.synthetic_resolver import GradientResolver
+
+
+def grid_positions(width: int = 300, height: int = 200) -> np.ndarray:
+    # a dense view, neighbouring pixels share quantized coordinates
+    lat, lng = np.meshgrid(np.linspace(47.6, 47.7, height), np.linspace(9.1, 9.2, width))
+    zoom = np.full(lat.size, 13.7)
+    zoom[::7] = 9.2
+    return np.stack([lat.flatten(), lng.flatten(), zoom], axis=0)
+
+
+def quantize(positions: np.ndarray) -> np.ndarray:
+    return (latlngZoomToXYZoomNP(positions) * 256).astype(np.uint32).transpose()
+
+
+class TestResolverProtocol(unittest.TestCase):
+
+    def test_roundtrip(self):
+        xyzoom = quantize(grid_positions())
+        unique, inverse = uniquePositions(xyzoom)
+        assert unique.shape[0] < xyzoom.shape[0]
+        np.testing.assert_array_equal(unique[inverse], xyzoom)
+
+        encoded = encodeRequestV2(unique)
+        np.testing.assert_array_equal(decodeRequestV2(encoded), unique)
+        assert len(encoded) < len(encodeRequestV1(xyzoom)) / 10
+
+        colors = np.random.RandomState(0).randint(0, 255, (unique.shape[0], 4)).astype(np.uint8)
+        np.testing.assert_array_equal(decodeResponseV2(encodeResponseV2(colors), unique.shape[0]), colors)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            decodeRequestV2(b"nonsense")
+        corrupt = encodeResponseV2(np.zeros((10, 4), dtype=np.uint8))[:-3]
+        with self.assertRaises(ProtocolError):
+            decodeResponseV2(corrupt, 10)
+        with self.assertRaises(ProtocolError):
+            decodeRequestV2(b"CLQ2" + bytes(4) + b"not zlib")
+
+
+class TestReferenceResolverServer(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.resolver = GradientResolver(max_existing_zoom=10)
+        cls.server = makeResolverServer(QuantizedTileSampler(lambda template: cls.resolver), port=0)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.address = '127.0.0.1:' + str(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def provider(self, protocol: int, chunk_size: int = 10 ** 6) -> RemoteRasterDataProvider:
+        return RemoteRasterDataProvider(TileURLResolver(), server=self.address, protocol=protocol,
+                                        chunk_size=chunk_size)
+
+    def test_versions_agree(self):
+        positions = grid_positions()
+        v1 = self.provider(1).getData(positions)
+        v2 = self.provider(2).getData(positions)
+        assert v1.shape == (4, positions.shape[1])
+        np.testing.assert_array_equal(v1, v2)
+        np.testing.assert_array_equal(self.provider(2, chunk_size=500).getData(positions), v1)
+
+    def test_sampled_colors(self):
+        positions = np.array([[47.65], [9.15], [9.5]])
+        xyzoom = quantize(positions)[0]
+        color = self.provider(2).getData(positions)[:, 0]
+        assert color[0] == xyzoom[0] % 256 and color[1] == xyzoom[1] % 256 and color[3] == 255
+
+        # the western tile at zoom 13 does not exist, the sampler falls back to zoom 10
+        west = np.array([[47.65], [-9.15], [13.5]])
+        xyzoom = quantize(west)[0]
+        color = self.provider(2).getData(west)[:, 0]
+        assert color[0] == (xyzoom[0] >> 3) % 256 and color[1] == (xyzoom[1] >> 3) % 256
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+from multiprocessing import Pool
+
+import numpy as np
+
+from source.raster_data.tile_archive import TileArchive, ArchiveTileCache
+from source.raster_data.tile_math import OSMTile
+from test.raster_data.synthetic_resolver import GradientResolver
+
+
+def _fill(args):
+    path, offset = args
+    cache = ArchiveTileCache(GradientResolver(), TileArchive(path=path))
+    for x in range(4):
+        cache(OSMTile(x, offset, 2))
+    return offset
+
+
+class TestArchiveTileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "test.mbtiles")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_roundtrip(self):
+        resolver = GradientResolver()
+        cache = ArchiveTileCache(resolver, TileArchive(path=self.path))
+        tile = OSMTile(2, 1, 3)
+        first = cache(tile)
+        second = cache(tile)
+        assert resolver.calls == 1
+        np.testing.assert_array_equal(np.asarray(first), np.asarray(second))
+
+        reopened = ArchiveTileCache(resolver, TileArchive(path=self.path))
+        np.testing.assert_array_equal(np.asarray(reopened(tile)), np.asarray(first))
+        assert resolver.calls == 1
+
+    def test_missing(self):
+        resolver = GradientResolver(max_existing_zoom=0)
+        cache = ArchiveTileCache(resolver, TileArchive(path=self.path))
+        for i in range(2):
+            with self.assertRaises(FileNotFoundError):
+                cache(OSMTile(0, 0, 1))
+        assert resolver.calls == 1
+        assert len(cache.archive) == 0
+
+    def test_multiple_processes(self):
+        TileArchive(path=self.path)
+        with Pool(4) as pool:
+            pool.map(_fill, [(self.path, y) for y in range(4)])
+        assert len(TileArchive(path=self.path)) == 16
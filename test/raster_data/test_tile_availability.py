@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from source.raster_data.osm_raster_data_provider import _sample, _sample_vectorized
+from source.raster_data.tile_availability import TileAvailabilityIndex
+from source.raster_data.tile_cache import MemoryTileCache
+from source.raster_data.tile_math import OSMTile
+from test.raster_data.synthetic_resolver import GradientResolver
+from test.raster_data.test_osm_raster_data_provider import random_positions
+
+
+class TestTileAvailabilityIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "test.availability")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_deepest_existing_ancestor(self):
+        index = TileAvailabilityIndex(path=self.path)
+        tile = OSMTile(37, 21, 6)
+        assert index.deepest_existing_zoom(tile) == 6
+
+        index.mark_missing(OSMTile(37 >> 2, 21 >> 2, 4))
+        assert index.deepest_existing_zoom(tile) == 3
+        assert index.deepest_existing_ancestor(tile) == OSMTile(37 >> 3, 21 >> 3, 3)
+        assert index.is_missing(tile)
+        assert not index.is_missing(OSMTile(0, 0, 6))
+
+        index.mark_missing(OSMTile(0, 0, 0))
+        assert index.deepest_existing_ancestor(tile) is None
+
+    def test_shared_between_instances(self):
+        first = TileAvailabilityIndex(path=self.path)
+        second = TileAvailabilityIndex(path=self.path)
+        first.mark_missing(OSMTile(1, 1, 1))
+        first.mark_missing(OSMTile(1, 1, 1))
+        assert second.is_missing(OSMTile(3, 2, 2))
+        assert len(second) == 1
+
+    def test_existing_zoom_matches_scalar(self):
+        index = TileAvailabilityIndex(path=self.path)
+        for tile in [OSMTile(0, 0, 1), OSMTile(5, 3, 3), OSMTile(40, 17, 6)]:
+            index.mark_missing(tile)
+        rnd = np.random.RandomState(1)
+        zoom = rnd.randint(0, 9, 2000)
+        x = (rnd.uniform(0, 1, 2000) * np.power(2, zoom)).astype(int)
+        y = (rnd.uniform(0, 1, 2000) * np.power(2, zoom)).astype(int)
+        expected = [index.deepest_existing_zoom(OSMTile(int(a), int(b), int(c))) for a, b, c in zip(x, y, zoom)]
+        np.testing.assert_array_equal(index.existing_zoom(zoom, x, y), expected)
+
+    def test_sample_with_index(self):
+        positions = random_positions(3000)
+        index = TileAvailabilityIndex(path=self.path)
+        resolver = GradientResolver()
+        reference = _sample(positions, (GradientResolver(), 0, 19))
+
+        np.testing.assert_array_equal(_sample_vectorized(positions, (resolver, 0, 19, index)), reference)
+        assert len(index) > 0
+        calls = resolver.calls
+
+        np.testing.assert_array_equal(_sample_vectorized(positions, (resolver, 0, 19, index)), reference)
+        assert resolver.calls - calls < calls
+
+    def test_memory_cache_consults_index(self):
+        index = TileAvailabilityIndex(path=self.path)
+        resolver = GradientResolver()
+        cache = MemoryTileCache(resolver, availability=index)
+        index.mark_missing(OSMTile(0, 0, 7))
+        with self.assertRaises(FileNotFoundError):
+            cache(OSMTile(3, 5, 12))
+        assert resolver.calls == 0
+
+        with self.assertRaises(FileNotFoundError):
+            cache(OSMTile(1, 0, 8))
+        assert index.is_missing(OSMTile(2, 1, 9))
@@ -1,8 +1,12 @@
 import unittest
 
-from source.raster_data.tile_cache import FileTileCache
+import numpy as np
+
+from source.array_cache import ArrayLRUCache
+from source.raster_data.tile_cache import FileTileCache, ArrayMemoryTileCache
 from source.raster_data.tile_math import OSMTile
-from source.raster_data.tile_resolver import HTTPTileFileResolver
+from source.raster_data.tile_resolver import HTTPTileFileResolver, UniformColorResolver
+from test.raster_data.synthetic_resolver import GradientResolver
 
 
 class TestFileTileCache(unittest.TestCase):
@@ -13,3 +17,64 @@ class TestFileTileCache(unittest.TestCase):
         t2 = fcache(OSMTile(5, 10, 6))
         assert t2.height == 256
         pass
+
+
+class TestArrayMemoryTileCache(unittest.TestCase):
+    tile_bytes = 256 * 256 * 4
+
+    def test_palette_expanded(self):
+        resolver = UniformColorResolver((0, 51, 102))
+        assert resolver.im.mode == 'P'
+        cache = ArrayMemoryTileCache(resolver)
+        data = cache(OSMTile(0, 0, 0))
+        assert data.shape == (256, 256, 4) and data.dtype == np.uint8
+        assert data.flags['C_CONTIGUOUS']
+        np.testing.assert_array_equal(data[17, 3], [0, 51, 102, 255])
+
+    def test_lru_eviction(self):
+        resolver = GradientResolver()
+        cache = ArrayMemoryTileCache(resolver, max_bytes=2 * self.tile_bytes)
+        a, b, c = OSMTile(0, 0, 1), OSMTile(1, 0, 1), OSMTile(1, 1, 1)
+        cache(a)
+        cache(b)
+        cache(a)  # refreshes a, so b is evicted next
+        cache(c)
+        assert resolver.calls == 3
+        cache(a)
+        assert resolver.calls == 3
+        cache(b)
+        assert resolver.calls == 4
+
+        stats = cache.stats()
+        assert stats["hits"] == 2
+        assert stats["misses"] == 4
+        assert stats["evictions"] == 2
+        assert stats["resident_bytes"] == 2 * self.tile_bytes
+        assert stats["tiles"] == 2
+
+    def test_missing(self):
+        resolver = GradientResolver(max_existing_zoom=0)
+        cache = ArrayMemoryTileCache(resolver)
+        for i in range(2):
+            with self.assertRaises(FileNotFoundError):
+                cache(OSMTile(0, 0, 1))
+        assert resolver.calls == 1
+
+    def test_shared_budget(self):
+        shared = ArrayLRUCache(3 * self.tile_bytes)
+        first_resolver, second_resolver = GradientResolver(), GradientResolver()
+        first = ArrayMemoryTileCache(first_resolver, shared=shared)
+        second = ArrayMemoryTileCache(second_resolver, shared=shared)
+        a, b = OSMTile(0, 0, 1), OSMTile(1, 0, 1)
+        first(a)
+        first(b)
+        second(a)
+        assert second_resolver.calls == 1
+        np.testing.assert_array_equal(second(a), first(a))
+        assert first_resolver.calls == 2 and second_resolver.calls == 1
+
+        # the oldest tile of either cache is evicted, the budget holds for both together
+        second(b)
+        assert shared.resident_bytes == 3 * self.tile_bytes
+        first(b)
+        assert first_resolver.calls == 3
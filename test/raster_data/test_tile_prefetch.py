@@ -0,0 +1,92 @@
+import time
+import unittest
+from threading import Lock
+
+import numpy as np
+
+from source.raster_data.osm_raster_data_provider import OSMRasterDataProvider, _sample
+from source.raster_data.resolver_server import QuantizedTileSampler
+from source.raster_data.tile_cache import ArrayMemoryTileCache, MemoryTileCache
+from source.raster_data.tile_math import OSMTile
+from source.raster_data.tile_prefetch import planTiles, TilePrefetcher
+from test.raster_data.synthetic_resolver import GradientResolver
+
+
+class SlowResolver(GradientResolver):
+    # records the largest number of tiles resolved at the same time
+    def __init__(self, delay: float = 0.05, max_existing_zoom: int = 6):
+        super(SlowResolver, self).__init__(max_existing_zoom)
+        self.delay = delay
+        self.lock = Lock()
+        self.in_flight = 0
+        self.peak = 0
+
+    def __call__(self, tile: OSMTile):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            with self.lock:
+                return super(SlowResolver, self).__call__(tile)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class TestTilePrefetch(unittest.TestCase):
+
+    def grid_positions(self, zoom: float) -> np.ndarray:
+        lat, lng = np.meshgrid(np.linspace(-60, 60, 40), np.linspace(-170, 170, 40))
+        return np.stack([lat.flatten(), lng.flatten(), np.full(lat.size, zoom)], axis=0)
+
+    def test_plan(self):
+        positions = self.grid_positions(2)
+        tiles = planTiles(positions[0, :], positions[1, :], positions[2, :].astype(int))
+        assert tiles.shape[0] == 3
+        assert tiles.shape[1] == len(set(map(tuple, tiles.transpose().tolist())))
+        assert np.all(tiles[0, :] == 2)
+
+    def test_parallel_fetch(self):
+        tiles = np.array([[3] * 32, list(range(8)) * 4, [0] * 8 + [1] * 8 + [2] * 8 + [3] * 8])
+        for cache_type in [MemoryTileCache, ArrayMemoryTileCache]:
+            resolver = SlowResolver()
+            prefetcher = TilePrefetcher(cache_type(resolver, lock=True), max_workers=32)
+            assert prefetcher(tiles) == 32
+            assert resolver.calls == 32
+            assert resolver.peak > 1, cache_type.__name__
+
+    def test_prefetch_before_sampling(self):
+        positions = self.grid_positions(8.5)
+        resolver = SlowResolver(delay=0.001)
+        cache = ArrayMemoryTileCache(resolver, lock=True)
+        TilePrefetcher(cache)(planTiles(positions[0, :], positions[1, :], positions[2, :].astype(int)))
+        calls = resolver.calls
+
+        # missing tiles and their parents were all resolved during prefetch
+        res = OSMRasterDataProvider(cache).getData(positions)
+        assert resolver.calls == calls
+        np.testing.assert_array_equal(res, _sample(positions, (GradientResolver(), 0, 19)))
+
+        res = OSMRasterDataProvider(ArrayMemoryTileCache(resolver, lock=True), prefetch_workers=8).getData(positions)
+        assert resolver.calls == 2 * calls
+        np.testing.assert_array_equal(res, _sample(positions, (GradientResolver(), 0, 19)))
+
+    def test_unlocked_cache(self):
+        with self.assertRaises(ValueError):
+            TilePrefetcher(ArrayMemoryTileCache(GradientResolver()))
+        with self.assertRaises(ValueError):
+            TilePrefetcher(GradientResolver())
+        assert OSMRasterDataProvider(MemoryTileCache(GradientResolver())).prefetch_workers == 0
+        assert OSMRasterDataProvider(MemoryTileCache(GradientResolver(), lock=True)).prefetch_workers > 0
+
+    def test_sampler_prefetch(self):
+        resolver = SlowResolver(delay=0.001)
+        sampler = QuantizedTileSampler(lambda template: ArrayMemoryTileCache(resolver, lock=True), prefetch_workers=8)
+        xyzoom = np.array([[x * 256 + 17, 3 * 256 + 5, 5 * 256] for x in range(0, 32, 2)], dtype=np.int64)
+        sampler("template", xyzoom)
+        assert "template" in sampler.prefetchers
+        assert resolver.calls == xyzoom.shape[0]
+        unlocked = QuantizedTileSampler(lambda template: MemoryTileCache(resolver), prefetch_workers=8)
+        unlocked("template", xyzoom)
+        assert len(unlocked.prefetchers) == 0
@@ -0,0 +1,64 @@
+import math
+import unittest
+
+import numpy as np
+
+from source.approximate_inverse import approximateInvertGrid, _pixelError
+from source.complex_log_projection import ComplexLogProjection
+from source.flat_tiling import FlatTiling
+from source.lat_lng import LatLng
+from source.raster_data.osm_raster_data_provider import OSMRasterDataProvider
+from source.raster_projector import RasterProjector, TargetSectionDescription
+from source.smoothing_functions import DualCosSmoothingFunction
+from test.raster_data.synthetic_resolver import GradientResolver
+
+
+class TestApproximateInverse(unittest.TestCase):
+
+    def setUp(self):
+        self.projection = ComplexLogProjection(LatLng(47.711801, 9.084545), LatLng(47.656846, 9.179489),
+                                               math.pi / 6, smoothing_function_type=DualCosSmoothingFunction)
+        self.tiling = FlatTiling(3 * math.pi)
+
+    def grid(self, z, x, y):
+        xmin, ymin, xmax, ymax = self.tiling(x, y, z)
+        x_series = np.linspace(xmin, xmax, 256)
+        y_series = np.linspace(ymin, ymax, 256)
+        y_series = y_series[np.abs(y_series) <= math.pi]
+        zoom = self.projection.getZoomLevelGrid(x_series, y_series, 256 / (xmax - xmin))
+        return x_series, y_series, zoom
+
+    def test_error_bound(self):
+        for tile in [(2, 0, 1), (3, 4, 3), (6, 10, 30), (6, 32, 31), (9, 100, 255), (12, 2048, 2047)]:
+            x_series, y_series, zoom = self.grid(*tile)
+            exact = self.projection.invert_grid(x_series, y_series)
+            approximated, evaluations = approximateInvertGrid(self.projection, x_series, y_series, zoom, 0.25)
+            assert approximated.shape == exact.shape
+            assert evaluations < exact.shape[1]
+            assert _pixelError(exact, approximated, zoom).max() <= 0.25, tile
+
+    def test_evaluations(self):
+        x_series, y_series, zoom = self.grid(9, 100, 255)
+        _, evaluations = approximateInvertGrid(self.projection, x_series, y_series, zoom, 0.25)
+        assert evaluations < x_series.shape[0] * y_series.shape[0] / 8
+
+    def test_crossing_zero(self):
+        # the tile contains x=0, where the projection jumps between the two centers
+        x_series = np.linspace(-0.1, 0.1, 256)
+        y_series = np.linspace(0.2, 0.4, 256)
+        zoom = self.projection.getZoomLevelGrid(x_series, y_series, 256 / 0.2)
+        exact = self.projection.invert_grid(x_series, y_series)
+        approximated, _ = approximateInvertGrid(self.projection, x_series, y_series, zoom, 0.25)
+        assert _pixelError(exact, approximated, zoom).max() <= 0.25
+
+    def test_raster_projector(self):
+        data = OSMRasterDataProvider(GradientResolver())
+        trange = TargetSectionDescription(-1, 1, 128, -1, 1, 128)
+        exact, _ = RasterProjector(self.projection, data).project_positions(trange, True)
+        approximated, _ = RasterProjector(self.projection, data, max_error=0.25).project_positions(trange, True)
+        np.testing.assert_array_equal(approximated[2], exact[2])
+        assert _pixelError(exact[0:2], approximated[0:2], exact[2]).max() <= 0.25
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+import numpy as np
+
+from source.array_cache import ArrayLRUCache
+
+
+class TestArrayLRUCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = ArrayLRUCache(max_bytes=3 * 800)
+        for i in range(3):
+            cache.put(i, (np.zeros(100), np.ones(0)))
+        assert cache.get(0) is not None
+        cache.put(3, (np.zeros(100),))
+        # 1 was the least recently used entry
+        assert cache.get(1) is None
+        assert cache.get(0) is not None and cache.get(3) is not None
+        assert cache.stats()["evictions"] == 1 and cache.resident_bytes == 3 * 800
+
+    def test_read_only(self):
+        cache = ArrayLRUCache()
+        value = cache.put("key", (np.zeros(10),))
+        with self.assertRaises(ValueError):
+            value[0][0] = 1
+        assert cache.get("key")[0] is value[0]
+
+    def test_too_large(self):
+        cache = ArrayLRUCache(max_bytes=10)
+        value = cache.put("key", (np.zeros(10),))
+        assert len(cache) == 0 and cache.get("key") is None
+        assert value[0].flags.writeable
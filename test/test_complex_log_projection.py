@@ -1,8 +1,10 @@
 import unittest
 import math
 import numpy as np
+from source.array_cache import ArrayLRUCache
 from source.complex_log_projection import ComplexLogProjection
 from source.lat_lng import LatLng
+from source.smoothing_functions import CosCutoffSmoothingFunction, DualCosSmoothingFunction
 
 
 class TestComplexLogProjection(unittest.TestCase):
@@ -56,6 +58,41 @@ class TestComplexLogProjection(unittest.TestCase):
         np.testing.assert_almost_equal(projected, reference)
         pass
 
+    def test_invert_grid(self):
+        for smoothing in [CosCutoffSmoothingFunction, DualCosSmoothingFunction]:
+            projection = ComplexLogProjection(LatLng(47.7, 9.1), LatLng(48.7, 9.2), math.pi / 6,
+                                              smoothing_function_type=smoothing)
+            # crossing x=0, only on the left and only on the right side
+            for xmin, xmax in [(-2, 3), (-5, -1), (0, 4)]:
+                x_series = np.linspace(xmin, xmax, 40)
+                y_series = np.linspace(-math.pi, math.pi, 30)
+                x, y = np.meshgrid(x_series, y_series)
+                grid = np.stack([x.flatten(), y.flatten()], axis=0)
+
+                np.testing.assert_allclose(projection.invert_grid(x_series, y_series), projection.invert(grid.copy()),
+                                           rtol=1e-12, atol=1e-9)
+                np.testing.assert_allclose(projection.getZoomLevelGrid(x_series, y_series, 100),
+                                           projection.getZoomLevel(grid, 100))
+
+    def test_unit_grid_cache(self):
+        cache = ArrayLRUCache()
+        x_series = np.linspace(-2, 3, 40)
+        y_series = np.linspace(-math.pi, math.pi, 30)
+        # dragging the centers only changes the affine step, the unit grid is computed once
+        for lat in [47.7, 47.9, 48.3]:
+            cached = ComplexLogProjection(LatLng(lat, 9.1), LatLng(48.7, 9.2), math.pi / 6,
+                                          smoothing_function_type=DualCosSmoothingFunction, unit_grid_cache=cache)
+            uncached = ComplexLogProjection(LatLng(lat, 9.1), LatLng(48.7, 9.2), math.pi / 6,
+                                            smoothing_function_type=DualCosSmoothingFunction)
+            np.testing.assert_allclose(cached.invert_grid(x_series, y_series), uncached.invert_grid(x_series, y_series),
+                                       rtol=1e-12, atol=1e-9)
+        assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 2
+
+        other_cutoff = ComplexLogProjection(LatLng(47.7, 9.1), LatLng(48.7, 9.2), math.pi / 4,
+                                            smoothing_function_type=DualCosSmoothingFunction, unit_grid_cache=cache)
+        other_cutoff.invert_grid(x_series, y_series)
+        assert len(cache) == 2
+
     def testZoomLevel(self):
         projection_small = ComplexLogProjection(LatLng(0, 0), LatLng(10, 10), math.pi / 4)
 
@@ -0,0 +1,78 @@
+import math
+import os
+import time
+import unittest
+
+import numpy as np
+
+from source.complex_log_projection import ComplexLogProjection
+from source.compute_backends import availableBackends, getBackend
+from source.lat_lng import LatLng
+from source.preprojections import LambertAzimuthalEqualDistance, IdentityPreprojection, LambertAzimuthalEqualArea
+from source.smoothing_functions import DualCosSmoothingFunction
+
+
+class TestComputeBackends(unittest.TestCase):
+
+    def projections(self, backend):
+        for preprojection in [LambertAzimuthalEqualArea, LambertAzimuthalEqualDistance, IdentityPreprojection]:
+            yield ComplexLogProjection(LatLng(47.7, 9.1), LatLng(48.7, 9.2), math.pi / 6,
+                                       preprojection=preprojection(),
+                                       smoothing_function_type=DualCosSmoothingFunction, backend=backend)
+
+    def test_parity(self):
+        y_series = np.linspace(-math.pi, math.pi, 30)
+        for name in availableBackends():
+            backend = getBackend(name)
+            for projection in self.projections(backend):
+                reference = ComplexLogProjection(LatLng(47.7, 9.1), LatLng(48.7, 9.2), math.pi / 6,
+                                                 preprojection=type(projection.preprojection)(),
+                                                 smoothing_function_type=DualCosSmoothingFunction)
+                # crossing x=0, only on the left and only on the right side
+                for xmin, xmax in [(-2, 3), (-5, -1), (0, 4)]:
+                    x_series = np.linspace(xmin, xmax, 40)
+                    out = np.empty((2, 30 * 40))
+                    result = projection.invert_grid(x_series, y_series, out=out)
+                    assert result is out
+                    np.testing.assert_allclose(result, reference.invert_grid(x_series, y_series), rtol=1e-12,
+                                               atol=1e-9, err_msg=name)
+
+    def test_configuration(self):
+        assert getBackend("numpy") is getBackend("numpy")
+        with self.assertRaises(ValueError):
+            getBackend("nonsense")
+        for name in ["numexpr", "numba"]:
+            if name not in availableBackends():
+                with self.assertRaises(ValueError):
+                    getBackend(name)
+
+    def test_environment(self):
+        previous = os.environ.get("PROJECTION_BACKEND", None)
+        try:
+            for name in ["numexpr", "numba"]:
+                os.environ["PROJECTION_BACKEND"] = name
+                expected = name if name in availableBackends() else "numpy"
+                assert getBackend().name == expected
+        finally:
+            if previous is None:
+                del os.environ["PROJECTION_BACKEND"]
+            else:
+                os.environ["PROJECTION_BACKEND"] = previous
+
+
+# python -m test.test_compute_backends prints the time per 512x512 grid of every installed backend
+def benchmark():
+    x_series = np.linspace(-2, -1.9, 512)
+    y_series = np.linspace(0.5, 0.6, 512)
+    for name in availableBackends():
+        projection = next(TestComputeBackends().projections(getBackend(name)))
+        # numba compiles on the first call
+        projection.invert_grid(x_series, y_series)
+        start = time.perf_counter()
+        for _ in range(5):
+            projection.invert_grid(x_series, y_series)
+        print(name, "%.2f ms per 512x512 grid" % ((time.perf_counter() - start) / 5 * 1000))
+
+
+if __name__ == '__main__':
+    benchmark()
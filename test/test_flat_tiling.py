@@ -0,0 +1,40 @@
+import math
+import unittest
+
+import numpy as np
+
+from source.flat_tiling import FlatTiling
+from source.lat_lng import LatLng
+from source.raster_data.tile_math import XYToLatLng, XYToLatLngNP, latlngToXY, latlngToXYNP
+
+
+class TestFlatTiling(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.latlng = np.stack([rng.uniform(-85, 85, 1000), rng.uniform(-180, 180, 1000)], axis=0)
+        self.tiling = FlatTiling(3 * math.pi)
+
+    def test_tile_math(self):
+        xy = latlngToXYNP(self.latlng[0], self.latlng[1], 3)
+        latlng = XYToLatLngNP(xy[0], xy[1], 3)
+        for i in range(0, 1000, 97):
+            np.testing.assert_allclose(xy[:, i], latlngToXY(LatLng(*self.latlng[:, i]), 3, ref=[0, 0]))
+            expected = XYToLatLng(xy[0, i], xy[1, i], 3)
+            np.testing.assert_allclose(latlng[:, i], [expected.lat, expected.lng])
+        np.testing.assert_allclose(latlng, self.latlng)
+
+    def test_leaflet_conversion(self):
+        xy = self.tiling.from_leaflet_NP(self.latlng)
+        latlng = self.tiling.to_leaflet_NP(xy)
+        for i in range(0, 1000, 97):
+            np.testing.assert_allclose(xy[:, i], self.tiling.from_leaflet_LatLng(LatLng(*self.latlng[:, i])))
+            expected = self.tiling.to_leaflet_LatLng(xy[0, i], xy[1, i])
+            np.testing.assert_allclose(latlng[:, i], [expected.lat, expected.lng])
+        np.testing.assert_allclose(latlng, self.latlng)
+        with self.assertRaises(AssertionError):
+            self.tiling.to_leaflet_NP(np.array([[4 * math.pi], [0]]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from source.image_encoding import encodeImage, negotiateFormat, outputFormat
+
+
+def decode(data: bytes) -> np.ndarray:
+    return np.asarray(Image.open(BytesIO(data)))
+
+
+class TestImageEncoding(unittest.TestCase):
+
+    def setUp(self):
+        self.image = np.zeros((64, 48, 4), dtype=np.uint8)
+        self.image[::3, :, 0] = 200
+        self.image[:, ::2, 3] = 255
+        self.image[10:30, 5:20] = (10, 200, 30, 255)
+
+    def test_png_lossless(self):
+        np.testing.assert_array_equal(decode(encodeImage(self.image, "png")), self.image)
+        # views are copied once into a contiguous buffer
+        np.testing.assert_array_equal(decode(encodeImage(self.image[:, :, :3], "png")), self.image[:, :, :3])
+        np.testing.assert_array_equal(decode(encodeImage(self.image[:, ::2], "png")), self.image[:, ::2])
+
+    def test_palette(self):
+        data = encodeImage(self.image, "png", quantize=True)
+        assert Image.open(BytesIO(data)).mode == "P"
+        decoded = np.asarray(Image.open(BytesIO(data)).convert("RGBA"))
+        # only the colors of fully transparent pixels may change
+        visible = self.image[:, :, 3] > 0
+        np.testing.assert_array_equal(decoded[visible], self.image[visible])
+
+    def test_lossy_formats(self):
+        opaque = self.image.copy()
+        opaque[:, :, 3] = 255
+        for fileformat in ["webp", "jpeg"]:
+            decoded = decode(encodeImage(opaque, fileformat))
+            assert decoded.shape[:2] == opaque.shape[:2]
+        assert decode(encodeImage(opaque, "jpeg")).shape[2] == 3
+
+    def test_negotiate(self):
+        assert negotiateFormat("png", "image/webp", True) == "png"
+        assert negotiateFormat("jpg", "", True) == "jpeg"
+        assert negotiateFormat("auto", "image/avif,image/webp,*/*;q=0.8", False) == "webp"
+        assert negotiateFormat("auto", "image/webp;q=0, */*", True) == "jpeg"
+        assert negotiateFormat("auto", "image/webp;q=0, */*", False) == "png"
+        assert negotiateFormat("auto", "", True) == "png"
+
+    def test_output_format(self):
+        assert outputFormat("jpeg", self.image) == "png"
+        assert outputFormat("jpeg", self.image[:, :, :3]) == "jpeg"
+        assert outputFormat("webp", self.image) == "webp"
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import timeit
 import unittest
 import numpy as np
 import source.mathutils as mathutils
@@ -31,6 +32,29 @@ class TestMathutils(unittest.TestCase):
         self.assertEqual(output_data.shape, input_data.shape)
         np.testing.assert_almost_equal(output_data, input_data)
 
+    def test_complexReferenceEquivalence(self):
+        data = np.random.RandomState(0).uniform(-10, 10, (2, 10000))
+        data[:, :3] = [[0, 0, -1], [0, 1, 0]]
+        np.testing.assert_allclose(mathutils.complexLog(data), mathutils.complexLogReference(data),
+                                   rtol=1e-12, atol=1e-12)
+        np.testing.assert_allclose(mathutils.complexExp(data), mathutils.complexExpReference(data),
+                                   rtol=1e-12, atol=1e-12)
+
+    def test_complexOut(self):
+        data = np.random.RandomState(1).uniform(-3, 3, (2, 100))
+        expected_log = mathutils.complexLogReference(data)
+        expected_exp = mathutils.complexExpReference(data)
+
+        out = np.empty_like(data)
+        assert mathutils.complexLog(data, out=out) is out
+        np.testing.assert_allclose(out, expected_log, rtol=1e-12)
+
+        in_place = data.copy()
+        assert mathutils.complexExp(in_place, out=in_place) is in_place
+        np.testing.assert_allclose(in_place, expected_exp, rtol=1e-12)
+        mathutils.complexLog(data, out=data)
+        np.testing.assert_allclose(data, expected_log, rtol=1e-12)
+
     def test_midpoint(self):
         p1_in = np.array([[0], [0]])
         p2_in = np.array([[1], [2]])
@@ -82,3 +106,18 @@ class TestMathutils(unittest.TestCase):
         data = np.array([0, 5.5 * math.pi, -1.5 * math.pi])
         expected = np.array([0, -.5 * math.pi, .5 * math.pi])
         np.testing.assert_almost_equal(mathutils.normalizeAngles(data), expected)
+
+
+# python -m test.test_mathutils prints the time of the real arithmetic and of the complex reference
+def benchmark():
+    data = np.random.RandomState(2).uniform(-3, 3, (2, 256 * 256))
+    out = np.empty_like(data)
+    for fn, reference in [(mathutils.complexLog, mathutils.complexLogReference),
+                          (mathutils.complexExp, mathutils.complexExpReference)]:
+        real_time = min(timeit.repeat(lambda: fn(data, out=out), number=10, repeat=3))
+        reference_time = min(timeit.repeat(lambda: reference(data), number=10, repeat=3))
+        print(fn.__name__, "real: %.2f ms, complex: %.2f ms per 10 calls" % (real_time * 1000, reference_time * 1000))
+
+
+if __name__ == '__main__':
+    benchmark()
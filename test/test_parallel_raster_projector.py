@@ -0,0 +1,41 @@
+import math
+import sys
+import unittest
+
+import numpy as np
+
+from source.complex_log_projection import ComplexLogProjection
+from source.lat_lng import LatLng
+from source.raster_data.function_raster_data_provider import CosSinRasterDataProvider
+from source.raster_data.osm_raster_data_provider import OSMRasterDataProvider
+from source.raster_projector import RasterProjector, TargetSectionDescription
+from source.smoothing_functions import CosCutoffSmoothingFunction
+from test.raster_data.synthetic_resolver import GradientResolver
+
+# multiprocessing.shared_memory needs Python 3.8
+if sys.version_info >= (3, 8):
+    from source.parallel_raster_projector import ParallelRasterProjector, RenderPool
+
+
+@unittest.skipIf(sys.version_info < (3, 8), "multiprocessing.shared_memory needs Python 3.8")
+class TestParallelRasterProjector(unittest.TestCase):
+    projection = ComplexLogProjection(LatLng(47.711801, 9.084545), LatLng(48.735051, 9.181156), math.pi / 6,
+                                      smoothing_function_type=CosCutoffSmoothingFunction)
+
+    def test_same_as_serial(self):
+        trange = TargetSectionDescription(-math.pi * 2, math.pi * 2, 300, -4, 4, 170)
+        for data_source in [CosSinRasterDataProvider(), OSMRasterDataProvider(GradientResolver())]:
+            expected = RasterProjector(self.projection, data_source).project(trange)
+            parallel = ParallelRasterProjector(self.projection, data_source, processes=2).project(trange)
+            assert parallel.shape == expected.shape
+            np.testing.assert_array_equal(parallel, expected)
+
+    def test_pool_reuse(self):
+        data_source = CosSinRasterDataProvider()
+        trange = TargetSectionDescription(-math.pi * 2, math.pi * 2, 1000, -math.pi, math.pi, 500)
+        with RenderPool(data_source, 2) as pool:
+            for _ in range(2):
+                projector = ParallelRasterProjector(self.projection, data_source, pool=pool)
+                parallel = projector.project(trange)
+            expected = RasterProjector(self.projection, data_source).project(trange)
+        np.testing.assert_array_equal(parallel, expected)
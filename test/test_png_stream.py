@@ -0,0 +1,27 @@
+import unittest
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from source.png_stream import PNGStreamWriter, encodePNGStream
+
+
+class TestPNGStream(unittest.TestCase):
+
+    def test_roundtrip(self):
+        for channels, mode in [(1, "L"), (3, "RGB"), (4, "RGBA")]:
+            data = np.random.RandomState(channels).randint(0, 255, (100, 70, channels)).astype(np.uint8)
+            bands = [data[start:start + 32] for start in range(0, 100, 32)]
+            encoded = b"".join(encodePNGStream(70, 100, bands))
+
+            im = Image.open(BytesIO(encoded))
+            assert im.mode == mode and im.size == (70, 100)
+            np.testing.assert_array_equal(np.asarray(im).reshape(data.shape), data)
+
+    def test_row_count(self):
+        writer = PNGStreamWriter(10, 5, 4)
+        writer.header()
+        writer.write_rows(np.zeros((3, 10, 4), dtype=np.uint8))
+        with self.assertRaises(AssertionError):
+            writer.finish()
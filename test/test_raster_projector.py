@@ -1,10 +1,19 @@
+import tracemalloc
 import unittest
 
+import numpy as np
+
+from source.array_cache import ArrayLRUCache
+from source.flat_tiling import FlatTiling
+from source.raster_data.tile_math import latlngZoomToXYZoomNP
+
 from source.complex_log_projection import ComplexLogProjection
 from source.lat_lng import LatLng
 from source.raster_data.function_raster_data_provider import CosSinRasterDataProvider
 from source.raster_data.osm_raster_data_provider import OSMRasterDataProvider
-from source.raster_projector import RasterProjector, TargetSectionDescription
+from source.raster_data.abstract_raster_data_provider import AbstractRasterDataProvider
+from source.raster_projector import RasterProjector, TargetSectionDescription, ProjectionWorkspace, \
+    TiledSectionDescription
 from source.smoothing_functions import DualCosSmoothingFunction, CosCutoffSmoothingFunction
 from source.zoomable_projection import IdentityProjection
 from source.hard_coded_providers import get_providers
@@ -12,11 +21,21 @@ from source.hard_coded_providers import get_providers
 from logging import basicConfig, INFO
 
 from test.raster_data.dummy_resolver import dummy_resolver
+from test.raster_data.synthetic_resolver import GradientResolver
 
 basicConfig(level=INFO)
 import math
 
 
+class PreallocatedRasterDataProvider(AbstractRasterDataProvider):
+    # returns the same color buffer on every call, so only the allocations of the projector are measured
+    def getSampleFN(self):
+        return lambda positions, buffer: buffer[:, :positions.shape[1]]
+
+    def init_process(self):
+        return np.random.RandomState(0).randint(0, 255, (4, 512 * 512)).astype(np.uint8)
+
+
 class TestRasterProjector(unittest.TestCase):
     def test_grid(self):
         projector = RasterProjector(IdentityProjection(), CosSinRasterDataProvider())
@@ -31,6 +50,178 @@ class TestRasterProjector(unittest.TestCase):
 
         assert d.shape[0] == trange.ysteps and d.shape[1] == trange.xsteps
 
+    def test_shared_grid_cache(self):
+        grid_cache = ArrayLRUCache()
+        trange = TargetSectionDescription(-math.pi, math.pi, 64, -4, 4, 32)
+
+        def projector(lat, source, cache=grid_cache):
+            projection = ComplexLogProjection(LatLng(lat, 0), LatLng(10, 10), math.pi / 4,
+                                              smoothing_function_type=CosCutoffSmoothingFunction)
+            return RasterProjector(projection, source, grid_cache=cache)
+
+        positions, project_map = projector(0, CosSinRasterDataProvider()).project_positions(trange)
+        # same geometry with a different source reuses the inverted grid
+        shared_positions, _ = projector(0, OSMRasterDataProvider(GradientResolver())).project_positions(trange)
+        assert shared_positions is positions and grid_cache.stats()["hits"] == 1
+
+        uncached_positions, uncached_map = projector(0, CosSinRasterDataProvider(), None).project_positions(trange)
+        np.testing.assert_array_equal(positions, uncached_positions)
+        np.testing.assert_array_equal(project_map, uncached_map)
+        assert not project_map.all()
+
+        projector(1, CosSinRasterDataProvider()).project_positions(trange)
+        projector(0, CosSinRasterDataProvider()).project_positions(trange, use_clipping=False)
+        assert len(grid_cache) == 3
+
+    def test_workspace(self):
+        projection = ComplexLogProjection(LatLng(47.711801, 9.084545), LatLng(48.735051, 9.181156), math.pi / 6,
+                                          smoothing_function_type=CosCutoffSmoothingFunction)
+        workspace = ProjectionWorkspace()
+        projector = RasterProjector(projection, PreallocatedRasterDataProvider(), workspace=workspace)
+        reference = RasterProjector(projection, PreallocatedRasterDataProvider())
+        for trange in [TargetSectionDescription(-2, 2, 256, -4, 4, 256), TargetSectionDescription(-2, 2, 256, 5, 6, 64),
+                       TargetSectionDescription(-2, 2, 128, -1, 1, 256)]:
+            expected = reference.project(trange, clip_color=[1, 2, 3, 4])
+            first = projector.project(trange, clip_color=[1, 2, 3, 4])
+            np.testing.assert_array_equal(first, expected)
+            assert projector.project(trange) is first
+
+    def test_steady_state_allocations(self):
+        projection = ComplexLogProjection(LatLng(47.711801, 9.084545), LatLng(48.735051, 9.181156), math.pi / 6,
+                                          smoothing_function_type=CosCutoffSmoothingFunction)
+        projector = RasterProjector(projection, PreallocatedRasterDataProvider(), grid_cache=ArrayLRUCache(),
+                                    workspace=ProjectionWorkspace())
+        trange = TargetSectionDescription(-1, 1, 256, -4, 4, 256)
+        projector.project(trange)
+
+        tracemalloc.start()
+        try:
+            projector.project(trange)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # a (256, 256, 4) tile has 256kB, only row sized temporaries are left
+        assert peak < 16 * 1024
+
+        uncached = RasterProjector(projection, PreallocatedRasterDataProvider(), workspace=ProjectionWorkspace())
+        uncached.project(trange)
+        tracemalloc.start()
+        try:
+            uncached.project(trange)
+            _, peak_uncached = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        tracemalloc.start()
+        try:
+            RasterProjector(projection, PreallocatedRasterDataProvider()).project(trange)
+            _, peak_without_workspace = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert peak_uncached < peak_without_workspace
+
+    def test_project_bands(self):
+        projection = ComplexLogProjection(LatLng(47.711801, 9.084545), LatLng(48.735051, 9.181156), math.pi / 6,
+                                          smoothing_function_type=CosCutoffSmoothingFunction)
+        trange = TargetSectionDescription(-math.pi * 2, math.pi * 2, 600, -4, 4, 300)
+        expected = RasterProjector(projection, CosSinRasterDataProvider()).project(trange)
+
+        projector = RasterProjector(projection, CosSinRasterDataProvider(), grid_cache=ArrayLRUCache(),
+                                    workspace=ProjectionWorkspace())
+        bands = [(first_row, band.copy()) for first_row, band in projector.project_bands(trange, band_height=64)]
+        assert [first_row for first_row, _ in bands] == [0, 64, 128, 192, 256]
+        np.testing.assert_array_equal(np.concatenate([band for _, band in bands], axis=0), expected)
+        assert len(projector.grid_cache) == 0
+
+    def test_metatile(self):
+        projection = ComplexLogProjection(LatLng(47.711801, 9.084545), LatLng(48.735051, 9.181156), math.pi / 6,
+                                          smoothing_function_type=CosCutoffSmoothingFunction)
+        projector = RasterProjector(projection, CosSinRasterDataProvider())
+        tiling = FlatTiling(3 * math.pi)
+        # the block crosses x=0 and the clipping border
+        zoom, block_x, block_y, size = 3, 2, 4, 4
+        x_bounds = [tiling(block_x + i, block_y, zoom)[0::2] for i in range(size)]
+        y_bounds = [tiling(block_x, block_y + j, zoom)[1::2] for j in range(size)]
+        metatile = projector.project(TiledSectionDescription(x_bounds, y_bounds, 32)).copy()
+        assert metatile.shape[:2] == (size * 32, size * 32)
+        for j in range(size):
+            for i in range(size):
+                xmin, ymin, xmax, ymax = tiling(block_x + i, block_y + j, zoom)
+                single = projector.project(TargetSectionDescription(xmin, xmax, 32, ymin, ymax, 32))
+                np.testing.assert_array_equal(metatile[j * 32:(j + 1) * 32, i * 32:(i + 1) * 32], single)
+
+    def test_metatile_gaps(self):
+        projection = ComplexLogProjection(LatLng(47.711801, 9.084545), LatLng(48.735051, 9.181156), math.pi / 6,
+                                          smoothing_function_type=CosCutoffSmoothingFunction)
+        projector = RasterProjector(projection, CosSinRasterDataProvider())
+        tiling = FlatTiling(3 * math.pi)
+        zoom, columns, rows = 4, [3, 9, 10], [7, 9]
+        x_bounds = [tiling(x, rows[0], zoom)[0::2] for x in columns]
+        y_bounds = [tiling(columns[0], y, zoom)[1::2] for y in rows]
+        positions, _ = projector.project_positions(TiledSectionDescription(x_bounds, y_bounds, 32), cache_grid=False)
+        positions = positions.reshape(3, len(rows) * 32, len(columns) * 32).copy()
+        for j, y in enumerate(rows):
+            for i, x in enumerate(columns):
+                xmin, ymin, xmax, ymax = tiling(x, y, zoom)
+                single, _ = projector.project_positions(TargetSectionDescription(xmin, xmax, 32, ymin, ymax, 32),
+                                                        cache_grid=False)
+                np.testing.assert_allclose(positions[:, j * 32:(j + 1) * 32, i * 32:(i + 1) * 32],
+                                           single.reshape(3, 32, 32), rtol=1e-12)
+
+    def test_project_bands_memory(self):
+        projection = ComplexLogProjection(LatLng(47.711801, 9.084545), LatLng(48.735051, 9.181156), math.pi / 6,
+                                          smoothing_function_type=CosCutoffSmoothingFunction)
+        trange = TargetSectionDescription(-math.pi * 2, math.pi * 2, 2000, -math.pi, math.pi, 1000)
+        projector = RasterProjector(projection, CosSinRasterDataProvider())
+
+        # tracemalloc.reset_peak needs Python 3.9, every measurement is traced on its own
+        def peak(render):
+            tracemalloc.start()
+            try:
+                render()
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        peak_bands = peak(lambda: [None for _ in projector.project_bands(trange, band_height=50)])
+        peak_full = peak(lambda: projector.project(trange))
+        assert peak_bands * 5 < peak_full
+
+    def test_float32_pixel_error(self):
+        konstanz = LatLng(47.711801, 9.084545)
+        tiling = FlatTiling(3 * math.pi)
+        tranges = [TargetSectionDescription(-math.pi * 2, math.pi * 2, 512, -math.pi, math.pi, 256)]
+        for zoom, x, y in [(3, 0, 3), (6, 10, 30), (9, 100, 255), (12, 2000, 2047), (12, 2100, 2047)]:
+            xmin, ymin, xmax, ymax = tiling(x, y, zoom)
+            tranges.append(TargetSectionDescription(xmin, xmax, 256, ymin, ymax, 256))
+
+        for other in [LatLng(47.656846, 9.179489), LatLng(51.348419, 12.370946), LatLng(-33.9, 18.4)]:
+            for trange in tranges:
+                positions = {}
+                for dtype in [np.float64, np.float32]:
+                    projection = ComplexLogProjection(konstanz, other, math.pi / 6,
+                                                      smoothing_function_type=CosCutoffSmoothingFunction, dtype=dtype)
+                    projector = RasterProjector(projection, CosSinRasterDataProvider(), dtype=dtype)
+                    positions[dtype] = projector.project_positions(trange)[0].copy()
+                assert positions[np.float32].dtype == np.float64
+                np.testing.assert_allclose(positions[np.float32][2], positions[np.float64][2], atol=1e-4)
+
+                # compare the pixels at the zoom level of the float64 result
+                positions[np.float32][2] = positions[np.float64][2]
+                pixels = {dtype: latlngZoomToXYZoomNP(p)[:2] * 256 for dtype, p in positions.items()}
+                assert np.abs(pixels[np.float32] - pixels[np.float64]).max() < 0.1
+
+    def test_float32_clipping(self):
+        # the last row lies between pi and float32(pi), it is clipped for both precisions
+        trange = TargetSectionDescription(-1, 1, 16, math.pi - 0.5, math.pi + 1e-8, 8)
+        masks = []
+        for dtype in [np.float64, np.float32]:
+            projection = ComplexLogProjection(LatLng(47.711801, 9.084545), LatLng(48.735051, 9.181156), math.pi / 6,
+                                              smoothing_function_type=CosCutoffSmoothingFunction, dtype=dtype)
+            masks.append(RasterProjector(projection, CosSinRasterDataProvider(), dtype=dtype)
+                         .project_positions(trange)[1].copy())
+        np.testing.assert_array_equal(masks[0], masks[1])
+        assert not masks[1].reshape(8, 16)[-1].any() and masks[1].reshape(8, 16)[:-1].all()
+
     def project_image(self):
         projection = ComplexLogProjection(LatLng(0, 0), LatLng(10, 10), math.pi / 4)
         projector = RasterProjector(projection, CosSinRasterDataProvider())
@@ -1,7 +1,7 @@
 import unittest
 import math
 import numpy as np
-from source.smoothing_functions import DualCosSmoothingFunction
+from source.smoothing_functions import DualCosSmoothingFunction, CosCutoffSmoothingFunction, log_scale_tables
 
 
 class TestDualCosSmoothingFunction(unittest.TestCase):
@@ -14,6 +14,24 @@ class TestDualCosSmoothingFunction(unittest.TestCase):
         res = sf.scale(data)
         np.testing.assert_almost_equal(res, expected)
 
+    def test_log_scale_table(self):
+        angles = np.linspace(-3 * math.pi, 3 * math.pi, 10001)
+        for smoothing_type in [CosCutoffSmoothingFunction, DualCosSmoothingFunction]:
+            for cutoff in [0, math.pi / 12, math.pi / 6, math.pi / 4]:
+                exact = smoothing_type(cutoff)
+                table = smoothing_type(cutoff, table_size=4097)
+                assert table.table_error() < 1e-6
+                np.testing.assert_allclose(table.log_scale(angles), exact.log_scale(angles),
+                                           rtol=0, atol=table.table_error() * 1.01)
+                data = np.stack([np.ones_like(angles), angles], axis=0)
+                np.testing.assert_allclose(table.invert(table(data.copy())), data, atol=1e-12)
+
+    def test_shared_table(self):
+        log_scale_tables.clear()
+        DualCosSmoothingFunction(math.pi / 6, table_size=1025).log_scale(np.zeros(10))
+        DualCosSmoothingFunction(math.pi / 6, table_size=1025).log_scale(np.zeros(10))
+        assert len(log_scale_tables) == 1
+
     def test_vis_curve(self):
         import matplotlib.pyplot as plt
         sfdc = DualCosSmoothingFunction(math.pi/6)
@@ -0,0 +1,52 @@
+import math
+import unittest
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from source.complex_log_projection import ComplexLogProjection
+from source.flat_tiling import FlatTiling
+from source.lat_lng import LatLng
+from source.raster_data.function_raster_data_provider import CosSinRasterDataProvider
+from source.raster_projector import RasterProjector, TargetSectionDescription
+from source.static_tiles import isClipped, uniformColor, encodeUniformTile, clippedTile, CLIP_COLOR
+
+
+class TestStaticTiles(unittest.TestCase):
+
+    def test_clipped_tiles_are_blank(self):
+        tiling = FlatTiling(3 * math.pi)
+        projection = ComplexLogProjection(LatLng(47.7, 9.1), LatLng(48.7, 9.2), math.pi / 6)
+        projector = RasterProjector(projection, CosSinRasterDataProvider())
+        clipped = 0
+        for zoom in range(5):
+            for y in range(2 ** zoom):
+                xmin, ymin, xmax, ymax = tiling(0, y, zoom)
+                image = projector.project(TargetSectionDescription(xmin, xmax, 32, ymin, ymax, 32))
+                if isClipped(tiling, 0, y, zoom):
+                    clipped += 1
+                    assert uniformColor(image) == CLIP_COLOR[:image.shape[2]]
+                else:
+                    assert uniformColor(image) != CLIP_COLOR[:image.shape[2]]
+        # close to two thirds of the tiles from zoom 2 on
+        assert clipped == 2 + 4 + 10
+
+    def test_uniform_color(self):
+        image = np.full((4, 5, 3), 7, dtype=np.uint8)
+        assert uniformColor(image) == (7, 7, 7)
+        image[3, 4, 1] = 8
+        assert uniformColor(image) is None
+
+    def test_shared_blobs(self):
+        for fileformat in ["png", "webp"]:
+            blob = clippedTile(fileformat)
+            assert blob is clippedTile(fileformat)
+            image = np.asarray(Image.open(BytesIO(blob)))
+            assert image.shape == (256, 256, 4) and not image.any()
+        image = np.asarray(Image.open(BytesIO(encodeUniformTile((10, 20, 30), "png"))))
+        assert image.shape == (256, 256, 3) and uniformColor(image) == (10, 20, 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+import struct
+import threading
+import time
+import unittest
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+import source.webserver as webserver
+from source.cache_settings import make_tile_cache_key
+from source.raster_data.function_raster_data_provider import CosSinRasterDataProvider
+
+view = (47.7, 9.1, 48.7, 9.2, 30.0, "cos")
+tile_url = "/tile/lat1/47.7/lng1/9.1/lat2/48.7/lng2/9.2/cutoff/30.0/smoothing/cos/{}/{}/{}.png"
+batch_url = "/tiles/lat1/47.7/lng1/9.1/lat2/48.7/lng2/9.2/cutoff/30.0/smoothing/cos.png"
+
+
+# [(zoom, x, y, format code, data)] of a /tiles response
+def parse_batch(body: bytes):
+    count, = struct.unpack_from(">I", body)
+    offset = 4
+    tiles = []
+    for _ in range(count):
+        zoom, x, y, fileformat, length = struct.unpack_from(">BiiBI", body, offset)
+        offset += struct.calcsize(">BiiBI")
+        tiles.append((zoom, x, y, fileformat, body[offset:offset + length]))
+        offset += length
+    assert offset == len(body)
+    return tiles
+
+
+class CountingRasterDataProvider(CosSinRasterDataProvider):
+    calls = 0
+
+    def getData(self, positions_with_zoom: np.ndarray) -> np.ndarray:
+        CountingRasterDataProvider.calls += 1
+        return super(CountingRasterDataProvider, self).getData(positions_with_zoom)
+
+
+class WebserverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.providers = dict(webserver.providers)
+        webserver.providers["default"] = CountingRasterDataProvider()
+        CountingRasterDataProvider.calls = 0
+        webserver.cache.clear()
+        self.client = webserver.app.test_client()
+
+    def tearDown(self):
+        webserver.providers.clear()
+        webserver.providers.update(self.providers)
+        webserver.cache.clear()
+
+
+class TestMetatileLock(WebserverTestCase):
+    zoom, x, y = 3, 3, 3
+
+    def setUp(self):
+        super(TestMetatileLock, self).setUp()
+        assert not webserver.isClipped(webserver.tiling, self.x, self.y, self.zoom)
+        self.key = make_tile_cache_key(*view, "default", self.zoom, self.x, self.y, "png")
+        self.lock = make_tile_cache_key(*view, "default", self.zoom, self.x, self.y, "png.lock1")
+        self.timeout = webserver.metatile_lock_timeout
+
+    def tearDown(self):
+        webserver.metatile_lock_timeout = self.timeout
+        super(TestMetatileLock, self).tearDown()
+
+    def render(self):
+        with webserver.app.test_request_context(tile_url.format(self.zoom, self.x, self.y)):
+            return webserver.render_metatile(*view, self.zoom, self.x, self.y, "png", self.key)
+
+    def later(self, action, delay: float = 0.2):
+        thread = threading.Timer(delay, action)
+        thread.start()
+        return thread
+
+    def test_renders_and_releases(self):
+        tiles = self.render()
+        assert tiles[(self.x, self.y)][0] == "png"
+        assert webserver.cache.get(self.key) is not None
+        assert webserver.cache.get(self.lock) is None
+        assert CountingRasterDataProvider.calls == 1
+
+    def test_waits_for_rendering_request(self):
+        webserver.cache.add(self.lock, True)
+        self.later(lambda: webserver.cache.set(self.key, ("png", b"rendered elsewhere"))).join()
+        assert self.render() == {(self.x, self.y): ("png", b"rendered elsewhere")}
+        assert CountingRasterDataProvider.calls == 0
+        # the lock belongs to the other request
+        assert webserver.cache.get(self.lock) is not None
+
+    def test_takes_over_released_lock(self):
+        webserver.cache.add(self.lock, True)
+        self.later(lambda: webserver.cache.delete(self.lock))
+        tiles = self.render()
+        assert (self.x, self.y) in tiles
+        assert CountingRasterDataProvider.calls == 1
+        assert webserver.cache.get(self.lock) is None
+
+    def test_timeout_keeps_foreign_lock(self):
+        webserver.metatile_lock_timeout = 1
+        webserver.cache.add(self.lock, True, timeout=60)
+        start = time.time()
+        tiles = self.render()
+        assert time.time() - start >= 1
+        assert (self.x, self.y) in tiles
+        assert CountingRasterDataProvider.calls == 1
+        assert webserver.cache.get(self.lock) is not None
+
+    def test_tile_route(self):
+        response = self.client.get(tile_url.format(self.zoom, self.x, self.y))
+        assert response.status_code == 200
+        assert response.mimetype == "image/png"
+        assert self.client.get(tile_url.format(self.zoom, self.x, self.y)).data == response.data
+        assert CountingRasterDataProvider.calls == 1
+
+
+class TestStreamedProjection(WebserverTestCase):
+    url = "/projection/lat1/47.7/lng1/9.1/lat2/48.7/lng2/9.2.png?stream=1&width=64&height=48"
+
+    def test_bands(self):
+        response = self.client.get(self.url + "&band_height=16")
+        data = response.get_data()
+        response.close()
+        assert response.status_code == 200
+        assert response.mimetype == "image/png"
+        assert Image.open(BytesIO(data)).size == (64, 48)
+        assert CountingRasterDataProvider.calls == 3
+
+    def test_invalid_band_height(self):
+        for band_height in ["0", "-3", "abc"]:
+            response = self.client.get(self.url + "&band_height=" + band_height)
+            assert response.status_code == 400, band_height
+        assert CountingRasterDataProvider.calls == 0
+
+
+class TestBatchTiles(WebserverTestCase):
+
+    def post(self, tiles):
+        return self.client.post(batch_url, json={"tiles": tiles})
+
+    def test_layout(self):
+        requested = [[3, 3, 3], [3, 4, 3], [2, 1, 1]]
+        response = self.post(requested)
+        assert response.status_code == 200
+        assert response.mimetype == "application/octet-stream"
+        tiles = parse_batch(response.data)
+        assert [list(t[:3]) for t in tiles] == requested
+        for zoom, x, y, fileformat, data in tiles:
+            assert fileformat == 0
+            assert data == self.client.get(tile_url.format(zoom, x, y)).data
+
+    def test_misses_rendered_together(self):
+        # one block per zoom level, the columns of zoom 4 are not adjacent
+        tiles = parse_batch(self.post([[3, 3, 3], [3, 4, 3], [3, 3, 4], [3, 4, 4], [4, 6, 7], [4, 9, 7]]).data)
+        assert CountingRasterDataProvider.calls == 2
+        for zoom, x, y, _, data in tiles:
+            webserver.cache.clear()
+            assert data == self.client.get(tile_url.format(zoom, x, y)).data
+
+    def test_cache_hits(self):
+        first = self.post([[3, 3, 3], [3, 4, 3]]).data
+        calls = CountingRasterDataProvider.calls
+        assert self.post([[3, 3, 3], [3, 4, 3]]).data == first
+        assert CountingRasterDataProvider.calls == calls
+        # tiles of /tile and /tiles share the cache
+        self.client.get(tile_url.format(3, 5, 3))
+        calls = CountingRasterDataProvider.calls
+        self.post([[3, 5, 3]])
+        assert CountingRasterDataProvider.calls == calls
+
+    def test_clipped(self):
+        assert webserver.isClipped(webserver.tiling, 0, 0, 3)
+        tiles = parse_batch(self.post([[3, 0, 0], [3, 1, 7]]).data)
+        assert CountingRasterDataProvider.calls == 0
+        for zoom, x, y, fileformat, data in tiles:
+            assert fileformat == 0
+            assert data == webserver.clippedTile("png")
+
+    def test_limit(self):
+        tiles = [[8, x, 0] for x in range(webserver.max_batch_tiles + 1)]
+        assert self.post(tiles).status_code == 400
+        assert self.post(tiles[:-1]).status_code == 200
+
+    def test_malformed(self):
+        for body in [b"not json", b"{}", b'{"tiles": [[1, 2]]}', b'{"tiles": [["a", 0, 0]]}', b'{"tiles": 5}',
+                     b'{"tiles": [[40, 2147483648, 0]]}', b'{"tiles": [[3, 8, 0]]}', b'{"tiles": [[3, -1, 0]]}']:
+            assert self.client.post(batch_url, data=body).status_code == 400, body
+        assert self.client.post(batch_url.replace(".png", ".gif"), json={"tiles": []}).status_code == 400
+        assert parse_batch(self.post([]).data) == []
+
+
+if __name__ == '__main__':
+    unittest.main()